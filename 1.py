@@ -3,8 +3,13 @@ import numpy as np
 import re
 import math # Import math for inf
 
+from sumo_calib.evaluation_log import iteration_pairs, load_evaluation_log
+
 # --- 用户需要提供的数据 ---
-# 将你的输出日志内容复制到这个多行字符串中
+# 结构化评估记录目录（标定输出目录中的 evaluation_log，见项目文件 [evaluation_log]）
+# 设置后直接读取最近一次标定的记录，下面的 log_data 不再使用
+EVALUATION_LOG = None  # 例如 "D:/SUMO/evaluation_log"
+# 或者：将你的输出日志内容复制到这个多行字符串中
 # 请确保日志内容中 Windows 路径的反斜杠 '\' 都替换为正斜杠 '/' 或双反斜杠 '\\'
 log_data = """
 D:/acondda/python.exe C:/Users/18039/AppData/Roaming/JetBrains/PyCharmCE2024.3/scratches/scratch.py 
@@ -1009,6 +1014,7 @@ RMSE from final verification run: 1.8332 m/s
 run_iteration_eval_pairs = {}
 current_run_name = None
 current_iteration_evals = {} # {iteration: {'p': error_p, 'm': error_m}}
+log_lines = [] if EVALUATION_LOG else log_data.strip().split('\n')
 
 # Regex to match 'Calculated RMSE' lines
 # Captures Run/Restart name, iter, perturbation type (p/m), and error value
@@ -1016,7 +1022,7 @@ eval_log_pattern = re.compile(r"^\s*Calculated RMSE for (Run \d+|Restart \d+)_it
 run_start_pattern = re.compile(r"^--- Starting SPSA Run: (Run \d+|Restart \d+) ---$")
 
 # Iterate through the log data line by line
-for line in log_data.strip().split('\n'):
+for line in log_lines:
     # Check for the start of a new run
     start_match = run_start_pattern.match(line)
     if start_match:
@@ -1057,6 +1063,11 @@ for line in log_data.strip().split('\n'):
 if current_run_name is not None and current_iteration_evals:
     run_iteration_eval_pairs[current_run_name] = current_iteration_evals
 
+if EVALUATION_LOG:
+    evaluation_columns = load_evaluation_log(EVALUATION_LOG)
+    print(f"Loaded {len(evaluation_columns['rmse'])} evaluations from {EVALUATION_LOG}")
+    run_iteration_eval_pairs = iteration_pairs(evaluation_columns)
+
 
 # Debug print: Check parsed data structure
 print("\nParsed Log Data Structure (Iteration Evaluations):")
@@ -1078,8 +1089,10 @@ print("-" * 30)
 error_unit = "%" # Default
 # Iterate through evaluation points to find a unit
 eval_log_pattern_unit_check = re.compile(r"^\s*Calculated RMSE for .*?:\s*[\d.]+?\s*([%m/s]*)$")
-unit_found = False
-for line in log_data.strip().split('\n'):
+unit_found = bool(EVALUATION_LOG)
+if EVALUATION_LOG:
+    error_unit = "m/s" # The evaluation log stores the RMSE in m/s
+for line in log_lines:
      unit_match = eval_log_pattern_unit_check.match(line)
      if unit_match:
           unit_str = unit_match.group(1).strip()
@@ -2,10 +2,11 @@ import sys
 from sumolib import checkBinary
 import traci
 import numpy as np
-from bisect import bisect_left
 from collections import defaultdict
 import matplotlib.pyplot as plt
 
+from sumo_vsl import StateDiscretizer
+
 
 
 class EnhancedQLearningVSL:
@@ -20,9 +21,11 @@ class EnhancedQLearningVSL:
         self.gamma = 0.9
         self.epsilon = 0.5
 
-        # Q表初始化 (上游状态32 × 密度状态44 × 动作11)
-        self.Q = np.zeros((len(self.upstream_states) * len(self.density_states),
-                           len(self.speed_levels)))
+        # 状态离散化（各状态区间上界预先存为数组）
+        self.discretizer = StateDiscretizer.from_intervals(self.upstream_states, self.density_states)
+
+        # Q表初始化 (上游状态32 × 密度状态35 × 动作11)
+        self.Q = np.zeros((self.discretizer.num_states, len(self.speed_levels)))
 
         # 车辆追踪
         self.vehicle_counter = defaultdict(set)  # 记录各周期通过的车辆
@@ -46,12 +49,7 @@ class EnhancedQLearningVSL:
 
     def _get_state_index(self, upstream_density, current_density):
         """获取组合状态索引"""
-        upstream_idx = bisect_left([s[0] for s in self.upstream_states], upstream_density) - 1
-        upstream_idx = np.clip(upstream_idx, 0, 31)
-        #密度状态索引
-        density_idx = bisect_left([s[0] for s in self.density_states], current_density) - 1
-        density_idx = np.clip(density_idx, 0, 43)
-        return upstream_idx * 44 + density_idx
+        return self.discretizer.index(upstream_density, current_density)
 
     def _get_state(self):
         """获取实时状态"""
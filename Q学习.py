@@ -3,13 +3,13 @@ import os
 # 确保 sumo_tools 路径正确，如果环境变量未设置，可能需要手动指定
 # sumo_tools = "C:/Program Files (x86)/Eclipse/Sumo/tools" # 示例路径, 根据你的安装修改
 # sys.path.append(sumo_tools)
-from sumolib import checkBinary
 import traci
 import numpy as np
-from bisect import bisect_left
 from collections import defaultdict
 import matplotlib.pyplot as plt # 如果需要绘图，取消注释
 
+from sumo_vsl import StateDiscretizer, VSLEnv, vsl_scenario
+
 # --- 常量定义 ---
 UPSTREAM_EDGE_ID = "upstream_edge"
 BOTTLENECK_EDGE_ID = "bottleneck"
@@ -36,11 +36,13 @@ class EnhancedQLearningVSL:
 
         self.num_upstream_states = len(self.upstream_states)
         self.num_density_bins = len(self.density_states) # 根据实际生成的状态数确定
-        self.Q = np.zeros((self.num_upstream_states * self.num_density_bins, len(self.speed_levels)))
+        self.discretizer = StateDiscretizer.from_intervals(self.upstream_states, self.density_states)
+        self.Q = np.zeros((self.discretizer.num_states, len(self.speed_levels)))
 
         self.cycle_duration_steps = cycle_duration
         self.detector_ids = detector_ids
         self.episode_rewards = []
+        self.bottleneck_length_km = 1.0 # 每回合加载场景后在 subscribe() 中读取
 
 
     def _create_upstream_states(self):
@@ -60,32 +62,45 @@ class EnhancedQLearningVSL:
         return states
 
     def _get_state_index(self, upstream_flow, current_density):
-        up_idx = bisect_left([s[1] for s in self.upstream_states], upstream_flow)
-        up_idx = np.clip(up_idx, 0, self.num_upstream_states - 1)
+        return self.discretizer.index(upstream_flow, current_density)
+
+    def subscribe(self, sim, scenario):
+        """
+        订阅状态、奖励和输出用到的变量（每回合加载场景后调用）：之后每次 simulationStep 的回复
+        一次性带回所有路段和探测器的值，读取状态和奖励不再需要逐个调用 get 函数
+        """
+        tc = sim.constants
+        sim.edge.subscribe(UPSTREAM_EDGE_ID, [tc.LAST_STEP_VEHICLE_NUMBER])
+        sim.edge.subscribe(BOTTLENECK_EDGE_ID, [tc.LAST_STEP_VEHICLE_NUMBER])
+        sim.edge.subscribe(WARNING_ZONE_EDGE_ID, [tc.LAST_STEP_VEHICLE_HALTING_NUMBER])
+        for detector_id in self.detector_ids:
+            try:
+                sim.inductionloop.subscribe(detector_id, [tc.LAST_STEP_VEHICLE_NUMBER])
+            except sim.TraCIException as e:
+                print(f"警告: 无法读取探测器 {detector_id}: {e}。假设此探测器计数为 0。")
 
-        dens_idx = bisect_left([s[1] for s in self.density_states], current_density)
-        dens_idx = np.clip(dens_idx, 0, self.num_density_bins - 1)
+        # 瓶颈区长度不随时间变化，每回合只读取一次
+        try:
+            bottleneck_lane_length = sim.lane.getLength(BOTTLENECK_LANE_ID)
+            num_lanes = sim.edge.getLaneNumber(BOTTLENECK_EDGE_ID)
+            self.bottleneck_length_km = (bottleneck_lane_length * num_lanes) / 1000.0
+        except sim.TraCIException:
+             print(f"警告: 无法获取瓶颈区 {BOTTLENECK_EDGE_ID}/{BOTTLENECK_LANE_ID} 的长度/车道数。使用默认长度 1km。")
+             self.bottleneck_length_km = 1.0 # 备用长度
 
-        state_idx = up_idx * self.num_density_bins + dens_idx
-        return state_idx
+    def _edge_value(self, edge_id, variable):
+        return traci.edge.getAllSubscriptionResults().get(edge_id, {}).get(variable, 0)
 
     def _get_current_state_values(self):
         # 注意: getLastStepVehicleNumber 仅给出最后一步的车辆数。
         # 用它估算 5 分钟流量可能不准确。更好的方法是也使用上游探测器。
         # 这里暂时保留基于瞬时计数的简单估算逻辑：
-        upstream_veh_count_last_step = traci.edge.getLastStepVehicleNumber(UPSTREAM_EDGE_ID)
+        upstream_veh_count_last_step = self._edge_value(UPSTREAM_EDGE_ID, traci.constants.LAST_STEP_VEHICLE_NUMBER)
         # 简单估算：假设瞬时计数代表通过率 veh/sec，转换为 veh/h
         upstream_flow_estimate = upstream_veh_count_last_step * 3600
 
-        current_veh_count = traci.edge.getLastStepVehicleNumber(BOTTLENECK_EDGE_ID)
-        try:
-            bottleneck_lane_length = traci.lane.getLength(BOTTLENECK_LANE_ID)
-            num_lanes = traci.edge.getLaneNumber(BOTTLENECK_EDGE_ID)
-            total_bottleneck_length_km = (bottleneck_lane_length * num_lanes) / 1000.0
-        except traci.TraCIException:
-             print(f"警告: 无法获取瓶颈区 {BOTTLENECK_EDGE_ID}/{BOTTLENECK_LANE_ID} 的长度/车道数。使用默认长度 1km。")
-             total_bottleneck_length_km = 1.0 # 备用长度
-
+        current_veh_count = self._edge_value(BOTTLENECK_EDGE_ID, traci.constants.LAST_STEP_VEHICLE_NUMBER)
+        total_bottleneck_length_km = self.bottleneck_length_km
         current_density = current_veh_count / total_bottleneck_length_km if total_bottleneck_length_km > 0 else 0
 
         return upstream_flow_estimate, current_density
@@ -97,13 +112,12 @@ class EnhancedQLearningVSL:
 
     def _calculate_reward_from_detectors(self):
         total_passed_count = 0
+        # 订阅结果中没有的探测器（订阅失败）计数为 0
+        results = traci.inductionloop.getAllSubscriptionResults()
         for detector_id in self.detector_ids:
-            try:
-                # getLastStepVehicleNumber 返回上一个聚合周期 ('freq'定义) 内通过的车辆数
-                passed_count = traci.inductionloop.getLastStepVehicleNumber(detector_id)
-                total_passed_count += passed_count
-            except traci.TraCIException as e:
-                print(f"警告: 无法读取探测器 {detector_id}: {e}。假设此探测器计数为 0。")
+            # LAST_STEP_VEHICLE_NUMBER 返回上一个聚合周期 ('freq'定义) 内通过的车辆数
+            passed_count = results.get(detector_id, {}).get(traci.constants.LAST_STEP_VEHICLE_NUMBER, 0)
+            total_passed_count += passed_count
         return total_passed_count
 
 
@@ -133,78 +147,65 @@ class EnhancedQLearningVSL:
         self.Q[state_idx, action_idx] += self.alpha * td_error
 
 
-    def train(self, episodes=50, sumo_config_file="D:/SUMO/exaple2.sumocfg"):
+    def train(self, episodes=50, sumo_config_file="D:/SUMO/exaple2.sumocfg", master_seed=None):
+        """
+        SUMO 只在第一回合启动一次，之后每回合用 traci.load 重新加载场景（见 sumo_vsl/env.py）。
+        master_seed 为整数时每回合使用由它生成的不同SUMO种子，训练可复现；None 时每回合都用SUMO默认种子
+        """
         total_rewards_per_episode = []
+        scenario = vsl_scenario(sumo_cfg=sumo_config_file, additional_files=[],
+                                warning_zone_edge=WARNING_ZONE_EDGE_ID,
+                                decision_interval=self.cycle_duration_steps,
+                                end_time=SIMULATION_END_TIME)
+        env = VSLEnv(scenario, master_seed=master_seed,
+                     observe_fn=lambda sim, scenario: self._get_current_state_values(),
+                     reward_fn=lambda sim, scenario: self._calculate_reward_from_detectors(),
+                     subscribe_fn=self.subscribe)
 
-        for episode in range(episodes):
-            print(f"\n--- 开始回合 {episode + 1}/{episodes} ---")
-            # sumo 或 sumo-gui
-            sumo_binary = checkBinary('sumo')
-            traci.start([sumo_binary, "-c", sumo_config_file])
-
-            current_sim_time = 0
-            total_episode_reward = 0
-
-            while current_sim_time < SIMULATION_END_TIME:
-                if current_sim_time == 0:
-                     traci.simulationStep()
-                     current_sim_time = traci.simulation.getTime()
-
-                state_idx = self.get_state()
-
-                action_idx = self.choose_action(state_idx)
-                chosen_speed = self.speed_levels[action_idx]
-
-                try:
-                    traci.edge.setMaxSpeed(WARNING_ZONE_EDGE_ID, chosen_speed / 3.6) # km/h 转 m/s
-                except traci.TraCIException as e:
-                    print(f"错误: 无法在 {WARNING_ZONE_EDGE_ID} 设置最高速度: {e}")
-                    break # 如果路段不存在，停止该回合
-
-                start_time_this_cycle = current_sim_time
-                target_end_time_this_cycle = start_time_this_cycle + self.cycle_duration_steps
-
-                steps_ran_in_cycle = 0
-                while current_sim_time < target_end_time_this_cycle:
-                    if traci.simulation.getMinExpectedNumber() <= 0:
+        try:
+            for episode in range(episodes):
+                print(f"\n--- 开始回合 {episode + 1}/{episodes} ---")
+                (upstream_val, density_val), info = env.reset()
+                if info['seed'] is not None:
+                    print(f"SUMO 种子: {info['seed']}")
+                state_idx = self._get_state_index(upstream_val, density_val)
+                total_episode_reward = 0
+
+                while True:
+                    action_idx = self.choose_action(state_idx)
+                    chosen_speed = self.speed_levels[action_idx]
+
+                    try:
+                        # 设置限速并仿真一个决策周期
+                        (upstream_val, density_val), reward, terminated, truncated, info = env.step(chosen_speed)
+                    except traci.TraCIException as e:
+                        print(f"错误: 无法在 {WARNING_ZONE_EDGE_ID} 设置最高速度: {e}")
+                        break # 如果路段不存在，停止该回合
+
+                    total_episode_reward += reward
+                    next_state_idx = self._get_state_index(upstream_val, density_val)
+                    self.update_q(state_idx, action_idx, reward, next_state_idx)
+
+                    print(f"[{info['time']:.1f}s | 回合 {episode+1}] 周期结束: "
+                          f"状态 (上游:{upstream_val:.0f}, 密度:{density_val:.1f} -> S:{state_idx}), "
+                          f"动作: 速度={chosen_speed}km/h (A:{action_idx}), "
+                          f"奖励: {reward} 辆, "
+                          f"下一状态 (S':{next_state_idx}), "
+                          f"排队(警告区): {self._edge_value(WARNING_ZONE_EDGE_ID, traci.constants.LAST_STEP_VEHICLE_HALTING_NUMBER)} 辆")
+                    state_idx = next_state_idx
+
+                    if terminated:
                         print("仿真提前结束。")
+                    if terminated or truncated:
                         break
-                    traci.simulationStep()
-                    current_sim_time = traci.simulation.getTime()
-                    steps_ran_in_cycle += 1
-                    if current_sim_time >= SIMULATION_END_TIME:
-                         break
-
-                # 处理周期结束或仿真提前结束的情况
-                if traci.simulation.getMinExpectedNumber() <= 0 or current_sim_time >= SIMULATION_END_TIME:
-                     if steps_ran_in_cycle > 0: # 确保至少跑了一步才计算奖励和更新
-                         reward = self._calculate_reward_from_detectors()
-                         next_state_idx = self.get_state()
-                         self.update_q(state_idx, action_idx, reward, next_state_idx)
-                         total_episode_reward += reward
-                     break # 结束当前回合的 while 循环
-
-                reward = self._calculate_reward_from_detectors()
-                total_episode_reward += reward
-
-                next_state_idx = self.get_state()
-
-                self.update_q(state_idx, action_idx, reward, next_state_idx)
-
-                upstream_val, density_val = self._get_current_state_values()
-                print(f"[{current_sim_time:.1f}s | 回合 {episode+1}] 周期结束: "
-                      f"状态 (上游:{upstream_val:.0f}, 密度:{density_val:.1f} -> S:{state_idx}), "
-                      f"动作: 速度={chosen_speed}km/h (A:{action_idx}), "
-                      f"奖励: {reward} 辆, "
-                      f"下一状态 (S':{next_state_idx}), "
-                      f"排队(警告区): {traci.edge.getLastStepHaltingNumber(WARNING_ZONE_EDGE_ID)} 辆")
-
-            print(f"--- 回合 {episode + 1} 结束。总奖励: {total_episode_reward} ---")
-            total_rewards_per_episode.append(total_episode_reward)
-            traci.close()
-
-            # 可选: 逐步减小探索率
-            # self.epsilon = max(0.05, self.epsilon * 0.99)
+
+                print(f"--- 回合 {episode + 1} 结束。总奖励: {total_episode_reward} ---")
+                total_rewards_per_episode.append(total_episode_reward)
+
+                # 可选: 逐步减小探索率
+                # self.epsilon = max(0.05, self.epsilon * 0.99)
+        finally:
+            env.close()
 
         print("\n--- 训练结束 ---")
         self.episode_rewards = total_rewards_per_episode
@@ -1,12 +1,11 @@
 import sys
 import os
-from sumolib import checkBinary
-import traci
 import numpy as np
-from bisect import bisect_left
 from collections import defaultdict
 import matplotlib.pyplot as plt
 
+from sumo_vsl import StateDiscretizer, VectorVSLEnv, vsl_scenario
+
 # 常量定义
 UPSTREAM_EDGE_ID = "upstream_edge"
 BOTTLENECK_EDGE_ID = "bottleneck"
@@ -18,7 +17,15 @@ class EnhancedQLearningVSL:
     def __init__(self, upstream_detector_ids=["upstream_detector_0", "upstream_detector_1", "upstream_detector_2"]):
         # 检测器配置 - 支持多个检测器
         self.upstream_detector_ids = upstream_detector_ids  # 上游检测器ID列表
-        self.detector_freq = 300  # 检测器输出频率（5分钟=300秒）
+        # 仿真场景：状态（上游流量、限速区密度）和奖励的读取见 sumo_vsl/observation.py
+        self.scenario = vsl_scenario(
+            upstream_detectors=upstream_detector_ids,
+            upstream_edge=UPSTREAM_EDGE_ID,
+            warning_zone_edge=WARNING_ZONE_EDGE_ID,
+            detector_freq=300,  # 检测器输出频率（5分钟=300秒）
+            decision_interval=300,  # 每个决策步骤仿真300秒
+            end_time=SIMULATION_END_TIME,
+        )
         
         # 状态空间定义
         self.upstream_states = self._create_upstream_states()  # 上游交通需求（0-1600 veh/h）
@@ -42,6 +49,9 @@ class EnhancedQLearningVSL:
         self.num_upstream_states = len(self.upstream_states)
         self.num_density_states = len(self.density_states)
         self.num_speed_history_states = len(self.speed_history_states)
+        # 状态离散化：各状态区间上界预先存为数组，批量观测一次 searchsorted 得到状态索引
+        self.discretizer = StateDiscretizer.from_intervals(
+            self.upstream_states, self.density_states, self.speed_history_states)
         
         # Q表初始化 (上游状态 × 密度状态 × 历史限速状态 × 动作)
         self.Q = np.zeros((
@@ -79,208 +89,112 @@ class EnhancedQLearningVSL:
         
     def _get_state_index(self, upstream_flow, density, current_speed):
         """获取组合状态索引"""
-        up_idx = bisect_left([s[1] for s in self.upstream_states], upstream_flow)
-        up_idx = np.clip(up_idx, 0, self.num_upstream_states - 1)
-        
-        den_idx = bisect_left([s[1] for s in self.density_states], density)
-        den_idx = np.clip(den_idx, 0, self.num_density_states - 1)
-        
-        spd_idx = bisect_left([s[1] for s in self.speed_history_states], current_speed)
-        spd_idx = np.clip(spd_idx, 0, self.num_speed_history_states - 1)
-        
-        return (up_idx * self.num_density_states * self.num_speed_history_states + 
-                den_idx * self.num_speed_history_states + 
-                spd_idx)
-    
-    def _get_upstream_flow_from_detector(self):
-        """使用多个检测器获取上游统计周期流量（方案2：使用getLastIntervalVehicleNumber）"""
-        total_interval_vehicles = 0
-        successful_detectors = 0
-        
-        # 遍历所有上游检测器
-        for detector_id in self.upstream_detector_ids:
-            try:
-                # 获取该检测器在最近统计周期内的车辆数（依赖于检测器配置的freq）
-                interval_vehicles = traci.inductionloop.getLastIntervalVehicleNumber(detector_id)
-                total_interval_vehicles += interval_vehicles
-                successful_detectors += 1
-                print(f"检测器 {detector_id}: {interval_vehicles}辆 (统计周期内)")
-                
-            except traci.TraCIException as e:
-                print(f"警告：无法从检测器 {detector_id} 获取统计周期数据: {e}")
-                # 尝试备用的单步数据作为fallback
-                try:
-                    step_vehicles = traci.inductionloop.getLastStepVehicleNumber(detector_id)
-                    # 简单估算：假设单步数据代表当前流量强度
-                    estimated_interval = step_vehicles * (self.detector_freq / 1)  # 粗略估算
-                    total_interval_vehicles += estimated_interval
-                    successful_detectors += 1
-                    print(f"检测器 {detector_id}: {step_vehicles}辆/步 (估算为{estimated_interval:.0f}辆/周期)")
-                except Exception as e2:
-                    print(f"检测器 {detector_id} 完全无法访问: {e2}")
-                    continue
-        
-        if successful_detectors > 0:
-            # 将统计周期数据转换为每小时流量
-            # 假设统计周期就是detector_freq（5分钟=300秒）
-            intervals_per_hour = 3600 / self.detector_freq  # 每小时有多少个统计周期
-            hourly_flow = total_interval_vehicles * intervals_per_hour
-            
-            print(f"统计周期总计: {total_interval_vehicles}辆/{self.detector_freq}秒")
-            print(f"每小时流量: {total_interval_vehicles} × {intervals_per_hour:.1f} = {hourly_flow:.0f}辆/小时")
-            print(f"数据来源: {successful_detectors}个检测器")
-            
-            return hourly_flow
-        else:
-            # 所有检测器都失败，使用边缘数据备用方案
-            return self._get_backup_flow()
-    
-    def _get_backup_flow(self):
-        """备用流量估算方法"""
-        try:
-            print("警告：所有检测器都无法获取数据，使用边缘数据备用方案")
-            upstream_veh = traci.edge.getLastStepVehicleNumber(UPSTREAM_EDGE_ID)
-            # 基于当前边缘车辆数的简单流量估算
-            backup_flow = upstream_veh * 720  # 经验系数
-            print(f"边缘当前车辆: {upstream_veh}辆，估算流量: {backup_flow:.0f}辆/小时")
-            return backup_flow
-        except Exception as e:
-            print(f"备用流量估算失败: {e}")
-            print("使用默认流量值: 800辆/小时")
-            return 800
-    
-    def _get_current_state(self):
-        """获取当前状态值"""
-        # 使用检测器获取上游5分钟流量
-        upstream_flow = self._get_upstream_flow_from_detector()
-        
-        # 获取限速区密度
-        warning_veh = traci.edge.getLastStepVehicleNumber(WARNING_ZONE_EDGE_ID)
-        WARNING_ZONE_LENGTH_KM = 0.8
-        LANE_COUNT = 3
-        density = warning_veh / (WARNING_ZONE_LENGTH_KM * LANE_COUNT) if WARNING_ZONE_LENGTH_KM > 0 else 0
-        print(f"车数:{warning_veh}, 长度:{WARNING_ZONE_LENGTH_KM}km, 车道:{LANE_COUNT}, 密度:{density:.2f}")
-        return upstream_flow, density, self.current_speed_limit
-    
-    def _calculate_reward(self):
-        """计算奖励：下游断面通过的车辆数"""
-        total_throughput = 0#开始的奖励为0
-        # 这里填入你在 XML 中定义的检测器 id
-        downstream_detectors = ["downstream_edge_0", "downstream_edge_1", "downstream_edge_2"]
-        for det_id in downstream_detectors:
-            try:
-                # 使用 getLastIntervalVehicleNumber 获取上一统计周期（300秒）内的车辆数
-                # 这代表了这5分钟内的吞吐量，而不是最后一秒的瞬时值
-                count = traci.inductionloop.getLastIntervalVehicleNumber(det_id)
-                if count>0:
-                    total_throughput+=count 
-            except traci.TraCIException as e:
-                print(f"警告：无法获取检测器 {det_id} 的数据: {e}")
-        return total_throughput
+        return self.discretizer.index(upstream_flow, density, current_speed)
+
+    def state_indices(self, observations, current_speeds):
+        """批量获取状态索引：(N, 2) 观测（上游流量、密度）和 N 个当前限速"""
+        return self.discretizer.indices(np.column_stack([observations, current_speeds]))
     
-    def choose_action(self, state_idx):
-        """选择动作（限速变化值）"""
-        if np.random.rand() < self.epsilon:
-            action_idx = np.random.choice(len(self.speed_changes))
-        else:
-            action_idx = np.argmax(self.Q[state_idx])
-        
+    def choose_actions(self, state_indices, current_speeds):
+        """为一批并行仿真同时选择动作（ε-greedy），返回动作索引和新的限速值"""
+        state_indices = np.asarray(state_indices)
+        num_envs = len(state_indices)
+        greedy = np.argmax(self.Q[state_indices], axis=1)
+        explore = np.random.rand(num_envs) < self.epsilon
+        action_indices = np.where(explore, np.random.randint(len(self.speed_changes), size=num_envs), greedy)
+
         # 计算新的限速值
-        speed_change = self.speed_changes[action_idx]
-        new_speed = np.clip(self.current_speed_limit + speed_change, 
-                           self.min_speed, 
-                           self.max_speed)
-        
-        return action_idx, new_speed
-    
-    def update_q(self, state_idx, action_idx, reward, next_state_idx):
-        """更新Q值"""
-        if state_idx >= self.Q.shape[0] or next_state_idx >= self.Q.shape[0]:
-            print(f"警告：状态索引超出范围。跳过更新。")
-            return
-            
-        current_q = self.Q[state_idx, action_idx]
-        next_max_q = np.max(self.Q[next_state_idx])
-        self.Q[state_idx, action_idx] += self.alpha * (
-            reward + self.gamma * next_max_q - current_q
-        )
-    
-    def train(self, episodes, sumo_cfg="D:/SUMO/exaple2.sumocfg"):
-        """训练过程"""
-        for episode in range(episodes):
-            print(f"\n--- 开始回合 {episode + 1}/{episodes} ---")
-            
-            # 启动仿真时指定检测器配置文件
-            detector_config_file = r"D:\SUMO\edgelanetrafficpara.add.xml"
-            print(f"使用检测器配置文件: {detector_config_file}")
-            
-            # 使用SUMO无GUI版本
-            sumo_binary = checkBinary('sumo')
-            print(f"使用 sumo (无GUI): {sumo_binary}")
-            
-            traci.start([sumo_binary, "-c", sumo_cfg, 
-                        "--additional-files", detector_config_file])
-            
-            total_reward = 0
-            step = 0
-            
-            while traci.simulation.getTime() < SIMULATION_END_TIME:
-                # 获取当前状态
-                upstream_flow, density, current_speed = self._get_current_state()
-                state_idx = self._get_state_index(upstream_flow, density, current_speed)
-                
-                # 选择动作
-                action_idx, new_speed = self.choose_action(state_idx)
-                
-                # 应用新的限速值
-                try:
-                    traci.edge.setMaxSpeed(WARNING_ZONE_EDGE_ID, new_speed/3.6)  # 转换为m/s
-                    self.current_speed_limit = new_speed
-                    self.speed_history.append(new_speed)
-                except traci.TraCIException as e:
-                    print(f"错误：设置限速失败：{e}")
-                    break
-                
-                # 仿真300步
-                for _ in range(300):
-                    if traci.simulation.getMinExpectedNumber() <= 0:
-                        break
-                    traci.simulationStep()
-                
-                # 计算奖励
-                reward = self._calculate_reward()
-                total_reward += reward
-                self.step_rewards.append(reward)  # 记录每步奖励
-                
-                # 获取下一状态
-                next_upstream, next_density, _ = self._get_current_state()
-                next_state_idx = self._get_state_index(
-                    next_upstream, next_density, new_speed
-                )
-                
-                # 更新Q值
-                self.update_q(state_idx, action_idx, reward, next_state_idx)
-                
-                # 输出状态信息
-                print(f"[{traci.simulation.getTime():.1f}s] "
-                      f"限速: {new_speed}km/h, "
-                      f"奖励: {reward}辆, "
-                      f"上游流量: {upstream_flow:.0f}veh/h, "
-                      f"密度: {density:.1f}veh/km")
-                
-                step += 1
-            
-            # 回合结束
-            avg_reward = total_reward / max(1, step)  # 平均每步奖励
-            print(f"回合 {episode + 1} 结束，总奖励: {total_reward}, 平均奖励: {avg_reward:.2f}")
-            self.episode_rewards.append(total_reward)
-            self.reward_per_episode.append(avg_reward)
-            traci.close()
-            
-            # 更新探索率
-            self.epsilon = max(self.min_epsilon, 
-                             self.epsilon * self.epsilon_decay)
-        
+        new_speeds = np.clip(np.asarray(current_speeds) + np.asarray(self.speed_changes)[action_indices],
+                             self.min_speed,
+                             self.max_speed)
+        return action_indices, new_speeds
+
+    def update_q(self, state_indices, action_indices, rewards, next_state_indices):
+        """批量更新Q值：所有并行仿真的转移用同一张Q表（TD目标按更新前的Q表计算）"""
+        state_indices = np.asarray(state_indices)
+        next_state_indices = np.asarray(next_state_indices)
+        valid = (state_indices < self.Q.shape[0]) & (next_state_indices < self.Q.shape[0])
+        if not np.all(valid):
+            print(f"警告：状态索引超出范围。跳过 {np.sum(~valid)} 个更新。")
+        states, actions = state_indices[valid], np.asarray(action_indices)[valid]
+        td_errors = (np.asarray(rewards, dtype=float)[valid]
+                     + self.gamma * np.max(self.Q[next_state_indices[valid]], axis=1)
+                     - self.Q[states, actions])
+        # 同一批中重复的 (状态, 动作) 取TD误差的平均值（累加会使有效学习率变为 K·alpha 而发散）
+        num_actions = self.Q.shape[1]
+        keys, inverse, counts = np.unique(states * num_actions + actions, return_inverse=True, return_counts=True)
+        mean_td_errors = np.bincount(inverse.ravel(), weights=td_errors, minlength=len(keys)) / counts
+        self.Q[keys // num_actions, keys % num_actions] += self.alpha * mean_td_errors
+
+    def train(self, episodes, sumo_cfg="D:/SUMO/exaple2.sumocfg", num_envs=1, base_seed=None):
+        """
+        训练过程：num_envs 个SUMO仿真同时运行各自的回合，共用一张Q表。
+        每个SUMO进程只启动一次，之后每回合用 traci.load 重新加载场景；
+        base_seed 为整数时第 i 回合使用SUMO种子 base_seed + i（None：每回合都用SUMO默认种子）
+        """
+        scenario = dict(self.scenario, sumo_cfg=sumo_cfg)
+        if base_seed is None and num_envs > 1:
+            print(f"WARNING: base_seed 未设置，{num_envs}个并行仿真都使用SUMO默认种子，同一批回合的交通需求完全相同。")
+        # 每个并行仿真保持自己的当前限速（与串行训练一样跨回合延续）
+        speed_limits = np.full(num_envs, float(self.current_speed_limit))
+        with VectorVSLEnv(num_envs, scenario) as envs:
+            episode = 0
+            while episode < episodes:
+                n = min(num_envs, episodes - episode)
+                print(f"\n--- 开始回合 {episode + 1}-{episode + n}/{episodes}（{n}个并行仿真）---")
+                seeds = None if base_seed is None else [base_seed + episode + i for i in range(n)]
+                observations = envs.reset(n, seeds=seeds)
+                speeds = speed_limits[:n]
+                total_rewards = np.zeros(n)
+                episode_speeds = []
+                episode_rewards = []
+                step = 0
+                finished = np.zeros(n, dtype=bool)
+
+                while not np.all(finished):
+                    # 当前状态：上游流量、限速区密度、当前限速
+                    state_indices = self.state_indices(observations, speeds)
+
+                    # 选择动作并应用新的限速值，所有仿真同时运行一个决策周期
+                    action_indices, speeds = self.choose_actions(state_indices, speeds)
+                    next_observations, rewards, done = envs.step(speeds)
+                    # 提前结束（没有车辆）的仿真不再计入奖励和Q表更新
+                    rewards = np.where(finished, 0.0, rewards)
+
+                    # 下一状态（下一步开始时的状态与这一步结束时相同，不再重复读取检测器）
+                    next_state_indices = self.state_indices(next_observations, speeds)
+                    active = ~finished
+                    self.update_q(state_indices[active], action_indices[active], rewards[active],
+                                  next_state_indices[active])
+
+                    total_rewards += rewards
+                    episode_speeds.append(speeds)
+                    episode_rewards.append(rewards)
+                    print(f"[步骤 {step + 1}] "
+                          f"限速: {', '.join(f'{s:.0f}' for s in speeds)} km/h, "
+                          f"奖励: {', '.join(f'{r:.0f}' for r in rewards)} 辆, "
+                          f"平均上游流量: {np.mean(observations[:, 0]):.0f}veh/h, "
+                          f"平均密度: {np.mean(observations[:, 1]):.1f}veh/km")
+                    observations = next_observations
+                    finished |= done
+                    step += 1
+
+                # 回合结束：按回合顺序记录，最后一个回合的限速变化在 speed_history 末尾
+                speed_limits[:n] = speeds
+                for i in range(n):
+                    avg_reward = total_rewards[i] / max(1, step)  # 平均每步奖励
+                    print(f"回合 {episode + i + 1} 结束，总奖励: {total_rewards[i]:.0f}, 平均奖励: {avg_reward:.2f}")
+                    self.episode_rewards.append(total_rewards[i])
+                    self.reward_per_episode.append(avg_reward)
+                    self.step_rewards.extend(r[i] for r in episode_rewards)
+                    self.speed_history.extend(s[i] for s in episode_speeds)
+                episode += n
+
+                # 更新探索率（每完成一个回合衰减一次）
+                self.epsilon = max(self.min_epsilon,
+                                 self.epsilon * self.epsilon_decay ** n)
+        self.current_speed_limit = speed_limits[0]
+
         # 训练结束，绘制结果
         self.plot_training_results()
     
@@ -383,8 +297,12 @@ def main():
         print(f"设置 SUMO_HOME: {os.environ['SUMO_HOME']}")
     
     # 创建并训练代理（使用默认检测器ID）
+    # NUM_ENVS 个SUMO仿真同时运行，回合吞吐量约为串行的 NUM_ENVS 倍（不超过CPU核数）
+    NUM_ENVS = os.cpu_count() or 1  # <--- 修改此行
+    # 第 i 回合使用SUMO种子 BASE_SEED + i，各并行仿真的交通需求不同
+    BASE_SEED = 1000
     agent = EnhancedQLearningVSL()
-    agent.train(episodes=3000)
+    agent.train(episodes=3000, num_envs=NUM_ENVS, base_seed=BASE_SEED)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
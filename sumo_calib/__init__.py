@@ -0,0 +1,52 @@
+"""
+SUMO calibration engine driven by project files.
+
+    from sumo_calib import load_project, run_calibration
+    run_calibration(load_project("projects/寻优参数.toml"))
+
+or from the command line: ``python -m sumo_calib projects/寻优参数.toml``.
+
+Importing the package is cheap and has no side effects: the names below are
+loaded from their submodules (and numpy etc. imported) on first access only,
+and a project file is only read when load_project() is called.
+"""
+import importlib
+
+# public name -> submodule that defines it
+_LAZY_EXPORTS = {
+    'CalibrationProject': 'project',
+    'ProjectError': 'project',
+    'load_project': 'project',
+    'SimulationObjective': 'evaluation',
+    'simulate_intervals': 'evaluation',
+    'simulate_intervals_async': 'evaluation',
+    'simulate_intervals_concurrently': 'evaluation',
+    'read_observed_csv': 'evaluation',
+    'load_evaluation_log': 'evaluation_log',
+    'stage_report': 'profiling',
+    'ReplicationResult': 'replication',
+    'run_replications': 'replication',
+    'SumoJobScheduler': 'scheduler',
+    'SchedulerExecutor': 'scheduler',
+    'SumoJobError': 'scheduler',
+    'SumoTimeoutError': 'scheduler',
+    'run_spsa_calibration': 'spsa',
+    'EvaluationTracker': 'optimizers',
+    'run_optimizer': 'optimizers',
+    'run_calibration': 'calibration',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'sumo_calib' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f"sumo_calib.{module_name}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,53 @@
+"""Command line entry point: python -m sumo_calib <project file> [<project file> ...]"""
+import argparse
+import os
+import sys
+
+from sumo_calib.project import CalibrationProject, ProjectError, load_project
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sumo_calib",
+                                     description="Calibrate SUMO vType parameters from a project file.")
+    parser.add_argument("project_files", nargs="+", help="project file(s) (.toml, .yaml/.yml or .json)")
+    parser.add_argument("--no-plots", action="store_true", help="do not write the convergence plots")
+    parser.add_argument("--optimizer", help="override [optimizer] method; a comma-separated list "
+                                            "(e.g. spsa,cmaes) runs each and compares them")
+    args = parser.parse_args(argv)
+
+    from sumo_calib.calibration import run_calibration
+
+    for project_file in args.project_files:
+        try:
+            project = load_project(project_file)
+            methods = args.optimizer.split(",") if args.optimizer else [project.optimizer['method']]
+            reports = []
+            for method in methods:
+                # The method is validated like the one of the project file
+                project.data.setdefault('optimizer', {})['method'] = method.strip()
+                project = CalibrationProject(project.data, base_dir=os.path.dirname(project.path), path=project.path)
+                print(f"=== Calibration project '{project.name}' ({project_file}), optimizer {method} ===")
+                result = run_calibration(project, plot=not args.no_plots)
+                reports.append((method, result['report']))
+            if len(reports) > 1:
+                print_comparison(reports)
+        except (ProjectError, FileNotFoundError) as e:
+            sys.exit(f"Error: {e}")
+    return 0
+
+
+def print_comparison(reports):
+    """Table of the optimizer runs of one project: evaluations and wall-clock time in total and to the target."""
+    print("\n--- Optimizer comparison ---")
+    print(f"  {'Optimizer':<12s}{'Best RMSE':>12s}{'Evaluations':>13s}{'Time (s)':>10s}"
+          f"{'Evals to target':>17s}{'Time to target (s)':>20s}")
+    for method, report in reports:
+        evaluations_to_target = report['evaluations_to_target']
+        time_to_target = report['time_to_target']
+        print(f"  {method:<12s}{report['best_error']:>12.4f}{report['num_evaluations']:>13d}{report['wall_time']:>10.1f}"
+              f"{'-' if evaluations_to_target is None else evaluations_to_target:>17}"
+              f"{'-' if time_to_target is None else f'{time_to_target:.1f}':>20}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
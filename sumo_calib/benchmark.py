@@ -0,0 +1,269 @@
+"""
+Benchmark suite of the calibration engine, run against the fake SUMO of fake_sumo.py.
+
+    python -m sumo_calib.benchmark [--quick] [--only overhead,parser,optimizers]
+                                   [--results benchmark_results.jsonl] [--label v1.2]
+
+build_scenario() writes a small synthetic scenario (net, routes, E2 detectors,
+sumocfg, observations taken from the response surface at its optimum) and a
+launcher of the fake sumo into a temporary directory. The suite measures:
+
+  overhead    per-evaluation wall time of SimulationObjective with the fake sumo
+              and the part of it that is not the sumo process (workspace, vType
+              file, output parsing, RMSE), from the stage timings (profiling.py)
+  parser      read_detector_output() and DetectorOutputTail throughput on a large
+              synthetic detector output file (MB/s and intervals/s)
+  optimizers  evaluations (and seconds) each [optimizer] method needs to reach
+              the target RMSE on the response surface, evaluated without
+              processes (AnalyticObjective), median over several seeds
+
+Each run appends one JSON line with its metrics to the results file and is
+compared with the previous line there, so changes between versions show up as
+a table of deltas; --fail-on-regression makes a regression beyond --tolerance
+exit with status 1.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from sumo_calib.detector_output import DetectorOutputTail, read_detector_output
+from sumo_calib.evaluation import SimulationObjective
+from sumo_calib.evaluation_log import load_evaluation_log
+from sumo_calib.fake_sumo import SURFACE_OPTIMUM, SUMO_DEFAULTS, response_speeds, write_detector_output, write_launcher
+from sumo_calib.optimizers import OPTIMIZERS, EvaluationTracker, run_optimizer
+from sumo_calib.project import CalibrationProject
+
+# Calibrated parameters of the benchmark scenario: bounds around the surface optimum
+BENCHMARK_BOUNDS = {
+    'accel': (1.0, 4.0), 'decel': (1.0, 5.0), 'tau': (0.5, 2.0), 'maxSpeed': (30.0, 35.0), 'minGap': (1.0, 3.0),
+    'lcSpeedGain': (0.0, 5.0), 'lcStrategic': (0.0, 5.0), 'lcCooperative': (0.0, 1.0), 'lcKeepRight': (0.0, 5.0),
+    'lcAssertive': (0.0, 5.0), 'speedFactor_mean': (0.5, 1.5), 'speedFactor_std_dev': (0.0, 0.5),
+}
+
+# Metrics where a larger value is better; all others are better when smaller
+HIGHER_IS_BETTER = ('parser_mb_per_s', 'parser_intervals_per_s', 'tail_mb_per_s')
+
+
+def build_scenario(directory, num_detectors=4, num_windows=20, freq=60, warmup=600, end_buffer=120):
+    """Writes the synthetic scenario and the fake sumo launcher into directory; returns the project dict."""
+    os.makedirs(directory, exist_ok=True)
+    detector_ids = [f"e2_bench_{i}" for i in range(num_detectors)]
+    with open(os.path.join(directory, "bench.net.xml"), 'w', encoding='utf-8') as f:
+        f.write('<net version="1.16"/>\n')
+    with open(os.path.join(directory, "bench.rou.xml"), 'w', encoding='utf-8') as f:
+        f.write('<routes>\n    <vType id="passenger" accel="2.6" decel="4.5" tau="1.0" '
+                'speedFactor="normc(1,0.1,0.2,2)"/>\n'
+                '    <flow id="f0" type="passenger" begin="0" end="3600" vehsPerHour="1200" from="E0" to="E1"/>\n'
+                '</routes>\n')
+    with open(os.path.join(directory, "bench.add.xml"), 'w', encoding='utf-8') as f:
+        f.write('<additional>\n')
+        f.writelines(f'    <laneAreaDetector id="{det_id}" lane="E1_{i}" pos="0" endPos="100" freq="{freq}" '
+                     f'file="detector_output.xml"/>\n' for i, det_id in enumerate(detector_ids))
+        f.write('</additional>\n')
+    with open(os.path.join(directory, "bench.sumocfg"), 'w', encoding='utf-8') as f:
+        f.write('<configuration>\n    <input>\n        <net-file value="bench.net.xml"/>\n'
+                '    </input>\n</configuration>\n')
+    launcher = write_launcher(directory)
+
+    # Observed speeds: the noise-free response at the optimum, averaged over the detectors per window
+    begins = warmup + freq * np.arange(num_windows)
+    observed = response_speeds(SURFACE_OPTIMUM, num_detectors, begins, seed=0, noise=0.0, interval=freq)
+    return {
+        'name': "benchmark",
+        'scenario': {'dir': directory, 'sumo_binary': launcher, 'config': "bench.sumocfg", 'net': "bench.net.xml",
+                     'routes': "bench.rou.xml", 'detectors': "bench.add.xml", 'vtype': "passenger"},
+        'simulation': {'warmup': warmup, 'end_buffer': end_buffer},
+        'detectors': {'ids': detector_ids, 'freq': freq},
+        'observations': {'detectors': detector_ids, 'duration_s': freq,
+                         'speeds_kmh': [round(float(v) * 3.6, 2) for v in observed.mean(axis=0)]},
+        'parameters': {name: {'bounds': list(bounds), 'initial': SUMO_DEFAULTS[name]}
+                       for name, bounds in BENCHMARK_BOUNDS.items()},
+        'parallel': {'enabled': False},
+        'cache': {'enabled': False},
+        'output': {'dir': "."},
+    }
+
+
+class AnalyticObjective(SimulationObjective):
+    """The RMSE of the response surface without running the fake sumo (same windows and aggregation)."""
+
+    def __init__(self, project, noise=0.3):
+        super().__init__(project)
+        self.noise = noise
+
+    def evaluate(self, parameters, run_id_suffix="eval", sim_seed=None, prune_above=None):
+        speeds = response_speeds(self.params_dict(parameters), len(self.project.detector_ids), self.interval_begins,
+                                 seed=0 if sim_seed is None else sim_seed, noise=self.noise,
+                                 interval=self.project.detector_freq)
+        return self.rmse(speeds, run_id_suffix)
+
+
+def _percentiles(values):
+    return {f"p{p}": float(v) for p, v in zip((50, 90), np.percentile(values, (50, 90)))}
+
+
+def benchmark_overhead(project_data, num_evaluations=30):
+    """Per-evaluation wall time with the fake sumo and the part of it spent outside the sumo process (ms)."""
+    project = CalibrationProject(project_data, base_dir=project_data['scenario']['dir'])
+    objective = SimulationObjective(project)
+    objective.log_session = f"benchmark-overhead-{os.getpid()}"
+    rng = np.random.default_rng(0)
+    bounds = project.param_bounds
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(num_evaluations):
+            objective(rng.uniform(bounds[:, 0], bounds[:, 1]), run_id_suffix=f"bench_{i}", sim_seed=i + 1)
+    columns = load_evaluation_log(project.evaluation_log_dir, session=objective.log_session)
+    wall = columns['wall_time_s'] * 1000
+    sumo = np.nan_to_num(columns['stages'][:, columns['stage_names'].index('sumo')]) * 1000
+    metrics = {'evaluation_ms_' + key: value for key, value in _percentiles(wall).items()}
+    metrics.update({'overhead_ms_' + key: value for key, value in _percentiles(wall - sumo).items()})
+    return metrics
+
+
+def benchmark_parser(directory, num_detectors=200, num_intervals=1440, freq=60, repeats=3):
+    """read_detector_output() and DetectorOutputTail.poll() throughput on a synthetic output file."""
+    path = os.path.join(directory, "parser_bench_output.xml")
+    detector_ids = [f"det_{i}" for i in range(num_detectors)]
+    begins = freq * np.arange(num_intervals)
+    write_detector_output(path, detector_ids, begins, freq,
+                          response_speeds(SUMO_DEFAULTS, num_detectors, begins, seed=1, interval=freq))
+    size_mb = os.path.getsize(path) / 1e6
+    # Half of the detectors and the middle half of the horizon, like a calibration window
+    selected = detector_ids[::2]
+    begin, end = begins[num_intervals // 4], begins[3 * num_intervals // 4]
+
+    parse_times, tail_times = [], []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        read_detector_output(path, selected, ['meanSpeed'], begin=begin, end=end, interval=freq)
+        parse_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        DetectorOutputTail(path, selected, 'meanSpeed', begin, freq, (end - begin) // freq).poll()
+        tail_times.append(time.perf_counter() - start)
+    os.remove(path)
+    return {
+        'parser_mb_per_s': size_mb / min(parse_times),
+        'parser_intervals_per_s': num_detectors * num_intervals / min(parse_times),
+        'tail_mb_per_s': size_mb / min(tail_times),
+    }
+
+
+def benchmark_optimizers(project_data, methods=OPTIMIZERS, target_rmse=0.5, max_evaluations=400, seeds=(1, 2, 3)):
+    """Evaluations and seconds to target_rmse per optimizer (median over seeds; max_evaluations if not reached)."""
+    metrics = {}
+    for method in methods:
+        data = json.loads(json.dumps(project_data))
+        data['optimizer'] = {'method': method, 'max_evaluations': max_evaluations}
+        data['spsa'] = {'iterations_per_restart': max_evaluations // 2, 'num_restarts': 1}
+        project = CalibrationProject(data, base_dir=data['scenario']['dir'])
+        evaluations, seconds, best = [], [], []
+        for seed in seeds:
+            tracker = EvaluationTracker(AnalyticObjective(project), project.param_bounds, target_error=target_rmse)
+            with contextlib.redirect_stdout(io.StringIO()):
+                run_optimizer(project, tracker, project.default_params, run_seed=seed, run_name=f"Bench {seed}")
+            evaluations.append(tracker.evaluations_to_target or max_evaluations)
+            seconds.append(tracker.time_to_target if tracker.time_to_target is not None else tracker.elapsed)
+            best.append(tracker.best_error)
+        metrics[f"{method}_evaluations_to_target"] = float(np.median(evaluations))
+        metrics[f"{method}_seconds_to_target"] = float(np.median(seconds))
+        metrics[f"{method}_best_rmse"] = float(np.median(best))
+    return metrics
+
+
+def _version_label():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unlabelled"
+
+
+def _previous_record(results_file, quick, benchmarks):
+    """The last record measured with the same --quick setting and the same benchmarks, None if there is none."""
+    if not os.path.exists(results_file):
+        return None
+    with open(results_file, 'r', encoding='utf-8') as f:
+        records = [json.loads(line) for line in f if line.strip()]
+    for record in reversed(records):
+        if record.get('quick') == quick and record.get('benchmarks') == benchmarks:
+            return record
+    return None
+
+
+def compare(previous, current, tolerance):
+    """Prints metric, previous, current and change; returns the metrics that got worse by more than tolerance."""
+    regressions = []
+    print(f"\n--- Benchmark: {current['label']} vs. {previous['label']} ---" if previous else
+          f"\n--- Benchmark: {current['label']} ---")
+    print(f"  {'metric':<36s}{'previous':>12s}{'current':>12s}{'change':>9s}")
+    for name, value in current['metrics'].items():
+        old = previous['metrics'].get(name) if previous else None
+        if old is None:
+            print(f"  {name:<36s}{'-':>12s}{value:>12.3f}")
+            continue
+        change = (value - old) / old if old else 0.0
+        worse = -change if name in HIGHER_IS_BETTER else change
+        flag = "  worse" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"  {name:<36s}{old:>12.3f}{value:>12.3f}{change * 100:>8.1f}%{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m sumo_calib.benchmark",
+                                     description="Benchmarks of the calibration engine with a fake sumo.")
+    parser.add_argument("--only", default="overhead,parser,optimizers",
+                        help="comma-separated benchmarks to run (overhead, parser, optimizers)")
+    parser.add_argument("--quick", action="store_true", help="smaller sizes, for a smoke test")
+    parser.add_argument("--results", default="benchmark_results.jsonl", help="results history file (JSON lines)")
+    parser.add_argument("--label", help="label of this run (default: git describe)")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on a regression")
+    args = parser.parse_args(argv)
+
+    selected = sorted({name.strip() for name in args.only.split(",") if name.strip()})
+    directory = tempfile.mkdtemp(prefix="sumo_calib_bench_")
+    metrics = {}
+    try:
+        project_data = build_scenario(directory)
+        if 'overhead' in selected:
+            print("Running the evaluation overhead benchmark...")
+            metrics.update(benchmark_overhead(project_data, num_evaluations=10 if args.quick else 30))
+        if 'parser' in selected:
+            print("Running the detector output parser benchmark...")
+            metrics.update(benchmark_parser(directory, num_detectors=50 if args.quick else 200))
+        if 'optimizers' in selected:
+            print("Running the optimizer benchmark...")
+            metrics.update(benchmark_optimizers(project_data, max_evaluations=100 if args.quick else 400,
+                                                seeds=(1,) if args.quick else (1, 2, 3)))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+    record = {'time': time.time(), 'label': args.label or _version_label(), 'quick': args.quick,
+              'benchmarks': selected, 'python': platform.python_version(), 'machine': platform.machine(),
+              'cpus': os.cpu_count(), 'metrics': metrics}
+    # Only runs of the same sizes and benchmarks are comparable
+    previous = _previous_record(args.results, args.quick, selected)
+    regressions = compare(previous, record, args.tolerance)
+    with open(args.results, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record) + "\n")
+    print(f"\nResults appended to {args.results}")
+    if regressions and args.fail_on_regression:
+        print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
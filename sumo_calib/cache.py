@@ -0,0 +1,134 @@
+"""
+Persistent, content-addressed cache of SUMO simulation results.
+
+A result is stored under a key derived from everything that determines it:
+the rounded parameter dict, the SUMO seed, the content hashes of the scenario
+files, the simulated time window and any extra context (observed data, detector
+ids, ...). Re-running a restart with the same seeds, or a verification run of
+parameters that were already simulated, then returns immediately.
+
+Each entry is one small JSON file. Entries are evicted least-recently-used
+first once the cache grows beyond max_entries / max_bytes.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+# {abs_path: (size, mtime_ns, sha256)} - scenario files are hashed once per process
+_file_digest_memo = {}
+
+
+def file_digest(path):
+    """SHA-256 of a file's content, memoised on (size, mtime) so large net files are hashed only once."""
+    abs_path = os.path.abspath(path)
+    stat = os.stat(abs_path)
+    memo = _file_digest_memo.get(abs_path)
+    if memo is not None and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+        return memo[2]
+
+    sha = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+    _file_digest_memo[abs_path] = (stat.st_size, stat.st_mtime_ns, digest)
+    return digest
+
+
+def make_cache_key(params, sim_seed, scenario_files, sim_window, context=None, decimals=6):
+    """
+    Builds the cache key for one simulation.
+
+    Args:
+        params (dict): Parameter name -> value. Values are rounded to `decimals` so that
+            points pinned to the same bound by np.clip map to the same key.
+        sim_seed (int): SUMO --seed.
+        scenario_files (list): Paths of the input files (sumocfg, net, routes, additionals).
+        sim_window (tuple): Numbers describing the simulated/evaluated time window.
+        context (optional): Any other JSON-serialisable data the result depends on.
+    """
+    payload = {
+        'params': {name: round(float(value), decimals) for name, value in sorted(params.items())},
+        'seed': int(sim_seed),
+        'files': [file_digest(path) for path in scenario_files],
+        'window': [float(x) for x in sim_window],
+        'context': context,
+    }
+    encoded = json.dumps(payload, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+class SimulationResultCache:
+    """On-disk result store with LRU eviction. Safe to share between worker processes."""
+
+    def __init__(self, cache_dir, max_entries=20000, max_bytes=None):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss."""
+        path = self._entry_path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                value = json.load(f)
+            os.utime(path)  # 更新访问时间，用于LRU淘汰
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        """Stores a JSON-serialisable value. Written atomically so concurrent readers never see partial files."""
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=self.cache_dir)
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(value, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            print(f"  Warning: Failed to write simulation result cache entry: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return
+        self._evict()
+
+    def _evict(self):
+        """Removes the least recently used entries until the size limits hold."""
+        entries = []
+        total_bytes = 0
+        with os.scandir(self.cache_dir) as it:
+            for entry in it:
+                if not entry.name.endswith('.json') or entry.name.startswith('.tmp_'):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total_bytes += stat.st_size
+
+        too_many = self.max_entries is not None and len(entries) > self.max_entries
+        too_big = self.max_bytes is not None and total_bytes > self.max_bytes
+        if not too_many and not too_big:
+            return
+
+        entries.sort()  # oldest access first
+        count = len(entries)
+        for _, size, path in entries:
+            if (self.max_entries is None or count <= self.max_entries) and \
+                    (self.max_bytes is None or total_bytes <= self.max_bytes):
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            count -= 1
+            total_bytes -= size
@@ -0,0 +1,461 @@
+"""
+Calibration driver with algorithm restarts for a calibration project.
+
+run_calibration() runs the restarts of the project's optimizer ([optimizer]
+method, SPSA by default; see optimizers.py), prints and saves the best parameters,
+writes the convergence plots into the project's output directory and runs a
+final verification simulation. It is what the calibration scripts and
+`python -m sumo_calib <project file>` call.
+"""
+import os
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import numpy as np
+
+from sumo_calib.checkpoint import CalibrationCheckpoint
+from sumo_calib.evaluation import SimulationObjective, get_result_cache
+from sumo_calib.evaluation_log import load_evaluation_log, new_session_id
+from sumo_calib.scheduler import SchedulerExecutor, SumoJobScheduler
+from sumo_calib.optimizers import OPTIMIZER_LABELS, EvaluationTracker, latin_hypercube, run_optimizer
+from sumo_calib.profiling import print_stage_report, stage_report
+from sumo_calib.surrogate import SurrogateScreen
+from sumo_calib.warm_start import check_fidelity
+
+
+def evaluate_initial_params(project, objective):
+    """Evaluates the initial parameters once and prints the baseline RMSE."""
+    print("--- Evaluating Error with the Initial Parameters ---")
+    try:
+        initial_rmse = objective(dict(zip(project.param_names, project.default_params)),
+                                 run_id_suffix="default_params_evaluation")
+    except Exception as e:
+        print(f"\nAn error occurred during the initial evaluation: {e}")
+        traceback.print_exc()
+        return None
+
+    print("\n" + "=" * 50)
+    if initial_rmse < 1e9:
+        print(f"Initial RMSE with the initial parameters: {initial_rmse:.4f} m/s")
+        print("This value represents the baseline error before calibration.")
+    else:
+        print("Evaluation with the initial parameters failed. Please check your setup.")
+    print("=" * 50 + "\n")
+    return initial_rmse
+
+
+def save_best_params(project, best_params_dict):
+    best_params_file = os.path.join(project.output_dir, project.best_params_file_name)
+    try:
+        with open(best_params_file, "w") as f:
+            for name, value in best_params_dict.items():
+                f.write(f"{name}: {value}\n")
+        print(f"Best parameters saved to {best_params_file}")
+    except Exception as e:
+        print(f"ERROR: Failed to save best parameters file: {e}")
+
+
+def plot_convergence(project, per_run_convergence_history, cumulative_iterations, total_error_history,
+                     evaluation_history=None):
+    """Saves the per-run, the cumulative and the per-evaluation convergence plots into the output directory."""
+    print("\nGenerating convergence plots...")
+    method = project.optimizer['method']
+    label = OPTIMIZER_LABELS[method]
+    try:
+        import matplotlib.pyplot as plt
+
+        if per_run_convergence_history:
+            plt.figure(figsize=(10, 6))
+            for run_name, iterations, history_values in per_run_convergence_history:
+                if history_values:
+                    plt.plot(iterations, history_values, label=run_name)
+
+            plt.xlabel("Iteration (per run)")
+            plt.ylabel("Best Error Found So Far (RMSE m/s)")
+            plt.title(f"{label} Calibration Convergence (Per Run)")
+            plt.grid(True)
+            plt.ylim(bottom=0)
+            plt.legend()
+            plot_file_per_run = os.path.join(project.output_dir, f"{method}_per_run_convergence.png")
+            plt.savefig(plot_file_per_run)
+            print(f"Per-run convergence plot saved to {plot_file_per_run}")
+        else:
+            print("No run histories available to plot per-run convergence.")
+
+        if total_error_history and cumulative_iterations:
+            plt.figure(figsize=(10, 6))
+            plt.plot(cumulative_iterations, total_error_history)
+
+            plt.xlabel(f"Cumulative Iteration (Total {len(cumulative_iterations)})")
+            plt.ylabel("Overall Best Error Found So Far (RMSE m/s)")
+            plt.title(f"{label} Calibration Cumulative Convergence with Restarts")
+            plt.grid(True)
+            plt.ylim(bottom=0)
+            plot_file_cumulative = os.path.join(project.output_dir, f"{method}_cumulative_convergence.png")
+            plt.savefig(plot_file_cumulative)
+            print(f"Cumulative convergence plot saved to {plot_file_cumulative}")
+        else:
+            print("No cumulative error history available to plot.")
+
+        # Best error over the number of SUMO evaluations: comparable between the optimizers
+        if evaluation_history:
+            plt.figure(figsize=(10, 6))
+            plt.plot([entry[0] for entry in evaluation_history], [entry[2] for entry in evaluation_history])
+            plt.xlabel("SUMO Evaluations")
+            plt.ylabel("Overall Best Error Found So Far (RMSE m/s)")
+            plt.title(f"{label} Calibration Convergence per Evaluation")
+            plt.grid(True)
+            plt.ylim(bottom=0)
+            plot_file_evaluations = os.path.join(project.output_dir, f"{method}_evaluation_convergence.png")
+            plt.savefig(plot_file_evaluations)
+            print(f"Per-evaluation convergence plot saved to {plot_file_evaluations}")
+
+    except ImportError:
+        print("Matplotlib not found. Skipping convergence plot generation.")
+    except Exception as e:
+        print(f"ERROR generating plots: {e}")
+        traceback.print_exc()
+
+
+def make_eval_executor(project):
+    """Returns the executor for the concurrent evaluations of the project, or None for serial evaluation."""
+    if not project.parallel_evaluation:
+        return None
+    if project.parallel_backend == "process" or project.simulation_engine != "subprocess":
+        # An in-process SUMO (libsumo/traci) holds one simulation per process, so each worker gets its own
+        print(f"Parallel evaluation enabled with {project.num_eval_workers} worker processes.")
+        return ProcessPoolExecutor(max_workers=project.num_eval_workers)
+    timeout_text = f"{project.sumo_timeout} s" if project.sumo_timeout else "none"
+    print(f"Parallel evaluation enabled: up to {project.num_eval_workers} concurrent SUMO jobs "
+          f"(timeout {timeout_text}, {project.sumo_max_retries} retries with a new seed).")
+    return SchedulerExecutor(SumoJobScheduler.from_project(project))
+
+
+def shutdown_eval_executor(executor, wait=True):
+    """
+    Shuts an evaluation executor down and cancels its pending simulations. shutdown(cancel_futures=True)
+    of a ProcessPoolExecutor needs Python 3.9; on 3.8 its queued work items are cancelled here.
+    """
+    if isinstance(executor, SchedulerExecutor) or sys.version_info >= (3, 9):
+        executor.shutdown(wait=wait, cancel_futures=True)
+        return
+    for work_item in list(getattr(executor, '_pending_work_items', {}).values()):
+        work_item.future.cancel()
+    executor.shutdown(wait=wait)
+
+
+def run_parallel_restarts(project, tracker, restarts):
+    """
+    Runs independent restarts [(run_name, run_seed, initial_params)] at the same time, each in a thread
+    with its own executor (worker pool). All evaluations go into the shared tracker (the merged
+    best-so-far record). Returns [(run_name, result)] in restart order, without the failed restarts.
+    """
+    label = OPTIMIZER_LABELS[project.optimizer['method']]
+    executors = []
+    executors_lock = threading.Lock()
+
+    def run_restart(run_name, run_seed, initial_params):
+        executor = make_eval_executor(project)
+        with executors_lock:
+            executors.append(executor)
+        surrogate = None
+        if project.surrogate['enabled'] and project.optimizer['method'] == "spsa":
+            surrogate = SurrogateScreen(project.param_bounds, project.surrogate, rng_seed=run_seed)
+        try:
+            return run_optimizer(project, tracker, initial_params, run_seed=run_seed, run_name=run_name,
+                                 surrogate=surrogate, executor=executor)
+        finally:
+            if executor is not None:
+                shutdown_eval_executor(executor)
+
+    print(f"Running {len(restarts)} independent restarts in parallel, "
+          f"{project.num_eval_workers if project.parallel_evaluation else 1} concurrent simulations each.")
+    run_results = []
+    with ThreadPoolExecutor(max_workers=len(restarts)) as pool:
+        futures = [pool.submit(run_restart, *restart) for restart in restarts]
+        try:
+            for (run_name, _, _), future in zip(restarts, futures):
+                try:
+                    run_results.append((run_name, future.result()))
+                except Exception as e:
+                    print(f"\nERROR: {label} Run {run_name} failed: {e}")
+                    traceback.print_exception(type(e), e, e.__traceback__)
+        except BaseException:
+            # Ctrl+C: cancel the pending simulations of all restarts, so their threads finish
+            with executors_lock:
+                for executor in executors:
+                    if executor is not None:
+                        shutdown_eval_executor(executor, wait=False)
+            raise
+
+    for executor in executors:
+        if isinstance(executor, SchedulerExecutor):
+            scheduler = executor.scheduler
+            print(f"SUMO job scheduler: {scheduler.num_timeouts} timeouts, {scheduler.num_retries} retries.")
+    return run_results
+
+
+def print_profile(project, objective):
+    """Prints the stage timing percentiles of this calibration's evaluations (see profiling.py)."""
+    session = getattr(objective, 'log_session', None)
+    if not project.profiling['enabled'] or not project.evaluation_log_dir or session is None:
+        return
+    try:
+        columns = load_evaluation_log(project.evaluation_log_dir, session=session)
+    except Exception as e:
+        print(f"WARNING: Could not read the evaluation log for the profile: {e}")
+        return
+    if len(columns['rmse']):
+        print_stage_report(stage_report(columns))
+
+
+def run_calibration(project, objective=None, plot=True):
+    """
+    Runs the project's optimizer ([optimizer] method) with algorithm restarts: chained (each restart
+    starts from the final parameters of the previous one) or, with [spsa] parallel_restarts,
+    independent restarts from Latin hypercube points running at the same time.
+
+    Returns a dict with 'best_params' (name -> value), 'best_error', 'error_history'
+    (overall best error per cumulative iteration), 'iteration_times', 'final_rmse',
+    'optimizer' (the method) and 'report' (SUMO evaluations, wall-clock time and
+    evaluations/time to [optimizer] target_rmse, see EvaluationTracker.report()).
+    """
+    project.validate()
+    if objective is None:
+        objective = SimulationObjective(project)
+    spsa = project.spsa
+    method = project.optimizer['method']
+    label = OPTIMIZER_LABELS[method]
+    param_names = project.param_names
+    param_bounds = project.param_bounds
+
+    if hasattr(objective, 'log_session'):
+        # Records of this calibration in the evaluation log (see evaluation_log.py)
+        objective.log_session = new_session_id(method)
+        if project.evaluation_log_dir:
+            print(f"Evaluation log: {project.evaluation_log_dir} (session {objective.log_session})")
+
+    warm_start = project.warm_start
+    if getattr(objective, 'warm_start', False) and warm_start['fidelity_check']:
+        passed, _ = check_fidelity(objective, warm_start['fidelity_samples'], warm_start['fidelity_tolerance'])
+        if not passed:
+            print("Warm start disabled for this calibration: every evaluation simulates the full warm-up.")
+            objective.warm_start = False
+
+    if spsa['evaluate_initial']:
+        evaluate_initial_params(project, objective)
+
+    print(f"Starting {label} calibration with algorithm restarts...")
+    print(f"Targeting RMSE over {len(project.observed_data_points)} observed data points.")
+    print(f"Parameters to calibrate ({len(param_names)}): {param_names}")
+
+    start_time = time.time()
+
+    total_error_history = []
+    cumulative_iterations = []
+
+    current_initial_guess = np.copy(project.default_params)
+    best_params_overall = np.copy(current_initial_guess)
+    best_error_overall = float('inf')  # RMSE is in m/s
+
+    per_run_convergence_history = []
+    all_iteration_times = []
+
+    parallel_restarts = spsa['parallel_restarts'] and spsa['num_restarts'] > 1
+    if parallel_restarts and not project.parallel_evaluation and project.simulation_engine != "subprocess":
+        # An in-process SUMO can only run one simulation per process at a time
+        print(f"Parallel restarts need [parallel] enabled with the {project.simulation_engine} engine; "
+              f"running the restarts one after another.")
+        parallel_restarts = False
+
+    # One surrogate model for all chained restarts, trained on every simulation of the calibration
+    # (parallel restarts each train their own)
+    surrogate = None
+    if project.surrogate['enabled'] and method != "spsa":
+        print(f"[surrogate] only applies to SPSA; not used with {label}.")
+    elif project.surrogate['enabled']:
+        if not parallel_restarts:
+            surrogate = SurrogateScreen(param_bounds, project.surrogate, rng_seed=spsa['base_run_seed'])
+        print(f"Surrogate pre-screening enabled (Gaussian process, used after {project.surrogate['min_points']} simulations).")
+
+    # Executor for the concurrent evaluations (None = serial); parallel restarts create one per restart
+    eval_executor = None if parallel_restarts else make_eval_executor(project)
+    # Every optimizer evaluates through the tracker: evaluation count, convergence history, time to target
+    pruning = project.pruning
+    tracker = EvaluationTracker(objective, param_bounds, executor=eval_executor,
+                                target_error=project.optimizer['target_rmse'],
+                                prune_margin=pruning['margin'] if pruning['enabled'] else None)
+    if pruning['enabled']:
+        print(f"Pruning enabled: simulations stop once their RMSE lower bound exceeds the best RMSE "
+              f"so far * {1 + pruning['margin']:g}.")
+
+    try:
+        # --- Outer loop: Execute multiple runs (Algorithm Restarts) ---
+        restarts = []
+        for restart_idx in range(spsa['num_restarts']):
+            run_name = f"Run {restart_idx + 1}" if restart_idx == 0 else f"Restart {restart_idx}"
+            run_seed = None if spsa['base_run_seed'] is None else spsa['base_run_seed'] + restart_idx
+            restarts.append((run_name, run_seed))
+
+        checkpoint = None
+        if project.checkpoint['enabled'] and parallel_restarts:
+            print("[checkpoint] is not used with parallel restarts; it applies to chained restarts.")
+        elif project.checkpoint['enabled']:
+            checkpoint = CalibrationCheckpoint.from_project(project)
+
+        if parallel_restarts:
+            # Independent restarts at the same time: Run 1 from the initial parameters,
+            # the others from Latin hypercube points inside the bounds
+            initial_points = [np.copy(current_initial_guess)]
+            initial_points.extend(latin_hypercube(param_bounds, len(restarts) - 1,
+                                                  np.random.default_rng(spsa['base_run_seed'])))
+            run_results = run_parallel_restarts(project, tracker, [(run_name, run_seed, initial_params)
+                                                                   for (run_name, run_seed), initial_params
+                                                                   in zip(restarts, initial_points)])
+        else:
+            # Chained restarts: each run starts from the final parameters of the previous one
+            run_results = []
+            next_restart = 0
+            run_state = None
+            saved = checkpoint.load() if checkpoint is not None else None
+            if saved is not None:
+                next_restart = saved['next_restart']
+                run_results = saved['run_results']
+                current_initial_guess = saved['initial_guess']
+                surrogate = saved['surrogate']
+                run_state = saved['run_state']
+                tracker.restore(saved['tracker'])
+                start_time = time.time() - saved['elapsed']
+                print(f"Resuming from checkpoint {checkpoint.path}: {len(run_results)} restart(s) finished, "
+                      f"{tracker.num_evaluations} SUMO evaluations so far.")
+
+            def save_checkpoint(restart_idx, state=None):
+                checkpoint.save({'next_restart': restart_idx, 'run_results': run_results,
+                                 'initial_guess': current_initial_guess, 'surrogate': surrogate,
+                                 'run_state': state, 'tracker': tracker.state(),
+                                 'elapsed': time.time() - start_time})
+
+            for restart_idx in range(next_restart, len(restarts)):
+                run_name, run_seed = restarts[restart_idx]
+                on_iteration = None
+                if checkpoint is not None:
+                    def on_iteration(state, restart_idx=restart_idx):
+                        if state['iteration'] % checkpoint.every == 0:
+                            save_checkpoint(restart_idx, state)
+                try:
+                    result = run_optimizer(project, tracker, np.copy(current_initial_guess),
+                                           run_seed=run_seed, run_name=run_name, surrogate=surrogate,
+                                           run_state=run_state, on_iteration=on_iteration)
+                except Exception as e:
+                    print(f"\nERROR: {label} Run {run_name} failed: {e}")
+                    traceback.print_exc()
+                    continue
+                finally:
+                    run_state = None
+                run_results.append((run_name, result))
+                current_initial_guess = np.copy(result[0])
+                if checkpoint is not None:
+                    save_checkpoint(restart_idx + 1)
+
+        for run_name, (final_theta_this_run, best_in_run_params, best_in_run_error, history_this_run,
+                       times_this_run) in run_results:
+            all_iteration_times.extend(times_this_run)
+
+            if best_in_run_error < best_error_overall:
+                best_error_overall = best_in_run_error
+                best_params_overall = np.copy(best_in_run_params)
+
+            per_run_iterations = np.arange(1, len(history_this_run) + 1)
+            per_run_convergence_history.append((run_name, per_run_iterations, history_this_run))
+
+            if parallel_restarts:
+                # The runs share the time axis: overall best per iteration over all runs
+                for i, error_in_run_so_far in enumerate(history_this_run):
+                    if i < len(total_error_history):
+                        total_error_history[i] = min(total_error_history[i], error_in_run_so_far)
+                    else:
+                        cumulative_iterations.append(i + 1)
+                        total_error_history.append(error_in_run_so_far)
+                continue
+
+            current_cumulative_base = 0 if not cumulative_iterations else cumulative_iterations[-1]
+            for i, error_in_run_so_far in enumerate(history_this_run):
+                cumulative_iterations.append(current_cumulative_base + i + 1)
+                if not total_error_history:
+                    total_error_history.append(error_in_run_so_far)
+                else:
+                    total_error_history.append(min(total_error_history[-1], error_in_run_so_far))
+
+        if parallel_restarts and total_error_history:
+            total_error_history = np.minimum.accumulate(total_error_history).tolist()
+
+        # Evaluations are pruned against the best error of all runs (the tracker's), so the best
+        # parameters can be a measured evaluation that no run kept as its own best
+        if tracker.best_params is not None and tracker.best_error < best_error_overall:
+            best_error_overall = tracker.best_error
+            best_params_overall = np.copy(tracker.best_params)
+
+        elapsed_time = time.time() - start_time
+
+        # --- Output Results ---
+        print(f"\n--- Overall {label} Calibration Results ---")
+        found_params = best_error_overall != float('inf')
+        best_params_dict = dict(zip(param_names, best_params_overall))
+        if found_params:
+            print(f"{label} Optimization with restarts finished.")
+            print(f"Total cumulative iterations: {len(cumulative_iterations)}")
+            if all_iteration_times:
+                per_iteration = f" ({2 * spsa['num_perturbations']} simulations each)" if method == "spsa" else ""
+                print(f"Wall-clock time per iteration{per_iteration}: "
+                      f"mean {np.mean(all_iteration_times):.1f} s, max {np.max(all_iteration_times):.1f} s")
+            tracker.print_report(label)
+            print_profile(project, objective)
+            print(f"Best RMSE found across all runs: {best_error_overall:.4f} m/s")
+            print("Best Parameters found overall:")
+            for name, value in best_params_dict.items():
+                print(f"  {name}: {value:.4f}")
+            save_best_params(project, best_params_dict)
+        else:
+            print(f"{label} Optimization did not complete successfully or found no valid parameters.")
+
+        print(f"\nCalibration took {elapsed_time:.2f} seconds ({elapsed_time/60:.2f} minutes).")
+
+        if checkpoint is not None:
+            # The calibration is complete; a later start begins from scratch
+            checkpoint.remove()
+
+        if plot:
+            plot_convergence(project, per_run_convergence_history, cumulative_iterations, total_error_history,
+                             tracker.history)
+
+        # Optional: Run final verification
+        final_rmse_verify = None
+        if found_params:
+            print(f"\nRunning final verification simulation with best {label} parameters...")
+            final_rmse_verify = objective(best_params_overall, run_id_suffix="final_verification",
+                                          sim_seed=spsa['final_verification_seed'])
+            print(f"RMSE from final verification run: {final_rmse_verify:.4f} m/s")
+    finally:
+        if eval_executor is not None:
+            # On an error or Ctrl+C pending simulations are cancelled (their SUMO processes killed)
+            shutdown_eval_executor(eval_executor)
+            if isinstance(eval_executor, SchedulerExecutor):
+                scheduler = eval_executor.scheduler
+                print(f"SUMO job scheduler: {scheduler.num_timeouts} timeouts, {scheduler.num_retries} retries.")
+
+    result_cache = get_result_cache(project)
+    if result_cache is not None:
+        print(f"Simulation result cache (main process): {result_cache.hits} hits, {result_cache.misses} misses.")
+
+    return {
+        'best_params': best_params_dict if found_params else None,
+        'best_error': best_error_overall,
+        'error_history': total_error_history,
+        'iteration_times': all_iteration_times,
+        'final_rmse': final_rmse_verify,
+        'optimizer': method,
+        'report': tracker.report(),
+    }
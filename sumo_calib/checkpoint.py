@@ -0,0 +1,79 @@
+"""
+Checkpoints of a running calibration, so a campaign can resume after a crash or reboot.
+
+With [checkpoint] enabled, run_calibration() writes the state of the chained
+restarts to a pickle file: the finished restarts, the start point of the next
+one, the surrogate model, the evaluation counters and, for SPSA, the state of
+the running restart every `every` iterations (theta, best parameters, error
+history, iteration times and both random generators). Started again with the
+same project, run_calibration() continues from that point; with a base_run_seed
+the resumed calibration draws the same perturbations and SUMO seeds as an
+uninterrupted one. The other optimizers resume at the last finished restart.
+
+Simulation results are not part of the checkpoint: the result cache ([cache])
+already keeps them on disk. A checkpoint is a few kilobytes, written to a
+temporary file and renamed, so an interrupted write never corrupts the last one.
+It is deleted when the calibration finishes.
+"""
+import os
+import pickle
+
+CHECKPOINT_VERSION = 1
+
+
+def checkpoint_signature(project):
+    """Settings a checkpoint depends on; a checkpoint of different settings is not resumed."""
+    return {
+        'parameters': [(name, project.parameter_bounds[name], project.initial_params[name])
+                       for name in project.param_names],
+        'observed': [(p['location_detector_ids'], p['duration_s'], p['observed_speed_kmh'])
+                     for p in project.observed_data_points],
+        'spsa': {key: value for key, value in project.spsa.items() if key != 'evaluate_initial'},
+        'optimizer': project.optimizer,
+        'surrogate': project.surrogate,
+        'scenario': project.scenario_files,
+    }
+
+
+class CalibrationCheckpoint:
+    """The checkpoint file of a project's calibration."""
+
+    def __init__(self, path, signature, every=5):
+        self.path = path
+        self.signature = signature
+        self.every = every
+
+    @classmethod
+    def from_project(cls, project):
+        settings = project.checkpoint
+        return cls(os.path.join(project.output_dir, settings['file']),
+                   checkpoint_signature(project), every=settings['every'])
+
+    def load(self):
+        """The saved state, or None if there is no usable checkpoint."""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                checkpoint = pickle.load(f)
+        except Exception as e:
+            print(f"WARNING: Could not read checkpoint {self.path} ({e}). Starting from the beginning.")
+            return None
+        if checkpoint.get('version') != CHECKPOINT_VERSION or checkpoint.get('signature') != self.signature:
+            print(f"WARNING: Checkpoint {self.path} was written with different project settings. "
+                  f"Starting from the beginning.")
+            return None
+        return checkpoint['state']
+
+    def save(self, state):
+        temp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'version': CHECKPOINT_VERSION, 'signature': self.signature, 'state': state}, f,
+                        protocol=pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
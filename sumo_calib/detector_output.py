@@ -0,0 +1,159 @@
+"""
+Streaming reader for SUMO detector output (E1/E2 <interval .../> files).
+
+The output file is read with iterparse and every <interval> element is cleared as
+soon as its attributes are taken, so memory does not grow with the file size.
+Only the requested detectors and the requested time window are kept, and they
+are written straight into a dense array of shape (detectors, intervals, fields).
+Missing intervals and SUMO's "no vehicle" value (-1) are stored as NaN.
+
+DetectorOutputTail reads the file of a simulation that is still running: each
+poll() parses only the complete <interval .../> lines written since the last one.
+"""
+import os
+import re
+import xml.etree.ElementTree as ET
+from collections import namedtuple
+
+import numpy as np
+
+# SUMO writes -1 (e.g. meanSpeed="-1.00") when no vehicle was measured in an interval
+SUMO_MISSING_VALUE = -1.0
+
+_INTERVAL_LINE = re.compile(rb'<interval\s[^>]*>')
+_ATTRIBUTE = re.compile(rb'([\w:.-]+)="([^"]*)"')
+
+# values: (detectors, intervals, fields) float array; begins: (intervals,) interval begin times;
+# found: (detectors,) bool, the detector wrote at least one interval (in the part of the file that was read)
+DetectorData = namedtuple('DetectorData', ['values', 'detector_ids', 'begins', 'fields', 'found'])
+
+
+def _iter_intervals(path):
+    """Yields the <interval> elements of path one by one and frees each after use."""
+    context = ET.iterparse(path, events=('start', 'end'))
+    root = None
+    for event, elem in context:
+        if root is None:
+            root = elem
+        if event == 'end' and elem.tag == 'interval':
+            yield elem
+            # Drop the element from the tree, otherwise the root keeps every interval alive
+            root.clear()
+
+
+def _field_values(elem, fields):
+    row = []
+    for field in fields:
+        value_str = elem.get(field)
+        value = np.nan if value_str is None else float(value_str)
+        row.append(np.nan if value == SUMO_MISSING_VALUE else value)
+    return row
+
+
+def read_detector_output(path, detector_ids, fields, begin=None, end=None, interval=None):
+    """
+    Reads the given fields of the given detectors from a SUMO detector output file.
+
+    detector_ids: detector ids in the order of the first array axis; other ids are skipped.
+    fields: interval attributes to read (e.g. 'meanSpeed', 'nVehEntered') in the order of the last axis.
+    begin, end: only intervals with begin <= interval begin < end are kept (None = unbounded).
+    interval: detector frequency in seconds. If given together with begin and end, the time
+        axis is the fixed grid begin, begin+interval, ... and the array is filled while
+        reading; reading stops once the selected detectors are past end. Otherwise the time
+        axis consists of the distinct begin times found in the file.
+
+    Returns a DetectorData namedtuple. A detector that wrote intervals without vehicles is found
+    (its values are NaN); one missing from the output is not.
+    """
+    detector_ids = list(detector_ids)
+    fields = list(fields)
+    det_index = {det_id: i for i, det_id in enumerate(detector_ids)}
+
+    if interval is not None and begin is not None and end is not None:
+        begins = np.arange(begin, end, interval, dtype=float)
+        values = np.full((len(detector_ids), len(begins), len(fields)), np.nan)
+        found = np.zeros(len(detector_ids), dtype=bool)
+        for elem in _iter_intervals(path):
+            i = det_index.get(elem.get('id'))
+            if i is None:
+                continue
+            found[i] = True
+            interval_begin = float(elem.get('begin', '-1'))
+            if interval_begin < begin:
+                continue
+            if interval_begin >= end:
+                # Intervals are written in time order, so the selected detectors have no more data in the window
+                break
+            t = int(round((interval_begin - begin) / interval))
+            if t < len(begins) and begins[t] == interval_begin:
+                values[i, t, :] = _field_values(elem, fields)
+        return DetectorData(values, detector_ids, begins, fields, found)
+
+    # Unknown time grid: keep only the filtered rows (compact), then build the dense array
+    row_det, row_begin, row_values = [], [], []
+    found = np.zeros(len(detector_ids), dtype=bool)
+    for elem in _iter_intervals(path):
+        i = det_index.get(elem.get('id'))
+        if i is None:
+            continue
+        found[i] = True
+        interval_begin = float(elem.get('begin', '-1'))
+        if (begin is not None and interval_begin < begin) or (end is not None and interval_begin >= end):
+            continue
+        row_det.append(i)
+        row_begin.append(interval_begin)
+        row_values.append(_field_values(elem, fields))
+
+    begins, time_index = np.unique(np.asarray(row_begin, dtype=float), return_inverse=True)
+    values = np.full((len(detector_ids), len(begins), len(fields)), np.nan)
+    if row_det:
+        values[np.asarray(row_det), time_index, :] = np.asarray(row_values, dtype=float)
+    return DetectorData(values, detector_ids, begins, fields, found)
+
+
+class DetectorOutputTail:
+    """
+    Incremental reader of one field of a detector output file that SUMO is still writing.
+
+    values: (detectors, intervals) array on the grid begin, begin + interval, ..., NaN until read.
+    """
+
+    def __init__(self, path, detector_ids, field, begin, interval, num_intervals):
+        self.path = path
+        self.det_index = {det_id.encode(): i for i, det_id in enumerate(detector_ids)}
+        self.field = field.encode()
+        self.begin = begin
+        self.interval = interval
+        self.values = np.full((len(detector_ids), num_intervals), np.nan)
+        self.latest_begin = None
+        self._offset = 0
+        self._pending = b''
+
+    def poll(self):
+        """
+        Reads the lines written since the last poll. Returns the time up to which all intervals are
+        complete (the begin of the latest interval seen, whose lines may not all be written yet), or None.
+        """
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        self._offset += len(data)
+        data = self._pending + data
+        # A line SUMO has not finished writing is kept for the next poll
+        last_newline = data.rfind(b'\n')
+        self._pending = data[last_newline + 1:]
+        for match in _INTERVAL_LINE.finditer(data[:last_newline + 1]):
+            attributes = dict(_ATTRIBUTE.findall(match.group(0)))
+            interval_begin = float(attributes.get(b'begin', b'-1'))
+            self.latest_begin = interval_begin if self.latest_begin is None else max(self.latest_begin, interval_begin)
+            i = self.det_index.get(attributes.get(b'id'))
+            value = attributes.get(self.field)
+            if i is None or value is None:
+                continue
+            t = int(round((interval_begin - self.begin) / self.interval))
+            if 0 <= t < self.values.shape[1]:
+                value = float(value)
+                self.values[i, t] = np.nan if value == SUMO_MISSING_VALUE else value
+        return self.latest_begin
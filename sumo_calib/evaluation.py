@@ -0,0 +1,669 @@
+"""
+Running SUMO for a calibration project and scoring the result.
+
+run_simulation() runs one simulation in a run slot of the per-process scenario
+workspace (see workspace.py), with the calibrated vType written as a separate
+additional file (see route_template.py). SimulationObjective is the RMSE
+objective for the optimizers; it is a plain picklable object so it can be
+submitted to a ProcessPoolExecutor. simulate_intervals() returns the
+per-interval speed/flow series used by the validation plots.
+
+The *_async variants run SUMO as jobs of a SumoJobScheduler (see scheduler.py)
+with a wall-clock timeout and a retry with a new seed; run_simulation() itself
+kills a SUMO process after project.sumo_timeout seconds. With [simulation]
+engine = "libsumo"/"traci" the objective runs SUMO in-process (see in_process.py),
+and with [warm_start] enabled it starts from warm-up snapshots (see warm_start.py).
+An evaluation with prune_above stops SUMO once its partial RMSE shows that the
+result will be worse (see pruning.py). With [evaluation_log] enabled every
+evaluation is also written as a structured record (see evaluation_log.py),
+with the time spent in each stage of the pipeline (see profiling.py).
+"""
+import asyncio
+import csv
+import os
+import random
+import subprocess
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from sumo_calib.cache import SimulationResultCache, make_cache_key
+from sumo_calib.detector_output import read_detector_output
+from sumo_calib.evaluation_log import get_evaluation_log, parse_run_id
+from sumo_calib.in_process import run_in_process
+from sumo_calib.observation import ObservationWindows
+from sumo_calib.profiling import collect_stages, current_stages, get_sampled_profiler, span
+from sumo_calib.pruning import EvaluationPruned, PrunedError, StreamingPruner
+from sumo_calib.route_template import get_route_template
+from sumo_calib.scheduler import SumoJobError, SumoJobScheduler, SumoTimeoutError
+from sumo_calib.warm_start import get_warm_start_snapshots
+from sumo_calib.workspace import get_scenario_workspace
+
+# Name of the (patched) warm-start state file inside a run slot
+WARM_START_STATE_NAME = "warm_start_state.xml"
+
+# {(pid, cache_dir, max_entries): SimulationResultCache}
+_result_caches = {}
+_result_caches_lock = threading.Lock()
+
+
+def get_result_cache(project):
+    """Returns this process's result cache of the project (None if caching is disabled)."""
+    if not project.cache_dir:
+        return None
+    key = (os.getpid(), project.cache_dir, project.cache_max_entries)
+    with _result_caches_lock:
+        cache = _result_caches.get(key)
+        if cache is None:
+            cache = SimulationResultCache(project.cache_dir, max_entries=project.cache_max_entries)
+            _result_caches[key] = cache
+    return cache
+
+
+def build_sumo_command(project, sim_seed, end_time, additional_files, extra_options=None):
+    command = [
+        project.sumo_path, "-c", project.sumo_cfg_file,
+        "--route-files", os.path.basename(project.route_file),
+        "--additional-files", ",".join(additional_files),
+        "--end", str(end_time),
+        "--seed", str(sim_seed),
+        "--time-to-teleport", str(project.time_to_teleport),
+        "--step-length", str(project.step_length),
+        "--no-warnings", "true",
+        "--verbose", "false",
+    ]
+    return command + list(extra_options or [])
+
+
+def _prepare_workspace(project, param_values_dict, run_label, from_state=False):
+    """
+    Returns (workspace, additional_files, route_template) for a run, or None if the route template failed.
+    A run from a saved state (from_state) takes the vType from the state, so no vType file is added.
+    """
+    staged_files = [project.net_file, project.detector_file]
+    additional_files = [os.path.basename(project.detector_file)]
+    route_template = None
+    if param_values_dict or from_state:
+        # The route file is parsed once per worker; the calibrated vType is kept as a patchable fragment
+        try:
+            route_template = get_route_template(project.route_file, project.vtype_id,
+                                                project.speedfactor_default_bounds)
+        except Exception as e:
+            print(f"ERROR [{run_label}]: Failed to compile route template: {e}")
+            return None
+        staged_files.append(route_template.demand_file)
+        if not from_state:
+            additional_files.insert(0, project.vtype_additional_name)
+    else:
+        staged_files.append(project.route_file)
+
+    # Inputs are staged (linked) once per worker; the slot only receives this run's vType file
+    # and detector output, which are deleted again when the slot is released.
+    return get_scenario_workspace(staged_files), additional_files, route_template
+
+
+def _write_run_inputs(project, run_dir, route_template, param_values_dict, run_label, state=None):
+    """Writes the per-run vType file (or the patched saved state); returns the extra SUMO options, None on failure."""
+    if state is not None:
+        try:
+            state.write(os.path.join(run_dir, WARM_START_STATE_NAME),
+                        route_template.vtype_attributes(param_values_dict or {}))
+        except Exception as e:
+            print(f"ERROR [{run_label}]: Failed to write warm-start state: {e}")
+            traceback.print_exc()
+            return None
+        return ["--load-state", WARM_START_STATE_NAME, "--begin", str(state.time)]
+    if route_template is None:
+        return []
+    try:
+        route_template.write_vtype_additional(os.path.join(run_dir, project.vtype_additional_name),
+                                              param_values_dict)
+        return []
+    except Exception as e:
+        print(f"ERROR [{run_label}]: Failed to write vType file: {e}")
+        traceback.print_exc()
+        return None
+
+
+def _read_run_output(project, run_dir, read_output, run_label):
+    if read_output is None:
+        return True
+    detector_output_path = os.path.join(run_dir, project.detector_output_name)
+    if not os.path.exists(detector_output_path):
+        print(f"ERROR [{run_label}]: SUMO output file not found: {detector_output_path}")
+        return None
+    try:
+        return read_output(detector_output_path)
+    except Exception as e:
+        print(f"ERROR [{run_label}]: Failed to process detector output XML: {e}")
+        traceback.print_exc()
+        return None
+
+
+def _run_monitored(sumo_command, run_dir, timeout, monitor, poll_interval):
+    """
+    subprocess.run(check=True, capture_output=True, text=True, timeout=timeout) that calls monitor(run_dir)
+    every poll_interval seconds; an exception raised by monitor kills SUMO and is passed on.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with subprocess.Popen(sumo_command, cwd=run_dir, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          text=True) as process:
+        try:
+            while True:
+                try:
+                    stdout, stderr = process.communicate(timeout=poll_interval)
+                    break
+                except subprocess.TimeoutExpired:
+                    if deadline is not None and time.monotonic() > deadline:
+                        raise subprocess.TimeoutExpired(sumo_command, timeout)
+                    monitor(run_dir)
+        except BaseException:
+            process.kill()
+            process.communicate()
+            raise
+    if process.returncode:
+        raise subprocess.CalledProcessError(process.returncode, sumo_command, stdout, stderr)
+
+
+def _run_sumo(project, sumo_command, run_dir, monitor):
+    if monitor is None:
+        subprocess.run(sumo_command, cwd=run_dir, check=True, capture_output=True, text=True,
+                       timeout=project.sumo_timeout)
+    else:
+        _run_monitored(sumo_command, run_dir, project.sumo_timeout, monitor, project.pruning['poll_interval_s'])
+
+
+def run_simulation(project, param_values_dict, sim_seed, end_time, read_output, run_label="eval",
+                   extra_options=None, state=None, monitor=None, outcome=None):
+    """
+    Runs one SUMO simulation and returns read_output(detector_output_path), or None on failure.
+
+    With param_values_dict the calibrated vType is written into a small additional file and the
+    stripped demand of the route template is used; without it the original route file is used.
+    read_output is called while the run slot still exists; its files are removed afterwards
+    (read_output=None only checks that SUMO succeeded and returns True).
+    A SUMO process running longer than project.sumo_timeout seconds is killed.
+    With a warm-start state (warm_start.StateTemplate) the run starts from the saved state.
+    monitor(run_dir) is called every [pruning] poll_interval_s seconds while SUMO runs; an exception
+    it raises (pruning.EvaluationPruned) stops SUMO and is passed on.
+    outcome (dict, optional) receives SUMO's 'returncode' and, on failure, the 'status' of the evaluation log.
+    """
+    if outcome is None:
+        outcome = {}
+    with span('workspace'):
+        prepared = _prepare_workspace(project, param_values_dict, run_label, from_state=state is not None)
+    if prepared is None:
+        return None
+    workspace, additional_files, route_template = prepared
+
+    with workspace.run_slot() as run_dir:
+        with span('write_inputs'):
+            run_options = _write_run_inputs(project, run_dir, route_template, param_values_dict, run_label, state)
+        if run_options is None:
+            return None
+
+        sumo_command = build_sumo_command(project, sim_seed, end_time, additional_files,
+                                          run_options + list(extra_options or []))
+        try:
+            with span('sumo'):
+                _run_sumo(project, sumo_command, run_dir, monitor)
+            outcome['returncode'] = 0
+        except EvaluationPruned:
+            raise
+        except subprocess.CalledProcessError as e:
+            print(f"ERROR [{run_label}]: SUMO simulation failed: {e}")
+            print("SUMO stdout:\n", e.stdout)
+            print("SUMO stderr:\n", e.stderr)
+            outcome.update(returncode=e.returncode, status="sumo_error")
+            return None
+        except subprocess.TimeoutExpired:
+            print(f"ERROR [{run_label}]: SUMO exceeded the timeout of {project.sumo_timeout} s and was killed.")
+            outcome['status'] = "timeout"
+            return None
+        except Exception as e:
+            print(f"ERROR [{run_label}]: SUMO simulation failed: {e}")
+            outcome['status'] = "sumo_error"
+            return None
+
+        with span('read_output'):
+            return _read_run_output(project, run_dir, read_output, run_label)
+
+
+async def run_simulation_async(project, param_values_dict, sim_seed, end_time, read_output, scheduler,
+                               run_label="eval", extra_options=None, state=None, monitor=None):
+    """
+    run_simulation() as a job of a SumoJobScheduler (bounded concurrency, wall-clock timeout).
+
+    Raises SumoJobError if SUMO failed or timed out, so the caller can retry with another seed;
+    other failures return None. read_output runs in a thread so it does not block the event loop.
+    """
+    with span('workspace'):
+        prepared = _prepare_workspace(project, param_values_dict, run_label, from_state=state is not None)
+    if prepared is None:
+        return None
+    workspace, additional_files, route_template = prepared
+
+    with workspace.run_slot() as run_dir:
+        with span('write_inputs'):
+            run_options = _write_run_inputs(project, run_dir, route_template, param_values_dict, run_label, state)
+        if run_options is None:
+            return None
+
+        sumo_command = build_sumo_command(project, sim_seed, end_time, additional_files,
+                                          run_options + list(extra_options or []))
+        try:
+            await scheduler.run_process(sumo_command, cwd=run_dir, monitor=monitor,
+                                        poll_interval=project.pruning['poll_interval_s'])
+        except SumoJobError as e:
+            print(f"ERROR [{run_label}]: SUMO simulation failed: {e}")
+            if e.stderr:
+                print("SUMO stderr:\n", e.stderr)
+            raise
+
+        loop = asyncio.get_running_loop()
+        with span('read_output'):
+            return await loop.run_in_executor(None, _read_run_output, project, run_dir, read_output, run_label)
+
+
+class SimulationObjective:
+    """
+    RMSE objective of a project: runs ONE long simulation with the given vType parameters,
+    reads the fine-grained detector output, aggregates it over the observation windows and
+    returns the RMSE in m/s (1e9 on failure).
+    """
+
+    def __init__(self, project):
+        self.project = project
+        # Observation windows as index ranges on the fine-grained detector time grid, computed once
+        start = project.calibration_start_time
+        self.interval_begins = np.arange(start, start + project.total_obs_duration, project.detector_freq)
+        self.observation_windows = ObservationWindows(project.observed_data_points, project.detector_ids,
+                                                      start, self.interval_begins)
+        # RMSE also depends on the observed data and detector settings, so they are part of the cache key
+        self.cache_context = {
+            'vType': project.vtype_id,
+            'detectors': project.detector_ids,
+            'speed_attribute': project.speed_attribute,
+            'observed': [(p['location_detector_ids'], p['duration_s'], p['observed_speed_kmh'])
+                         for p in project.observed_data_points],
+        }
+        if project.simulation_engine != "subprocess":
+            # Speeds read through the API can differ slightly from the XML output
+            self.cache_context['engine'] = project.simulation_engine
+        self.cache_window = (start, project.sim_duration, project.detector_freq)
+        # Start evaluations from warm-up snapshots (switched off by run_calibration if the fidelity check fails)
+        self.warm_start = bool(project.warm_start['enabled'])
+        # Session id of the evaluation log records (set by run_calibration for each calibration)
+        self.log_session = None
+
+    def __call__(self, parameters, run_id_suffix="eval", sim_seed=None, prune_above=None):
+        return self.evaluate(parameters, run_id_suffix=run_id_suffix, sim_seed=sim_seed, prune_above=prune_above)
+
+    def params_dict(self, parameters):
+        if isinstance(parameters, dict):
+            return parameters
+        return dict(zip(self.project.param_names, parameters))
+
+    def evaluate(self, parameters, run_id_suffix="eval", sim_seed=None, prune_above=None):
+        """
+        sim_seed is the SUMO --seed; if None a random seed is drawn here. With prune_above the
+        simulation is stopped once the RMSE is certain to exceed it, and the lower bound is returned as a PrunedError.
+        """
+        profiler = get_sampled_profiler(self.project)
+        with collect_stages(self.project.profiling['enabled']):
+            if profiler is None:
+                return self._evaluate(parameters, run_id_suffix, sim_seed, prune_above)
+            with profiler.profile(run_id_suffix):
+                return self._evaluate(parameters, run_id_suffix, sim_seed, prune_above)
+
+    def _evaluate(self, parameters, run_id_suffix, sim_seed, prune_above):
+        project = self.project
+        param_values_dict = self.params_dict(parameters)
+        if sim_seed is None:
+            sim_seed = random.randint(1, 100000)
+        started = time.time()
+
+        # --- Step 0: Return the cached RMSE if this exact simulation was already run ---
+        cached_rmse = self._cached_rmse(param_values_dict, sim_seed, run_id_suffix, started)
+        if cached_rmse is not None:
+            return cached_rmse
+
+        # --- Steps 1-4: Run SUMO and read the calibration window of the detector output ---
+        with span('warm_start'):
+            state = self._warm_start_state(sim_seed, run_id_suffix)
+        pruner = None if prune_above is None else StreamingPruner(self, prune_above)
+        outcome = {}
+        try:
+            if project.simulation_engine == "subprocess":
+                window = run_simulation(project, param_values_dict, sim_seed, project.sim_duration,
+                                        self.read_fine_grained_speeds, run_label=run_id_suffix,
+                                        state=state, monitor=None if pruner is None else pruner.poll_output,
+                                        outcome=outcome)
+            else:
+                # SUMO stays loaded in this process; detector speeds are read through the API
+                # (a detector that is not defined fails the run, so none is missing)
+                fine_grained_speeds = run_in_process(project, param_values_dict, sim_seed,
+                                                     project.calibration_start_time, project.detector_freq,
+                                                     len(self.interval_begins), project.detector_ids,
+                                                     run_label=run_id_suffix, state=state, pruner=pruner)
+                window = None if fine_grained_speeds is None else (fine_grained_speeds, [])
+        except EvaluationPruned as pruned:
+            return self._pruned(pruned, param_values_dict, sim_seed, run_id_suffix, started)
+        return self._score(window, param_values_dict, sim_seed, run_id_suffix, started, outcome)
+
+    async def evaluate_async(self, parameters, run_id_suffix="eval", sim_seed=None, scheduler=None,
+                             prune_above=None):
+        """
+        evaluate() as a job of a SumoJobScheduler. A SUMO run that fails or exceeds the
+        timeout is retried with a new seed (scheduler.max_retries times) before returning 1e9.
+        """
+        project = self.project
+        if project.simulation_engine != "subprocess":
+            # An in-process SUMO cannot run as an asyncio job
+            return self.evaluate(parameters, run_id_suffix=run_id_suffix, sim_seed=sim_seed, prune_above=prune_above)
+        # Each evaluation runs as its own task, so its stage timings are separate from the others'
+        with collect_stages(project.profiling['enabled']):
+            return await self._evaluate_async(parameters, run_id_suffix, sim_seed, scheduler, prune_above)
+
+    async def _evaluate_async(self, parameters, run_id_suffix, sim_seed, scheduler, prune_above):
+        project = self.project
+        param_values_dict = self.params_dict(parameters)
+        if sim_seed is None:
+            sim_seed = random.randint(1, 100000)
+        started = time.time()
+
+        cached_rmse = self._cached_rmse(param_values_dict, sim_seed, run_id_suffix, started)
+        if cached_rmse is not None:
+            return cached_rmse
+
+        async def job(seed):
+            # A missing snapshot is built (one blocking warm-up run) in a thread
+            with span('warm_start'):
+                state = await asyncio.get_running_loop().run_in_executor(None, self._warm_start_state, seed,
+                                                                         run_id_suffix)
+            pruner = None if prune_above is None else StreamingPruner(self, prune_above)
+            return await run_simulation_async(project, param_values_dict, seed, project.sim_duration,
+                                              self.read_fine_grained_speeds, scheduler, run_label=run_id_suffix,
+                                              state=state, monitor=None if pruner is None else pruner.poll_output)
+
+        try:
+            window, used_seed = await scheduler.run_with_retries(job, sim_seed, label=run_id_suffix)
+        except SumoJobError as e:
+            self._record(run_id_suffix, param_values_dict, sim_seed, 1e9, started,
+                         "timeout" if isinstance(e, SumoTimeoutError) else "sumo_error", e.returncode)
+            return 1e9
+        except EvaluationPruned as pruned:
+            return self._pruned(pruned, param_values_dict, sim_seed, run_id_suffix, started)
+        return self._score(window, param_values_dict, used_seed, run_id_suffix, started,
+                           {'returncode': 0})
+
+    def _warm_start_state(self, sim_seed, run_id_suffix):
+        """Warm-up snapshot (StateTemplate) to start this evaluation from, None for a full run."""
+        if not self.warm_start:
+            return None
+        state = get_warm_start_snapshots(self.project).state_for(sim_seed)
+        if state is None:
+            print(f"WARNING [{run_id_suffix}]: No warm-start snapshot available. Running the full simulation.")
+        return state
+
+    def _cache_key(self, param_values_dict, sim_seed):
+        context = self.cache_context
+        if self.warm_start:
+            context = dict(context, warm_start=get_warm_start_snapshots(self.project).signature)
+        return make_cache_key(param_values_dict, sim_seed, self.project.scenario_files, self.cache_window,
+                              context=context)
+
+    def _cached_rmse(self, param_values_dict, sim_seed, run_id_suffix, started):
+        result_cache = get_result_cache(self.project)
+        if result_cache is None:
+            return None
+        with span('cache'):
+            cached = result_cache.get(self._cache_key(param_values_dict, sim_seed))
+        if cached is None:
+            return None
+        print(f"  Calculated RMSE for {run_id_suffix} (cached result): {cached['rmse']:.4f} m/s")
+        self._record(run_id_suffix, param_values_dict, sim_seed, cached['rmse'], started, "cached")
+        return cached['rmse']
+
+    def _pruned(self, pruned, param_values_dict, sim_seed, run_id_suffix, started):
+        """The lower bound of a stopped simulation (not cached: it is not the RMSE of the run)."""
+        print(f"  Calculated RMSE for {run_id_suffix} (pruned at {pruned.time_reached:g} s of "
+              f"{self.project.sim_duration:g} s, lower bound): {pruned.lower_bound:.4f} m/s")
+        self._record(run_id_suffix, param_values_dict, sim_seed, pruned.lower_bound, started, "pruned")
+        return PrunedError(pruned.lower_bound)
+
+    def _score(self, window, param_values_dict, sim_seed, run_id_suffix, started, outcome):
+        """
+        RMSE of a simulation's (detector speeds, detectors missing from the output) (1e9 on failure);
+        valid results are cached under sim_seed.
+        """
+        if window is None:
+            self._record(run_id_suffix, param_values_dict, sim_seed, 1e9, started, outcome.get('status', "failed"),
+                         outcome.get('returncode'))
+            return 1e9
+        fine_grained_speeds, missing_detectors = window
+
+        # Check if every required detector ID is in the output at all. A detector that only measured no
+        # vehicles (SUMO's -1) still counts; its windows without data are penalized point by point in rmse()
+        if missing_detectors:
+            print(f"WARNING [{run_id_suffix}]: Some detectors {missing_detectors} had no data intervals in the entire simulation output.")
+            self._record(run_id_suffix, param_values_dict, sim_seed, 1e9, started, "no_data", outcome.get('returncode'))
+            return 1e9  # Penalize simulations with no data from detectors
+
+        # --- Step 5: Aggregate simulation speeds over all observation windows at once ---
+        with span('aggregate'):
+            rmse = self.rmse(fine_grained_speeds, run_id_suffix)
+        result_cache = get_result_cache(self.project)
+        if result_cache is not None and rmse < 1e9:
+            with span('cache'):
+                result_cache.put(self._cache_key(param_values_dict, sim_seed), {'rmse': float(rmse)})
+        self._record(run_id_suffix, param_values_dict, sim_seed, rmse, started, "ok" if rmse < 1e9 else "no_data",
+                     outcome.get('returncode'))
+        return rmse
+
+    def _record(self, run_id_suffix, param_values_dict, sim_seed, rmse, started, status, returncode=None):
+        """Writes the evaluation to the project's evaluation log (see evaluation_log.py), if enabled."""
+        evaluation_log = get_evaluation_log(self.project)
+        if evaluation_log is None:
+            return
+        now = time.time()
+        run, iteration, sign = parse_run_id(run_id_suffix)
+        evaluation_log.write({
+            'time': now, 'session': self.log_session, 'run_id': run_id_suffix, 'run': run, 'iteration': iteration,
+            'sign': sign, 'params': {name: float(value) for name, value in param_values_dict.items()},
+            'seed': int(sim_seed), 'rmse': float(rmse), 'wall_time_s': now - started, 'status': status,
+            'returncode': returncode, 'stages': current_stages(),
+        })
+
+    def read_fine_grained_speeds(self, detector_output_path):
+        """
+        ((detectors, intervals) speeds in m/s of the calibration window, NaN where missing;
+        ids of the detectors that are not in the output at all).
+        """
+        project = self.project
+        start = project.calibration_start_time
+        data = read_detector_output(detector_output_path, project.detector_ids, [project.speed_attribute],
+                                    begin=start, end=start + project.total_obs_duration,
+                                    interval=project.detector_freq)
+        missing_detectors = [det_id for det_id, found in zip(data.detector_ids, data.found) if not found]
+        return data.values[:, :, 0], missing_detectors
+
+    def rmse(self, fine_grained_speeds, run_id_suffix="eval"):
+        windows = self.observation_windows
+        points = self.project.observed_data_points
+        if len(windows) == 0:
+            print(f"ERROR [{run_id_suffix}]: No valid data found in simulation for ANY of the observed data points to calculate RMSE.")
+            return 1e9
+
+        squared_errors, point_means, window_counts = windows.squared_errors(fine_grained_speeds)
+        points_with_data = ~np.isnan(point_means)
+        num_points_with_data = int(np.sum(points_with_data))
+
+        # No data for THIS detector in THIS observation window
+        for i, d in np.argwhere((windows.point_detectors > 0) & (window_counts == 0)):
+            print(f"WARNING [{run_id_suffix}]: No fine-grained speed data found for detector '{windows.detector_ids[d]}' for obs point {i} in simulation window [{windows.window_start_times[i]:g}, {windows.window_end_times[i]:g}]s.")
+        # Observations without data from any of their detectors were penalized with a large error
+        for i in np.flatnonzero(~points_with_data):
+            print(f"WARNING [{run_id_suffix}]: No valid simulated speed data found for observed point {i} (Detectors: {points[i]['location_detector_ids']}, Duration: {points[i]['duration_s']}s) in simulation window [{windows.window_start_times[i]:g}, {windows.window_end_times[i]:g}]s. Penalizing this point.")
+
+        rmse = float(np.sqrt(np.mean(squared_errors)))
+        print(f"  Calculated RMSE for {run_id_suffix} (over {len(points)} points, {num_points_with_data} with sim data): {rmse:.4f} m/s")
+        return rmse
+
+
+def _intervals_cache_key(project, sim_seed, calibrated_params_dict):
+    return make_cache_key(calibrated_params_dict or {}, sim_seed, project.scenario_files,
+                          (project.validation_sim_duration, project.warmup, project.validation_interval,
+                           project.validation_num_intervals),
+                          context={'result': 'intervals', 'detectors': project.validation_detector_ids,
+                                   'speed_attribute': project.speed_attribute, 'vType': project.vtype_id})
+
+
+def _cached_intervals(project, sim_seed, calibrated_params_dict):
+    result_cache = get_result_cache(project)
+    if result_cache is None:
+        return None
+    cached = result_cache.get(_intervals_cache_key(project, sim_seed, calibrated_params_dict))
+    if cached is None:
+        return None
+    print(f"  Using cached simulation result for seed {sim_seed}.")
+    return cached['speeds_kmh'], cached['flows_vehpermin']
+
+
+def _store_intervals(project, sim_seed, calibrated_params_dict, result):
+    if result is None:
+        return None, None
+    speeds_kmh, flows_vehpermin = result
+    print(f"  Successfully extracted {len(speeds_kmh)} data intervals for seed {sim_seed}.")
+    result_cache = get_result_cache(project)
+    if result_cache is not None:
+        result_cache.put(_intervals_cache_key(project, sim_seed, calibrated_params_dict),
+                         {'speeds_kmh': [float(x) for x in speeds_kmh],
+                          'flows_vehpermin': [float(x) for x in flows_vehpermin]})
+    return speeds_kmh, flows_vehpermin
+
+
+def _interval_reader(project, sim_seed):
+    detector_ids = project.validation_detector_ids
+    warmup = project.warmup
+    interval = project.validation_interval
+    num_intervals = project.validation_num_intervals
+
+    def read_intervals(detector_output_path):
+        # Streamed read of the observed window only: (detectors, intervals, [speed, nVehEntered])
+        detector_data = read_detector_output(detector_output_path, detector_ids,
+                                             [project.speed_attribute, 'nVehEntered'],
+                                             begin=warmup, end=warmup + num_intervals * interval, interval=interval)
+        speeds_ms = detector_data.values[:, :, 0]
+        flows_per_min = detector_data.values[:, :, 1]  # nVehEntered is already the count per interval (e.g., 60s)
+
+        # An interval is only used if every detector has a valid speed and count in it
+        complete_intervals = ~np.isnan(detector_data.values).any(axis=(0, 2))
+        speeds_kmh = np.where(complete_intervals, speeds_ms.mean(axis=0) * 3.6, np.nan).tolist()
+        flows_vehpermin = np.where(complete_intervals, flows_per_min.sum(axis=0), np.nan).tolist()
+
+        for t in np.flatnonzero(~complete_intervals):
+            missing_ids = [det_id for det_id, det_values in zip(detector_ids, detector_data.values[:, t, :])
+                           if np.isnan(det_values).any()]
+            print(f"  Warning (Seed {sim_seed}): Interval {detector_data.begins[t]:g}s: Missing data for detectors {missing_ids} (Expected {detector_ids}). Appending NaN.")
+        return speeds_kmh, flows_vehpermin
+
+    return read_intervals
+
+
+def simulate_intervals(project, sim_seed, calibrated_params_dict=None):
+    """
+    Runs one simulation for the interval-by-interval validation and returns
+    (speeds_kmh, flows_vehpermin) lists of length validation_num_intervals, or (None, None) on failure.
+    Speed is averaged across the validation detectors, flow (nVehEntered per interval) is summed.
+    """
+    cached = _cached_intervals(project, sim_seed, calibrated_params_dict)
+    if cached is not None:
+        return cached
+
+    print(f"  Running SUMO simulation with seed {sim_seed}...")
+    result = run_simulation(project, calibrated_params_dict, sim_seed, project.validation_sim_duration,
+                            _interval_reader(project, sim_seed), run_label=f"seed {sim_seed}")
+    return _store_intervals(project, sim_seed, calibrated_params_dict, result)
+
+
+async def _simulate_intervals_with_seed(project, sim_seed, calibrated_params_dict, scheduler):
+    """((speeds_kmh, flows_vehpermin), seed the values were simulated with) for simulate_intervals_async()."""
+    cached = _cached_intervals(project, sim_seed, calibrated_params_dict)
+    if cached is not None:
+        return cached, sim_seed
+
+    async def job(seed):
+        print(f"  Running SUMO simulation with seed {seed}...")
+        return await run_simulation_async(project, calibrated_params_dict, seed, project.validation_sim_duration,
+                                          _interval_reader(project, seed), scheduler, run_label=f"seed {seed}")
+
+    try:
+        result, used_seed = await scheduler.run_with_retries(job, sim_seed, label=f"seed {sim_seed}")
+    except SumoJobError:
+        return (None, None), sim_seed
+    return _store_intervals(project, used_seed, calibrated_params_dict, result), used_seed
+
+
+async def simulate_intervals_async(project, sim_seed, calibrated_params_dict=None, scheduler=None):
+    """
+    simulate_intervals() as a job of a SumoJobScheduler. A SUMO run that fails or exceeds
+    the timeout is retried with a new seed before (None, None) is returned.
+    """
+    if scheduler is None:
+        scheduler = SumoJobScheduler.from_project(project)
+    result, _ = await _simulate_intervals_with_seed(project, sim_seed, calibrated_params_dict, scheduler)
+    return result
+
+
+def simulate_intervals_concurrently(project, sim_seeds, calibrated_params_dict=None, scheduler=None,
+                                    return_used_seeds=False):
+    """
+    Runs the validation simulations of all seeds at once on a SumoJobScheduler and returns
+    their (speeds_kmh, flows_vehpermin) results in the order of sim_seeds.
+    With return_used_seeds, (results, used_seeds) is returned; a run that was retried with a
+    new seed reports that seed instead of the one it was submitted with.
+    """
+    async def run_all():
+        job_scheduler = scheduler or SumoJobScheduler.from_project(project)
+        tasks = [job_scheduler.submit(_simulate_intervals_with_seed(project, seed, calibrated_params_dict,
+                                                                    job_scheduler))
+                 for seed in sim_seeds]
+        try:
+            return await asyncio.gather(*tasks)
+        finally:
+            job_scheduler.cancel_all()
+
+    outcomes = asyncio.run(run_all())
+    results = [result for result, _ in outcomes]
+    if return_used_seeds:
+        return results, [used_seed for _, used_seed in outcomes]
+    return results
+
+
+def read_observed_csv(csv_file_path, expected_intervals=None):
+    """
+    Reads observed speeds and flows from a CSV with the columns 'Observed_Speed_kmh' and
+    'Observed_Flow_vehpermin'. Returns (observed_speeds_kmh, observed_flows_vehpermin) lists.
+    """
+    observed_speeds_kmh = []
+    observed_flows_vehpermin = []
+    with open(csv_file_path, mode='r', encoding='utf-8-sig') as infile:
+        reader = csv.DictReader(infile, delimiter=',')
+        for row in reader:
+            try:
+                speed_kmh = float(row['Observed_Speed_kmh'])
+                flow_vehpermin = float(row['Observed_Flow_vehpermin'])
+            except ValueError:
+                print(f"Skipping row with invalid numerical data: {row}")
+                continue
+            except KeyError as e:
+                raise KeyError(f"Missing expected column in CSV: {e}. Ensure headers are 'Observed_Speed_kmh' "
+                               f"and 'Observed_Flow_vehpermin'.")
+            observed_speeds_kmh.append(speed_kmh)
+            observed_flows_vehpermin.append(flow_vehpermin)
+    if expected_intervals is not None and len(observed_speeds_kmh) != expected_intervals:
+        print(f"Warning: Expected {expected_intervals} observed intervals, but found {len(observed_speeds_kmh)}.")
+    return observed_speeds_kmh, observed_flows_vehpermin
@@ -0,0 +1,224 @@
+"""
+Structured, append-only record of every calibration evaluation.
+
+With [evaluation_log] enabled, SimulationObjective writes one JSON line per
+evaluation (a JSONL file per process in the log directory, so process-pool
+workers never write to the same file):
+
+    {"time": 1718000000.12, "session": "20240610-101500-spsa", "run_id": "Run 1_iter3_p",
+     "run": "Run 1", "iteration": 3, "sign": "p", "params": {"accel": 2.6, ...},
+     "seed": 4711, "rmse": 1.4306, "wall_time_s": 41.7, "status": "ok", "returncode": 0,
+     "stages": {"cache": 0.001, "workspace": 0.002, "sumo": 41.5, ...}}
+
+status is "ok", "cached" (result cache hit), "pruned" (rmse is the lower bound of
+a stopped simulation, see pruning.py), "no_data" (detectors without data),
+"sumo_error" / "timeout" (SUMO failed or was killed; returncode is SUMO's exit
+status where known) or "failed". wall_time_s runs from the start of the
+evaluation to its result, including the wait for a free SUMO slot. session
+identifies the calibration (run_calibration() sets it), so a log directory can
+hold several calibrations. stages holds the time spent in each step of the
+evaluation pipeline (see profiling.py).
+
+load_evaluation_log() reads a log directory (or one file) into numpy columns;
+the parsed columns of each file are cached next to it, so loading a log of
+hundreds of thousands of evaluations again only parses the new records.
+iteration_pairs() rebuilds the per-iteration y_p/y_m of the SPSA runs that the
+1.py convergence plot used to parse from the console output.
+"""
+import glob
+import json
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+# "Run 1_iter3_p", "Restart 2_iter10_m4", "Run 1_gen5_2", "Restart 1_nm7_r", "Run 1_bo2_3"
+_RUN_ID = re.compile(r'^(?P<run>.+?)_(?:iter|gen|nm|bo)(?P<iteration>\d+)_(?P<candidate>\w+)$')
+
+# {(pid, directory): EvaluationLog}
+_evaluation_logs = {}
+_evaluation_logs_lock = threading.Lock()
+
+
+def parse_run_id(run_id):
+    """(run, iteration, sign) of an optimizer run id; sign is "p"/"m" for SPSA perturbations, else None."""
+    match = _RUN_ID.match(run_id)
+    if match is None:
+        return None, None, None
+    candidate = match.group('candidate')
+    sign = candidate[0] if re.fullmatch(r'[pm]\d*', candidate) else None
+    return match.group('run'), int(match.group('iteration')), sign
+
+
+def new_session_id(label=None):
+    session = time.strftime("%Y%m%d-%H%M%S")
+    return f"{session}-{label}" if label else session
+
+
+class EvaluationLog:
+    """Appends evaluation records to this process's JSONL file in a log directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, f"evaluations-{os.getpid()}.jsonl")
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, separators=(',', ':')) + "\n"
+        with self._lock:
+            # One write per record; the file is closed again so a crash loses at most the current line
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+
+def get_evaluation_log(project):
+    """Returns this process's evaluation log of the project (None if [evaluation_log] is disabled)."""
+    if not project.evaluation_log_dir:
+        return None
+    key = (os.getpid(), project.evaluation_log_dir)
+    with _evaluation_logs_lock:
+        log = _evaluation_logs.get(key)
+        if log is None:
+            log = EvaluationLog(project.evaluation_log_dir)
+            _evaluation_logs[key] = log
+    return log
+
+
+# Columns of the log, in the record order of one JSONL file
+_NUMERIC_COLUMNS = {'time': float, 'iteration': np.int64, 'seed': np.int64, 'rmse': float, 'wall_time_s': float,
+                    'returncode': np.int64}
+_TEXT_COLUMNS = ('session', 'run_id', 'run', 'sign', 'status')
+# Dict-valued fields, stored as (evaluations x names) arrays with the names in '<field>_names'
+_NAMED_COLUMNS = ('params', 'stages')
+# Version of the .columns.npz layout; a cache of another version is rebuilt
+_COLUMN_CACHE_VERSION = 2
+
+
+def _parse_lines(lines, file_path):
+    try:
+        # One json.loads for all lines is much faster than one per line
+        return json.loads("[" + ",".join(lines) + "]")
+    except json.JSONDecodeError:
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                print(f"WARNING: Skipping an invalid record in {file_path}.")
+        return records
+
+
+def _records_to_columns(records):
+    """Columns of parsed records; missing values are -1 (numbers), "" (text) or NaN (named columns)."""
+    columns = {}
+    for name, dtype in _NUMERIC_COLUMNS.items():
+        columns[name] = np.array([-1 if record.get(name) is None else record[name] for record in records], dtype=dtype)
+    for name in _TEXT_COLUMNS:
+        columns[name] = np.array(["" if record.get(name) is None else record[name] for record in records], dtype=str)
+    for name in _NAMED_COLUMNS:
+        names = []
+        for record in records:
+            names.extend(key for key in record.get(name) or {} if key not in names)
+        columns[f"{name}_names"] = np.array(names, dtype=str)
+        columns[name] = np.array([[(record.get(name) or {}).get(key, np.nan) for key in names] for record in records],
+                                 dtype=float).reshape(len(records), len(names))
+    return columns
+
+
+def _concatenate(parts):
+    """Joins column dicts, aligning the named columns (parameters, stages) by name."""
+    columns = {}
+    for name in list(_NUMERIC_COLUMNS) + list(_TEXT_COLUMNS):
+        columns[name] = np.concatenate([part[name] for part in parts]) if parts else np.empty(0)
+    for name in _NAMED_COLUMNS:
+        names = []
+        for part in parts:
+            names.extend(key for key in part[f"{name}_names"].tolist() if key not in names)
+        blocks = []
+        for part in parts:
+            aligned = np.full((len(part['rmse']), len(names)), np.nan)
+            for i, key in enumerate(part[f"{name}_names"].tolist()):
+                aligned[:, names.index(key)] = part[name][:, i]
+            blocks.append(aligned)
+        columns[f"{name}_names"] = np.array(names, dtype=str)
+        columns[name] = np.concatenate(blocks) if blocks else np.empty((0, 0))
+    return columns
+
+
+def _load_file(file_path):
+    """
+    Columns of one JSONL file. They are kept in a column cache next to it (<file>.columns.npz)
+    together with the number of bytes read, so a later load only parses the records appended since.
+    """
+    cache_path = file_path + ".columns.npz"
+    size = os.path.getsize(file_path)
+    offset, parts = 0, []
+    if os.path.exists(cache_path):
+        try:
+            with np.load(cache_path) as cached:
+                cached_columns = {name: cached[name] for name in cached.files}
+            if int(cached_columns['version']) == _COLUMN_CACHE_VERSION and int(cached_columns['offset']) <= size:
+                offset = int(cached_columns['offset'])
+                parts.append(cached_columns)
+        except Exception as e:
+            print(f"WARNING: Could not read {cache_path} ({e}). Reading {file_path} again.")
+    if offset == size and parts:
+        return parts[0]
+
+    with open(file_path, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    # A line that is still being written is left for the next load
+    complete = data[:data.rfind(b'\n') + 1]
+    lines = [line for line in complete.decode('utf-8').split('\n') if line]
+    parts.append(_records_to_columns(_parse_lines(lines, file_path)))
+    columns = _concatenate(parts)
+
+    try:
+        np.savez(cache_path + ".tmp.npz", version=_COLUMN_CACHE_VERSION, offset=offset + len(complete), **columns)
+        os.replace(cache_path + ".tmp.npz", cache_path)
+    except OSError as e:
+        print(f"WARNING: Could not write {cache_path} ({e}).")
+    return columns
+
+
+def load_evaluation_log(path, session="latest"):
+    """
+    Reads the records of a log directory (or one JSONL file) into columns, in time order.
+
+    session: only records of this session; "latest" (default) for the last calibration, None for all.
+
+    Returns a dict of numpy arrays 'time', 'session', 'run_id', 'run', 'iteration', 'sign', 'seed',
+    'rmse', 'wall_time_s', 'status', 'returncode' (missing values: "" and -1), 'params'
+    (evaluations x parameters) and 'stages' (evaluations x pipeline stages, seconds, NaN where a
+    stage did not run; see profiling.py), with the lists 'param_names' and 'stage_names'.
+    """
+    paths = sorted(glob.glob(os.path.join(path, "*.jsonl"))) if os.path.isdir(path) else [path]
+    columns = _concatenate([_load_file(file_path) for file_path in paths])
+
+    if session == "latest" and len(columns['time']):
+        session = columns['session'][np.argmax(columns['time'])]
+    selected = np.ones(len(columns['time']), dtype=bool) if session is None else columns['session'] == session
+    order = np.flatnonzero(selected)[np.argsort(columns['time'][selected], kind='stable')]
+    columns = {name: values if name.endswith('_names') else values[order] for name, values in columns.items()}
+    for name in _NAMED_COLUMNS:
+        columns[f"{name[:-1]}_names"] = columns.pop(f"{name}_names").tolist()
+    return columns
+
+
+def iteration_pairs(columns):
+    """
+    {run: {iteration: {'p': y_p, 'm': y_m}}} of the SPSA evaluations in loaded columns
+    (with several perturbations per iteration, the lowest y_p and y_m). Only measured RMSEs are used:
+    failed evaluations and the lower bounds of pruned ones are left out.
+    """
+    pairs = {}
+    selected = (columns['sign'] != "") & (columns['rmse'] < 1e9) & (columns['status'] != "pruned")
+    for run, iteration, sign, rmse in zip(columns['run'][selected].tolist(), columns['iteration'][selected].tolist(),
+                                          columns['sign'][selected].tolist(), columns['rmse'][selected].tolist()):
+        evals = pairs.setdefault(run, {}).setdefault(iteration, {})
+        evals[sign] = min(evals.get(sign, float('inf')), rmse)
+    return pairs
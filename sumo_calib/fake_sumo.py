@@ -0,0 +1,236 @@
+"""
+Deterministic stand-in for the sumo executable, for benchmarks without SUMO.
+
+The fake reads the same command line as sumo (-c, --route-files,
+--additional-files, --begin, --end, --seed, --step-length, --fcd-output,
+--tripinfo-output; other options are ignored) and, instead of simulating,
+writes the outputs SUMO would write:
+
+  - E1/E2 detector output (<interval .../> lines) for every detector of the
+    additional files, at the detector's freq/period and into its file=,
+  - optionally FCD and tripinfo output (also taken from <output> of the .sumocfg).
+
+The detector speeds follow a known analytic response surface of the vType
+parameters (response_speeds()): a congestion profile plus a signed effect
+of each parameter's distance to SURFACE_OPTIMUM whose weight differs between
+detectors and intervals, so the optimum is unique, plus Gaussian noise drawn
+from --seed. Same arguments, same output.
+
+Environment variables set the size and speed of the stand-in:
+    FAKE_SUMO_VEHICLES   vehicles in the FCD/tripinfo output (default 100)
+    FAKE_SUMO_DELAY      seconds to sleep, to mimic simulation time (default 0)
+    FAKE_SUMO_NOISE      standard deviation of the speed noise in m/s (default 0.3)
+
+write_launcher() creates an executable that runs this module; the benchmark
+(see benchmark.py) uses it as [scenario] sumo_binary.
+"""
+import os
+import re
+import stat
+import sys
+import time
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+# Optimum of the response surface and the distance that counts as "one unit" per parameter
+SURFACE_OPTIMUM = {
+    'accel': 2.2, 'decel': 3.8, 'tau': 1.3, 'maxSpeed': 31.0, 'minGap': 2.0,
+    'lcSpeedGain': 1.8, 'lcStrategic': 1.0, 'lcCooperative': 0.6, 'lcKeepRight': 0.5, 'lcAssertive': 1.2,
+    'speedFactor_mean': 1.05, 'speedFactor_std_dev': 0.12,
+}
+SURFACE_SCALE = {
+    'accel': 1.0, 'decel': 0.8, 'tau': 0.5, 'maxSpeed': 2.0, 'minGap': 0.8,
+    'lcSpeedGain': 1.5, 'lcStrategic': 1.5, 'lcCooperative': 0.4, 'lcKeepRight': 1.5, 'lcAssertive': 1.5,
+    'speedFactor_mean': 0.3, 'speedFactor_std_dev': 0.15,
+}
+# SUMO defaults, used for parameters the vType does not set
+SUMO_DEFAULTS = {
+    'accel': 2.6, 'decel': 4.5, 'tau': 1.0, 'maxSpeed': 55.55, 'minGap': 2.5,
+    'lcSpeedGain': 1.0, 'lcStrategic': 1.0, 'lcCooperative': 1.0, 'lcKeepRight': 1.0, 'lcAssertive': 1.0,
+    'speedFactor_mean': 1.0, 'speedFactor_std_dev': 0.1,
+}
+
+DETECTOR_TAGS = ('laneAreaDetector', 'e2Detector', 'inductionLoop', 'e1Detector')
+
+_NORMC = re.compile(r'normc\(([\d.]+),([\d.]+)')
+
+
+def response_speeds(params, num_detectors, begins, seed, noise=0.3, interval=60.0):
+    """
+    (detectors, intervals) mean speeds in m/s of the response surface for a parameter dict
+    (missing parameters are taken at their SUMO default), interval begin times and a seed.
+    The value of an interval depends only on its begin time, not on the other intervals asked for.
+    """
+    begins = np.asarray(begins, dtype=float)
+    d = np.arange(num_detectors, dtype=float)[:, None]
+    k = np.round(begins / interval).astype(int)
+    # Free-flow speed with a peak-hour dip half an hour into the simulation
+    speeds = 25.0 - 0.4 * d - 6.0 * np.exp(-((begins[None, :] - 1800.0) / 900.0) ** 2)
+    for i, name in enumerate(SURFACE_OPTIMUM):
+        z = (float(params.get(name, SUMO_DEFAULTS[name])) - SURFACE_OPTIMUM[name]) / SURFACE_SCALE[name]
+        weight = 1.0 + np.sin(1.7 * i + 0.35 * k[None, :] + 0.9 * d)
+        speeds = speeds + 1.5 * weight * np.tanh(z)
+    if noise and len(k):
+        # Drawn interval by interval, so a shorter horizon sees the same noise for its intervals
+        draws = np.random.default_rng(seed).normal(0.0, noise, (k.max() + 1, num_detectors)).T
+        speeds = speeds + draws[:, np.maximum(k, 0)]
+    return np.maximum(speeds, 0.5)
+
+
+def _option(args, name, default=None):
+    if name in args:
+        i = args.index(name)
+        if i + 1 < len(args):
+            return args[i + 1]
+    return default
+
+
+def _config_options(cfg_file):
+    """Options set in a .sumocfg (<input>/<output>/<time> entries with value=)."""
+    options = {}
+    try:
+        root = ET.parse(cfg_file).getroot()
+    except (OSError, ET.ParseError):
+        return options
+    for section in root:
+        for option in section:
+            if option.get('value') is not None:
+                options[option.tag] = option.get('value')
+    return options
+
+
+def _vtype_params(paths, vtype_attribute_names=tuple(SUMO_DEFAULTS)):
+    """Calibrated parameters of the first vType of each file; later files override earlier ones."""
+    params = {}
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        try:
+            root = ET.parse(path).getroot()
+        except ET.ParseError:
+            continue
+        for vtype in root.iter('vType'):
+            for name in vtype_attribute_names:
+                if vtype.get(name) is not None:
+                    params[name] = float(vtype.get(name))
+            match = _NORMC.match(vtype.get('speedFactor', ''))
+            if match:
+                params['speedFactor_mean'] = float(match.group(1))
+                params['speedFactor_std_dev'] = float(match.group(2))
+            break
+    return params
+
+
+def _detectors(additional_files):
+    """[(id, period, output path)] of the E1/E2 detectors in the additional files."""
+    detectors = []
+    for path in additional_files:
+        if not os.path.exists(path):
+            continue
+        try:
+            root = ET.parse(path).getroot()
+        except ET.ParseError:
+            continue
+        for elem in root.iter():
+            if elem.tag in DETECTOR_TAGS and elem.get('file'):
+                period = float(elem.get('freq') or elem.get('period') or 60)
+                detectors.append((elem.get('id'), period, os.path.join(os.path.dirname(path), elem.get('file'))))
+    return detectors
+
+
+def write_detector_output(path, detector_ids, begins, period, speeds, vehicles=10):
+    """Writes SUMO-style detector output; speeds is (detectors, intervals) in m/s."""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<detector>\n')
+        for t, begin in enumerate(begins):
+            lines = [f'    <interval begin="{begin:.2f}" end="{begin + period:.2f}" id="{det_id}" '
+                     f'sampledSeconds="{vehicles * period / 4:.2f}" nVehEntered="{vehicles}" '
+                     f'meanSpeed="{speeds[i, t]:.2f}" occupancy="12.50" maxJamLengthInMeters="0.00"/>\n'
+                     for i, det_id in enumerate(detector_ids)]
+            f.writelines(lines)
+        f.write('</detector>\n')
+
+
+def _write_vehicle_outputs(fcd_file, tripinfo_file, num_vehicles, begin, end, step_length, seed):
+    rng = np.random.default_rng(seed + 1)
+    departs = np.sort(rng.uniform(begin, max(begin, end - 1), num_vehicles))
+    travel_times = rng.uniform(120.0, 300.0, num_vehicles)
+    if tripinfo_file:
+        with open(tripinfo_file, 'w', encoding='utf-8') as f:
+            f.write('<tripinfos>\n')
+            f.writelines(f'    <tripinfo id="veh{v}" depart="{departs[v]:.2f}" arrival="{departs[v] + travel_times[v]:.2f}" '
+                         f'duration="{travel_times[v]:.2f}" routeLength="{travel_times[v] * 20:.2f}" '
+                         f'waitingTime="0.00" timeLoss="{travel_times[v] * 0.1:.2f}" vType="passenger"/>\n'
+                         for v in range(num_vehicles))
+            f.write('</tripinfos>\n')
+    if fcd_file:
+        with open(fcd_file, 'w', encoding='utf-8') as f:
+            f.write('<fcd-export>\n')
+            for t in np.arange(begin, end, step_length):
+                active = np.flatnonzero((departs <= t) & (t < departs + travel_times))
+                f.write(f'    <timestep time="{t:.2f}">\n')
+                f.writelines(f'        <vehicle id="veh{v}" x="{(t - departs[v]) * 20:.2f}" y="0.00" angle="90.00" '
+                             f'type="passenger" speed="20.00" pos="{(t - departs[v]) * 20:.2f}" lane="E1_0" '
+                             f'slope="0.00"/>\n' for v in active)
+                f.write('    </timestep>\n')
+            f.write('</fcd-export>\n')
+
+
+def main(argv=None):
+    args = list(sys.argv[1:] if argv is None else argv)
+    config = _config_options(_option(args, '-c')) if _option(args, '-c') else {}
+    begin = float(_option(args, '--begin', config.get('begin', 0)))
+    end = float(_option(args, '--end', config.get('end', 3600)))
+    seed = int(_option(args, '--seed', config.get('seed', 23423)))
+    step_length = float(_option(args, '--step-length', config.get('step-length', 1)))
+    additional_files = [p for p in _option(args, '--additional-files', config.get('additional-files', '')).split(',') if p]
+    route_files = [p for p in _option(args, '--route-files', config.get('route-files', '')).split(',') if p]
+
+    delay = float(os.environ.get('FAKE_SUMO_DELAY', 0))
+    if delay:
+        time.sleep(delay)
+
+    # Additional files are loaded before the routes, so a vType there wins over the route file's
+    params = _vtype_params(route_files + additional_files)
+    detectors = _detectors(additional_files)
+    noise = float(os.environ.get('FAKE_SUMO_NOISE', 0.3))
+    outputs = {}
+    for det_id, period, path in detectors:
+        outputs.setdefault((path, period), []).append(det_id)
+    for (path, period), detector_ids in outputs.items():
+        begins = np.arange(begin, end, period)
+        speeds = response_speeds(params, len(detector_ids), begins, seed, noise, period)
+        write_detector_output(path, detector_ids, begins, period, speeds)
+
+    fcd_file = _option(args, '--fcd-output', config.get('fcd-output'))
+    tripinfo_file = _option(args, '--tripinfo-output', config.get('tripinfo-output'))
+    if fcd_file or tripinfo_file:
+        _write_vehicle_outputs(fcd_file, tripinfo_file, int(os.environ.get('FAKE_SUMO_VEHICLES', 100)),
+                               begin, end, step_length, seed)
+    return 0
+
+
+def write_launcher(directory):
+    """Writes an executable that runs this stand-in (fake_sumo, or fake_sumo.cmd on Windows); returns its path."""
+    os.makedirs(directory, exist_ok=True)
+    package_parent = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if os.name == 'nt':
+        path = os.path.join(directory, "fake_sumo.cmd")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(f'@set "PYTHONPATH={package_parent};%PYTHONPATH%"\n'
+                    f'@"{sys.executable}" -m sumo_calib.fake_sumo %*\n')
+        return path
+    path = os.path.join(directory, "fake_sumo")
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"#!{sys.executable}\n"
+                f"import sys\n"
+                f"sys.path.insert(0, {package_parent!r})\n"
+                f"from sumo_calib.fake_sumo import main\n"
+                f"sys.exit(main())\n")
+    os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+    return path
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""
+In-process SUMO engine (libsumo, or a persistent TraCI connection) for calibration evaluations.
+
+With [simulation] engine = "libsumo" (or "traci") each worker process starts SUMO
+once and resets it for every evaluation with load(), instead of starting a new
+sumo process per evaluation. The calibrated vType is loaded from the same patched
+vType file (or patched warm-start state) as the subprocess engine writes, so
+lane-change parameters and the speedFactor normc bounds are applied exactly as
+there; the vehicletype API cannot do that (its setParameter only stores generic
+parameters, and setSpeedFactor would not use [scenario] speedfactor bounds). The
+detector speeds are read from the detectors step by step (no detector XML is
+parsed), and the simulation is only run to the end of the calibration window.
+
+libsumo can only hold one simulation per process, so parallel evaluations use
+ProcessPoolExecutor workers (see calibration.make_eval_executor). An in-process
+run cannot be killed by [parallel] timeout_s.
+"""
+import os
+import sys
+import threading
+import traceback
+
+from multiprocessing import util as mp_util
+
+import numpy as np
+
+from sumo_calib.profiling import span
+from sumo_calib.pruning import EvaluationPruned
+from sumo_calib.route_template import get_route_template
+from sumo_calib.workspace import get_scenario_workspace
+
+ENGINES = ("subprocess", "libsumo", "traci")
+
+# The patched saved state of a warm-started run, written into the worker's slot
+WARM_START_STATE_NAME = "warm_start_state.xml"
+
+# {(pid, project path, engine): InProcessSimulation}
+_simulations = {}
+_simulations_lock = threading.Lock()
+
+
+def import_sumo_api(engine):
+    """Imports libsumo or traci, adding $SUMO_HOME/tools to sys.path if needed."""
+    module_name = "libsumo" if engine == "libsumo" else "traci"
+    try:
+        return __import__(module_name)
+    except ImportError:
+        sumo_home = os.environ.get('SUMO_HOME')
+        if not sumo_home:
+            raise ImportError(f"{module_name} not found. Install it (pip install {module_name}) or set SUMO_HOME.")
+        sys.path.append(os.path.join(sumo_home, 'tools'))
+        return __import__(module_name)
+
+
+class InProcessSimulation:
+    """One SUMO instance of a project, kept loaded in this process and reset with load() per evaluation."""
+
+    def __init__(self, project):
+        self.project = project
+        self.sim = import_sumo_api(project.simulation_engine)
+        # The demand without the calibrated vType is loaded; the vType comes from the per-run vType file
+        self.route_template = get_route_template(project.route_file, project.vtype_id,
+                                                 project.speedfactor_default_bounds)
+        workspace = get_scenario_workspace([project.net_file, project.detector_file,
+                                            self.route_template.demand_file])
+        self.run_dir = workspace.acquire_slot()  # kept for the life of the process
+        self.started = False
+        self._detectors = None
+        # Closed before the workspace is removed, also inside ProcessPoolExecutor workers
+        mp_util.Finalize(self, InProcessSimulation.close, args=(self,), exitpriority=20)
+
+    def _write_inputs(self, param_values_dict, state=None):
+        """Writes this run's vType file (or the patched saved state); returns (additional files, extra options)."""
+        project = self.project
+        detector_file = os.path.join(self.run_dir, os.path.basename(project.detector_file))
+        if state is not None:
+            # The vType is part of the saved state, so it is patched there (like the subprocess engine)
+            state_file = os.path.join(self.run_dir, WARM_START_STATE_NAME)
+            state.write(state_file, self.route_template.vtype_attributes(param_values_dict))
+            return [detector_file], ["--load-state", state_file, "--begin", str(state.time)]
+        vtype_file = os.path.join(self.run_dir, project.vtype_additional_name)
+        self.route_template.write_vtype_additional(vtype_file, param_values_dict)
+        return [vtype_file, detector_file], []
+
+    def _options(self, param_values_dict, sim_seed, end_time, state=None):
+        project = self.project
+        additional_files, extra_options = self._write_inputs(param_values_dict, state)
+        return [
+            "-c", project.sumo_cfg_file,
+            "--route-files", os.path.join(self.run_dir, os.path.basename(self.route_template.demand_file)),
+            "--additional-files", ",".join(additional_files),
+            "--end", str(end_time),
+            "--seed", str(sim_seed),
+            "--time-to-teleport", str(project.time_to_teleport),
+            "--step-length", str(project.step_length),
+            "--no-warnings", "true",
+            "--no-step-log", "true",
+            "--verbose", "false",
+        ] + extra_options
+
+    def reset(self, param_values_dict, sim_seed, end_time, state=None):
+        """Starts SUMO on first use, afterwards reloads the scenario with the new vType, seed (and warm-start state)."""
+        options = self._options(param_values_dict or {}, sim_seed, end_time, state)
+        if self.started:
+            self.sim.load(options)
+        else:
+            self.sim.start([self.project.sumo_path] + options)
+            self.started = True
+
+    def close(self):
+        if self.started:
+            try:
+                self.sim.close()
+            except Exception:
+                pass
+            self.started = False
+
+    def _detector_domains(self, detector_ids):
+        """[(domain, detector id)] for E2 (lanearea) and E1 (inductionloop) detectors."""
+        if self._detectors is None:
+            lanearea_ids = set(self.sim.lanearea.getIDList())
+            induction_loop_ids = set(self.sim.inductionloop.getIDList())
+            detectors = []
+            for det_id in detector_ids:
+                if det_id in lanearea_ids:
+                    detectors.append((self.sim.lanearea, det_id))
+                elif det_id in induction_loop_ids:
+                    detectors.append((self.sim.inductionloop, det_id))
+                else:
+                    raise ValueError(f"Detector '{det_id}' is not defined in {self.project.detector_file}.")
+            self._detectors = detectors
+        return self._detectors
+
+    def run(self, param_values_dict, sim_seed, begin, interval, num_intervals, detector_ids, state=None,
+            pruner=None):
+        """
+        Runs one simulation up to the end of the window and returns the (detectors, intervals)
+        mean speeds in m/s of the intervals [begin + k * interval, ...), NaN where no vehicle was measured.
+        The mean is weighted by the vehicles on the detector per step, like meanSpeed of the XML output.
+        With a warm-start state the simulation starts at the end of the warm-up from the state with the
+        patched vType, so the parameters also apply to the vehicles already in the network.
+        With a pruning.StreamingPruner the speeds so far are checked after every interval; its
+        EvaluationPruned stops the run.
+        """
+        window_end = begin + interval * num_intervals
+        with span('sumo_load'):
+            self.reset(param_values_dict, sim_seed, window_end, state)
+            detectors = self._detector_domains(detector_ids)
+        with span('simulation'):
+            return self._simulate(detectors, begin, interval, num_intervals, pruner)
+
+    def _simulate(self, detectors, begin, interval, num_intervals, pruner):
+        window_end = begin + interval * num_intervals
+        speed_sums = np.zeros((len(detectors), num_intervals))
+        vehicle_steps = np.zeros((len(detectors), num_intervals))
+        simulation = self.sim.simulation
+        # The warm-up is simulated without reading the detectors
+        if begin > simulation.getTime():
+            self.sim.simulationStep(begin)
+        t = simulation.getTime()
+        while t < window_end:
+            self.sim.simulationStep()
+            k = int((t - begin) // interval)
+            for d, (domain, det_id) in enumerate(detectors):
+                vehicle_count = domain.getLastStepVehicleNumber(det_id)
+                if vehicle_count > 0:
+                    speed_sums[d, k] += domain.getLastStepMeanSpeed(det_id) * vehicle_count
+                    vehicle_steps[d, k] += vehicle_count
+            t = simulation.getTime()
+            if pruner is not None and int((t - begin) // interval) > k:
+                # Interval k is complete
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    pruner.check(np.where(vehicle_steps > 0, speed_sums / vehicle_steps, np.nan), begin + (k + 1) * interval)
+
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(vehicle_steps > 0, speed_sums / vehicle_steps, np.nan)
+
+
+def get_in_process_simulation(project):
+    """Returns this process's in-process SUMO instance for the project, creating it on first use."""
+    key = (os.getpid(), project.path, project.simulation_engine)
+    with _simulations_lock:
+        simulation = _simulations.get(key)
+        if simulation is None:
+            simulation = InProcessSimulation(project)
+            _simulations[key] = simulation
+    return simulation
+
+
+def run_in_process(project, param_values_dict, sim_seed, begin, interval, num_intervals, detector_ids,
+                   run_label="eval", state=None, pruner=None):
+    """
+    InProcessSimulation.run() for this process's instance; returns None (and resets SUMO) on failure.
+    EvaluationPruned of the pruner is passed on; SUMO is simply reloaded for the next run.
+    """
+    try:
+        simulation = get_in_process_simulation(project)
+    except Exception as e:
+        print(f"ERROR [{run_label}]: Failed to set up the {project.simulation_engine} engine: {e}")
+        return None
+    try:
+        return simulation.run(param_values_dict, sim_seed, begin, interval, num_intervals, detector_ids, state,
+                              pruner)
+    except EvaluationPruned:
+        raise
+    except Exception as e:
+        print(f"ERROR [{run_label}]: {project.simulation_engine} simulation failed: {e}")
+        traceback.print_exc()
+        # SUMO is restarted from scratch on the next evaluation
+        simulation.close()
+        return None
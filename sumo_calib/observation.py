@@ -0,0 +1,88 @@
+"""
+Vectorized scoring of simulated detector speeds against observation points.
+
+Each observation point covers a set of detectors and a time window. Observation
+windows follow each other without gaps, starting at the calibration start time.
+The windows are turned into index ranges on the detector time grid once.
+Scoring a run then needs one cumulative sum over time and one masked sum
+over detectors, however many points there are.
+"""
+import numpy as np
+
+
+class ObservationWindows:
+    """Observation points precomputed as (points x detectors) masks and [start, end) index ranges."""
+
+    def __init__(self, observed_data_points, detector_ids, start_time, interval_begins):
+        self.detector_ids = list(detector_ids)
+        self.interval_begins = np.asarray(interval_begins, dtype=float)
+        det_index = {det_id: i for i, det_id in enumerate(self.detector_ids)}
+
+        num_points = len(observed_data_points)
+        durations = np.array([point['duration_s'] for point in observed_data_points], dtype=float)
+        # Each observation starts where the previous one ended (or at start_time for the first one)
+        self.window_end_times = start_time + np.cumsum(durations)
+        self.window_start_times = self.window_end_times - durations
+        self.observed_speeds_ms = np.array([point['observed_speed_ms'] for point in observed_data_points], dtype=float)
+
+        # A fine-grained interval belongs to a window if its *start* lies within [start, end)
+        self.start_index = np.searchsorted(self.interval_begins, self.window_start_times, side='left')
+        self.end_index = np.searchsorted(self.interval_begins, self.window_end_times, side='left')
+
+        self.point_detectors = np.zeros((num_points, len(self.detector_ids)))
+        # (point index, detector id) pairs whose detector is not in detector_ids
+        self.unknown_detectors = []
+        for i, point in enumerate(observed_data_points):
+            for det_id in point['location_detector_ids']:
+                if det_id in det_index:
+                    self.point_detectors[i, det_index[det_id]] = 1.0
+                else:
+                    self.unknown_detectors.append((i, det_id))
+
+    def __len__(self):
+        return len(self.observed_speeds_ms)
+
+    def aggregate(self, speeds):
+        """
+        speeds: (detectors, intervals) array on interval_begins, NaN where no valid value exists.
+        Returns (point_means, window_counts): the mean of all valid speeds of each point's detectors
+        within its window (NaN if there are none), and the (points x detectors) counts of valid values
+        in each point's window.
+        """
+        valid = ~np.isnan(speeds)
+        zero_padded = np.zeros((speeds.shape[0], 1))
+        # Cumulative sums along time, so every window sum is a difference of two columns
+        cum_sums = np.hstack([zero_padded, np.cumsum(np.where(valid, speeds, 0.0), axis=1)])
+        cum_counts = np.hstack([zero_padded, np.cumsum(valid, axis=1)])
+
+        window_sums = (cum_sums[:, self.end_index] - cum_sums[:, self.start_index]).T  # (points, detectors)
+        window_counts = (cum_counts[:, self.end_index] - cum_counts[:, self.start_index]).T
+
+        point_sums = np.sum(self.point_detectors * window_sums, axis=1)
+        point_counts = np.sum(self.point_detectors * window_counts, axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            point_means = np.where(point_counts > 0, point_sums / point_counts, np.nan)
+        return point_means, window_counts
+
+    def squared_errors(self, speeds, missing_penalty_factor=5.0):
+        """
+        Returns (squared_errors, point_means, window_counts). Points without any simulated data are
+        penalized with (observed speed * missing_penalty_factor) ** 2.
+        """
+        point_means, window_counts = self.aggregate(speeds)
+        squared_errors = np.where(np.isnan(point_means),
+                                  (self.observed_speeds_ms * missing_penalty_factor) ** 2,
+                                  (point_means - self.observed_speeds_ms) ** 2)
+        return squared_errors, point_means, window_counts
+
+    def partial_squared_error_sum(self, speeds, time_reached):
+        """
+        Sum of the squared errors of the points whose windows end by time_reached (speeds after it
+        may be missing). The other points can only add to it, so sqrt(sum / len(self)) is a lower
+        bound of the final RMSE.
+        """
+        complete = self.window_end_times <= time_reached
+        if not complete.any():
+            return 0.0
+        squared_errors, _, _ = self.squared_errors(speeds)
+        return float(np.sum(squared_errors[complete]))
@@ -0,0 +1,429 @@
+"""
+Optimizers for the calibration, all evaluated through the same engine.
+
+[optimizer] method selects what run_calibration() runs in each restart:
+  - "spsa": run_spsa_calibration() (see spsa.py)
+  - "cmaes": CMA-ES; each generation (the whole population) is evaluated in parallel
+  - "nelder_mead": Nelder-Mead simplex; reflection, expansion and both contractions
+    of a step are evaluated together, shrink steps as one batch
+  - "bayesian": Gaussian-process Bayesian optimization (GP from surrogate.py) with
+    batches of lower-confidence-bound candidates
+
+Every evaluation goes through one EvaluationTracker: parameters are clipped to
+the bounds, the batches are evaluated with evaluate_parameter_sets() (serially
+or in the executor), and the number of SUMO evaluations, the wall-clock time
+and the best error after each batch are recorded. With [optimizer] target_rmse
+it also records after how many evaluations (and seconds) the target was first
+reached, so the optimizers can be compared per site. The tracker is shared by
+restarts running at the same time (each with its own executor), so it is also
+the merged best-so-far record of parallel restarts. With [pruning] enabled it
+passes the best error so far to the evaluations, which stop simulations that can
+no longer beat it (see pruning.py).
+
+CMA-ES, Nelder-Mead and the Bayesian optimizer work on the parameters scaled
+to [0, 1] and return the same tuple as run_spsa_calibration().
+"""
+import copy
+import threading
+import time
+
+import numpy as np
+
+from sumo_calib.pruning import is_measured
+from sumo_calib.spsa import evaluate_parameter_sets, run_spsa_calibration
+from sumo_calib.surrogate import GaussianProcessSurrogate
+
+OPTIMIZERS = ("spsa", "cmaes", "nelder_mead", "bayesian")
+
+OPTIMIZER_LABELS = {
+    'spsa': "SPSA",
+    'cmaes': "CMA-ES",
+    'nelder_mead': "Nelder-Mead",
+    'bayesian': "Bayesian",
+}
+
+
+class EvaluationTracker:
+    """Shared evaluation path of the optimizers: bounds, counting, convergence history and time to target."""
+
+    def __init__(self, objective_func, bounds, executor=None, target_error=None, prune_margin=None):
+        self.objective_func = objective_func
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.executor = executor
+        self.target_error = target_error
+        # Evaluations are stopped early above best_error * (1 + prune_margin) (None: never)
+        self.prune_margin = prune_margin
+        self.start_time = time.time()
+        self.num_evaluations = 0
+        self.best_error = float('inf')
+        self.best_params = None
+        # (evaluations so far, seconds since start, best error so far) after each batch
+        self.history = []
+        self.evaluations_to_target = None
+        self.time_to_target = None
+        self._lock = threading.Lock()
+
+    @property
+    def prune_above(self):
+        if self.prune_margin is None or self.best_error >= 1e9:
+            return None
+        return self.best_error * (1 + self.prune_margin)
+
+    def clip(self, params):
+        return np.clip(np.asarray(params, dtype=float), self.bounds[:, 0], self.bounds[:, 1])
+
+    def evaluate(self, param_sets, run_ids, sim_seeds, executor=None):
+        """
+        Evaluates a batch of parameter vectors (clipped to the bounds) in executor (default: the tracker's)
+        and returns their errors.
+        """
+        param_sets = [self.clip(params) for params in param_sets]
+        errors = evaluate_parameter_sets(self.objective_func, param_sets, run_ids, sim_seeds,
+                                         executor=executor or self.executor, prune_above=self.prune_above)
+        with self._lock:
+            elapsed = time.time() - self.start_time
+            for params, error in zip(param_sets, errors):
+                self.num_evaluations += 1
+                if not is_measured(error):
+                    continue
+                if error < self.best_error:
+                    self.best_error = error
+                    self.best_params = np.copy(params)
+                if self.evaluations_to_target is None and self.target_error is not None and error <= self.target_error:
+                    self.evaluations_to_target = self.num_evaluations
+                    self.time_to_target = elapsed
+            self.history.append((self.num_evaluations, elapsed, self.best_error))
+        return errors
+
+    def state(self):
+        """Counters and history for a checkpoint (see checkpoint.py)."""
+        with self._lock:
+            return {'num_evaluations': self.num_evaluations, 'elapsed': self.elapsed, 'best_error': self.best_error,
+                    'best_params': self.best_params, 'history': list(self.history),
+                    'evaluations_to_target': self.evaluations_to_target, 'time_to_target': self.time_to_target}
+
+    def restore(self, state):
+        """Continues the counters of a checkpoint; the wall-clock time runs on from the saved value."""
+        with self._lock:
+            self.start_time = time.time() - state['elapsed']
+            for name in ('num_evaluations', 'best_error', 'best_params', 'history', 'evaluations_to_target',
+                         'time_to_target'):
+                setattr(self, name, state[name])
+
+    @property
+    def elapsed(self):
+        return time.time() - self.start_time
+
+    def report(self):
+        return {
+            'num_evaluations': self.num_evaluations,
+            'wall_time': self.elapsed,
+            'best_error': self.best_error,
+            'target_error': self.target_error,
+            'evaluations_to_target': self.evaluations_to_target,
+            'time_to_target': self.time_to_target,
+        }
+
+    def print_report(self, label):
+        print(f"{label}: {self.num_evaluations} SUMO evaluations in {self.elapsed:.1f} s, "
+              f"best RMSE {self.best_error:.4f} m/s")
+        if self.target_error is not None:
+            if self.evaluations_to_target is None:
+                print(f"  Target RMSE {self.target_error} m/s not reached.")
+            else:
+                print(f"  Target RMSE {self.target_error} m/s reached after {self.evaluations_to_target} evaluations "
+                      f"({self.time_to_target:.1f} s).")
+
+
+def latin_hypercube(bounds, num_points, rng):
+    """num_points points inside the bounds, one in each of num_points equal strata of every parameter."""
+    bounds = np.asarray(bounds, dtype=float)
+    n = len(bounds)
+    strata = np.column_stack([rng.permutation(num_points) for _ in range(n)])
+    unit = (strata + rng.uniform(size=(num_points, n))) / num_points
+    return bounds[:, 0] + unit * (bounds[:, 1] - bounds[:, 0])
+
+
+def _draw_seeds(rng, count):
+    # Seeds are drawn in the driver (as in SPSA), so serial and parallel runs match
+    return [int(seed) for seed in rng.integers(1, 100001, size=count)]
+
+
+class _Run:
+    """Per-run bookkeeping shared by the scaled-space optimizers (best of this run, per-iteration history)."""
+
+    def __init__(self, tracker, bounds, run_name, rng, executor=None):
+        self.tracker = tracker
+        self.executor = executor
+        self.lower = np.asarray(bounds, dtype=float)[:, 0]
+        self.span = np.asarray(bounds, dtype=float)[:, 1] - self.lower
+        self.run_name = run_name
+        self.rng = rng
+        self.best_error = float('inf')
+        self.best_params = None
+        self.num_evaluations = 0
+        self.error_history = []
+        self.iteration_times = []
+        self._iteration_start = time.time()
+
+    def to_params(self, x):
+        return self.lower + np.clip(x, 0.0, 1.0) * self.span
+
+    def to_scaled(self, params):
+        span = np.where(self.span == 0, 1.0, self.span)
+        return (np.asarray(params, dtype=float) - self.lower) / span
+
+    def evaluate(self, xs, run_ids):
+        """Evaluates scaled points (rows) as one batch; returns a numpy array of errors."""
+        param_sets = [self.to_params(x) for x in xs]
+        errors = self.tracker.evaluate(param_sets, run_ids, _draw_seeds(self.rng, len(param_sets)), self.executor)
+        self.num_evaluations += len(param_sets)
+        for params, error in zip(param_sets, errors):
+            if is_measured(error) and error < self.best_error:
+                self.best_error = error
+                self.best_params = np.copy(params)
+        return np.asarray(errors, dtype=float)
+
+    def end_iteration(self, k, max_iterations, label="Iteration"):
+        self.error_history.append(self.best_error)
+        self.iteration_times.append(time.time() - self._iteration_start)
+        self._iteration_start = time.time()
+        if (k + 1) % 10 == 0 or k == max_iterations - 1 or k == 0:
+            print(f"  {self.run_name} {label} {k+1}/{max_iterations}: Best Error Found So Far in {self.run_name}="
+                  f"{self.best_error:.4f} m/s, Evaluations={self.tracker.num_evaluations}, "
+                  f"Iteration Time={self.iteration_times[-1]:.1f} s")
+
+    def result(self, final_x):
+        best_params = self.best_params if self.best_params is not None else self.to_params(final_x)
+        return self.to_params(final_x), best_params, self.best_error, self.error_history, self.iteration_times
+
+
+# --- CMA-ES ---
+def run_cmaes(tracker, initial_params, bounds, max_evaluations, run_seed=None, run_name="Run",
+              population_size=None, sigma0=0.3, executor=None):
+    """
+    CMA-ES (rank-mu and rank-one update, cumulative step-size adaptation) on the scaled parameters.
+    Samples outside [0, 1] are repaired to the bounds before they are evaluated and used in the update.
+    """
+    rng = np.random.default_rng(run_seed)
+    run = _Run(tracker, bounds, run_name, rng, executor)
+    n = len(initial_params)
+    lam = population_size or 4 + int(3 * np.log(n))
+    mu = lam // 2
+    weights = np.log(mu + 0.5) - np.log(np.arange(1, mu + 1))
+    weights /= weights.sum()
+    mueff = 1.0 / np.sum(weights ** 2)
+    cc = (4 + mueff / n) / (n + 4 + 2 * mueff / n)
+    cs = (mueff + 2) / (n + mueff + 5)
+    c1 = 2 / ((n + 1.3) ** 2 + mueff)
+    cmu = min(1 - c1, 2 * (mueff - 2 + 1 / mueff) / ((n + 2) ** 2 + mueff))
+    damps = 1 + 2 * max(0.0, np.sqrt((mueff - 1) / (n + 1)) - 1) + cs
+    chi_n = np.sqrt(n) * (1 - 1 / (4 * n) + 1 / (21 * n ** 2))
+
+    mean = np.clip(run.to_scaled(initial_params), 0.0, 1.0)
+    sigma = sigma0
+    pc = np.zeros(n)
+    ps = np.zeros(n)
+    C = np.eye(n)
+    generations = max(1, max_evaluations // lam)
+
+    print(f"\n--- Starting CMA-ES Run: {run_name} (population {lam}, {generations} generations) ---")
+    for g in range(generations):
+        eigenvalues, B = np.linalg.eigh(C)
+        D = np.sqrt(np.maximum(eigenvalues, 1e-20))
+        z = rng.standard_normal((lam, n))
+        x = np.clip(mean + sigma * (z * D) @ B.T, 0.0, 1.0)
+        y = (x - mean) / sigma
+
+        # The whole population is one batch, evaluated concurrently in the executor
+        errors = run.evaluate(x, [f"{run_name}_gen{g+1}_{i+1}" for i in range(lam)])
+        selected = y[np.argsort(errors, kind='stable')[:mu]]
+        y_w = weights @ selected
+        mean = mean + sigma * y_w
+
+        inv_sqrt_C = B @ np.diag(1 / D) @ B.T
+        ps = (1 - cs) * ps + np.sqrt(cs * (2 - cs) * mueff) * inv_sqrt_C @ y_w
+        hsig = np.linalg.norm(ps) / np.sqrt(1 - (1 - cs) ** (2 * (g + 1))) / chi_n < 1.4 + 2 / (n + 1)
+        pc = (1 - cc) * pc + hsig * np.sqrt(cc * (2 - cc) * mueff) * y_w
+        C = ((1 - c1 - cmu) * C
+             + c1 * (np.outer(pc, pc) + (1 - hsig) * cc * (2 - cc) * C)
+             + cmu * (selected.T * weights) @ selected)
+        sigma = min(sigma * np.exp((cs / damps) * (np.linalg.norm(ps) / chi_n - 1)), 1.0)
+        run.end_iteration(g, generations, "Generation")
+
+    print(f"--- CMA-ES Run {run_name} Finished (mean generation time {np.mean(run.iteration_times):.1f} s) ---")
+    return run.result(mean)
+
+
+# --- Nelder-Mead ---
+def run_nelder_mead(tracker, initial_params, bounds, max_evaluations, run_seed=None, run_name="Run",
+                    initial_step=0.1, executor=None):
+    """
+    Nelder-Mead on the scaled parameters. The reflection, expansion and the outside and inside
+    contraction of each step are evaluated as one batch (4 simulations at the same time), the
+    points of a shrink step as another. No step is started whose batches could go past max_evaluations
+    (only the initial simplex of n + 1 points is always evaluated).
+    """
+    rng = np.random.default_rng(run_seed)
+    run = _Run(tracker, bounds, run_name, rng, executor)
+    n = len(initial_params)
+    x0 = np.clip(run.to_scaled(initial_params), 0.0, 1.0)
+    simplex = [x0]
+    for i in range(n):
+        vertex = np.copy(x0)
+        # Step away from the nearer bound, so the vertex stays inside [0, 1]
+        vertex[i] += initial_step if x0[i] + initial_step <= 1.0 else -initial_step
+        simplex.append(vertex)
+    simplex = np.array(simplex)
+    values = run.evaluate(simplex, [f"{run_name}_nm0_{i+1}" for i in range(n + 1)])
+    max_steps = max(1, (max_evaluations - (n + 1)) // 4)
+
+    print(f"\n--- Starting Nelder-Mead Run: {run_name} ---")
+    for k in range(max_steps):
+        if run.num_evaluations + 4 > max_evaluations:
+            break
+        order = np.argsort(values, kind='stable')
+        simplex, values = simplex[order], values[order]
+        centroid = simplex[:-1].mean(axis=0)
+        direction = centroid - simplex[-1]
+        candidates = np.clip(np.array([centroid + direction,          # reflection
+                                       centroid + 2.0 * direction,    # expansion
+                                       centroid + 0.5 * direction,    # outside contraction
+                                       centroid - 0.5 * direction]),  # inside contraction
+                             0.0, 1.0)
+        f_r, f_e, f_oc, f_ic = run.evaluate(candidates, [f"{run_name}_nm{k+1}_{name}"
+                                                         for name in ("r", "e", "oc", "ic")])
+        replacement = None
+        if f_r < values[0]:
+            replacement = (candidates[1], f_e) if f_e < f_r else (candidates[0], f_r)
+        elif f_r < values[-2]:
+            replacement = (candidates[0], f_r)
+        elif f_r < values[-1] and f_oc <= f_r:
+            replacement = (candidates[2], f_oc)
+        elif f_r >= values[-1] and f_ic < values[-1]:
+            replacement = (candidates[3], f_ic)
+
+        if replacement is not None:
+            simplex[-1], values[-1] = replacement
+        elif run.num_evaluations + n > max_evaluations:
+            # The n points of a shrink step do not fit into the budget any more
+            run.end_iteration(k, max_steps, "Step")
+            break
+        else:
+            # Shrink towards the best vertex
+            simplex[1:] = simplex[0] + 0.5 * (simplex[1:] - simplex[0])
+            values[1:] = run.evaluate(simplex[1:], [f"{run_name}_nm{k+1}_s{i+1}" for i in range(n)])
+        run.end_iteration(k, max_steps, "Step")
+
+    best = simplex[int(np.argmin(values))]
+    mean_step_time = np.mean(run.iteration_times) if run.iteration_times else 0.0
+    print(f"--- Nelder-Mead Run {run_name} Finished (mean step time {mean_step_time:.1f} s) ---")
+    return run.result(best)
+
+
+# --- Bayesian optimization ---
+def run_bayesian(tracker, initial_params, bounds, max_evaluations, run_seed=None, run_name="Run",
+                 initial_points=10, batch_size=1, kappa=2.0, num_candidates=2000, executor=None):
+    """
+    Bayesian optimization with the Gaussian process of surrogate.py. After initial_points - 1 Latin
+    hypercube points (plus the initial parameters), each iteration picks batch_size candidates with the lowest
+    lower confidence bound (mean - kappa * std); the points of a batch are chosen one after another
+    with the already chosen ones added at their predicted value ("kriging believer"), so the batch
+    is spread out and evaluated concurrently. The initial points and the batches stay within max_evaluations
+    (the last batch is cut to the remaining evaluations); the initial parameters are always evaluated.
+    """
+    rng = np.random.default_rng(run_seed)
+    run = _Run(tracker, bounds, run_name, rng, executor)
+    n = len(initial_params)
+    unit_bounds = np.column_stack([np.zeros(n), np.ones(n)])
+    model = GaussianProcessSurrogate(unit_bounds)
+
+    x_initial = np.vstack([np.clip(run.to_scaled(initial_params), 0.0, 1.0),
+                           latin_hypercube(unit_bounds, max(min(initial_points, max_evaluations) - 1, 0), rng)])
+    errors = run.evaluate(x_initial, [f"{run_name}_bo0_{i+1}" for i in range(len(x_initial))])
+    for x, error in zip(x_initial, errors):
+        if is_measured(error):
+            model.add(x, error)
+    remaining = max(max_evaluations - len(x_initial), 0)
+    max_iterations = -(-remaining // batch_size)
+
+    print(f"\n--- Starting Bayesian Optimization Run: {run_name} (batches of {batch_size}) ---")
+    for k in range(max_iterations):
+        current_batch_size = min(batch_size, remaining)
+        remaining -= current_batch_size
+        if len(model) < 2:
+            batch = rng.uniform(size=(current_batch_size, n))
+        else:
+            believer = copy.deepcopy(model)
+            best_x = run.to_scaled(run.best_params) if run.best_params is not None else x_initial[0]
+            batch = []
+            for _ in range(current_batch_size):
+                # Candidates: uniform over the box and local around the best point so far
+                candidates = np.vstack([rng.uniform(size=(num_candidates // 2, n)),
+                                        np.clip(best_x + rng.normal(scale=0.05, size=(num_candidates // 2, n)),
+                                                0.0, 1.0)])
+                mean, std = believer.predict(candidates)
+                chosen = candidates[int(np.argmin(mean - kappa * std))]
+                batch.append(chosen)
+                believer.add(chosen, believer.predict(chosen)[0][0])
+            batch = np.array(batch)
+
+        errors = run.evaluate(batch, [f"{run_name}_bo{k+1}_{i+1}" for i in range(len(batch))])
+        for x, error in zip(batch, errors):
+            if is_measured(error):
+                model.add(x, error)
+        run.end_iteration(k, max_iterations)
+
+    final_x = run.to_scaled(run.best_params) if run.best_params is not None else x_initial[0]
+    mean_iteration_time = np.mean(run.iteration_times) if run.iteration_times else 0.0
+    print(f"--- Bayesian Optimization Run {run_name} Finished (mean iteration time {mean_iteration_time:.1f} s) ---")
+    return run.result(final_x)
+
+
+def run_optimizer(project, tracker, initial_params, run_seed=None, run_name="Run", surrogate=None, executor=None,
+                  run_state=None, on_iteration=None):
+    """
+    Runs one calibration run (restart) with the project's [optimizer] method, evaluating in executor
+    (default: the tracker's). run_state/on_iteration (checkpoints within a run) are only used by SPSA.
+    Returns (final_params, best_params, best_error, error_history, iteration_times) like run_spsa_calibration().
+    """
+    settings = project.optimizer
+    method = settings['method']
+    bounds = project.param_bounds
+    spsa = project.spsa
+    executor = executor or tracker.executor
+    if method == "spsa":
+        return run_spsa_calibration(
+            objective_func=tracker.objective_func,
+            initial_params=initial_params,
+            bounds=bounds,
+            max_iterations=spsa['iterations_per_restart'],
+            a=spsa['a'], c=spsa['c'], A=spsa['A'], alpha=spsa['alpha'], gamma=spsa['gamma'],
+            run_seed=run_seed,
+            run_name=run_name,
+            executor=executor,
+            num_perturbations=spsa['num_perturbations'],
+            param_names=project.param_names,
+            surrogate=surrogate,
+            tracker=tracker,
+            run_state=run_state,
+            on_iteration=on_iteration
+        )
+
+    # Same SUMO budget per run as SPSA unless set explicitly
+    max_evaluations = settings['max_evaluations'] or 2 * spsa['num_perturbations'] * spsa['iterations_per_restart']
+    workers = project.num_eval_workers if project.parallel_evaluation else 1
+    if method == "cmaes":
+        population_size = settings['population_size']
+        if population_size is None:
+            # Default population, rounded up to whole rounds of the parallel workers
+            default_size = 4 + int(3 * np.log(len(initial_params)))
+            population_size = int(np.ceil(default_size / workers) * workers)
+        return run_cmaes(tracker, initial_params, bounds, max_evaluations, run_seed, run_name,
+                         population_size=population_size, sigma0=settings['sigma0'], executor=executor)
+    if method == "nelder_mead":
+        return run_nelder_mead(tracker, initial_params, bounds, max_evaluations, run_seed, run_name,
+                               initial_step=settings['initial_step'], executor=executor)
+    return run_bayesian(tracker, initial_params, bounds, max_evaluations, run_seed, run_name,
+                        initial_points=settings['initial_points'], batch_size=settings['batch_size'] or workers,
+                        kappa=settings['kappa'], num_candidates=settings['num_candidates'], executor=executor)
@@ -0,0 +1,283 @@
+"""
+Timing spans of the evaluation pipeline and sampled profiles of single evaluations.
+
+With [profiling] enabled (the default) SimulationObjective times each stage of an
+evaluation and stores the seconds per stage in its evaluation log record
+('stages', see evaluation_log.py):
+
+    cache         result cache lookup and store
+    warm_start    finding (or first building) the warm-up snapshot
+    workspace     route template and staged scenario files
+    write_inputs  per-run vType additional file / patched warm-start state
+    slot_wait     waiting for a free SUMO slot of the job scheduler (asyncio backend)
+    sumo          the SUMO process, start-up included (subprocess engine)
+    sumo_load     load() of the scenario and setting the vType (libsumo/TraCI engine)
+    simulation    stepping the simulation and reading the detectors (libsumo/TraCI engine)
+    read_output   parsing the detector output XML
+    aggregate     RMSE over the observation windows
+
+A high slot_wait share means the evaluations wait for CPU cores; high workspace,
+write_inputs or read_output shares point at file I/O. stage_report() gives the
+percentiles per stage and per iteration, stage_histograms() the histograms, and
+run_calibration() prints the report of each calibration. From the command line:
+
+    python -m sumo_calib.profiling <evaluation log dir> [--session ID] [--csv FILE]
+
+With profile_every = N, every N-th evaluation of a worker process runs under
+cProfile (or pyinstrument) and its profile is written to [profiling] dir. Only
+evaluations that run in their own thread (serial, process pool or in-process
+engines) are profiled, not the coroutines of the asyncio backend.
+"""
+import argparse
+import contextlib
+import contextvars
+import csv
+import os
+import re
+import threading
+import time
+
+import numpy as np
+
+STAGES = ("cache", "warm_start", "workspace", "write_inputs", "slot_wait", "sumo", "sumo_load", "simulation",
+          "read_output", "aggregate")
+
+PERCENTILES = (50, 90, 99)
+
+# Stage timings of the evaluation running in this thread or asyncio task (None: not collected)
+_current_stages = contextvars.ContextVar('sumo_calib_stages', default=None)
+
+# {(pid, directory): SampledProfiler}
+_profilers = {}
+_profilers_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def collect_stages(enabled=True):
+    """Collects the spans inside the block into a dict stage -> seconds (yielded; None if not enabled)."""
+    if not enabled:
+        yield None
+        return
+    stages = {}
+    token = _current_stages.set(stages)
+    try:
+        yield stages
+    finally:
+        _current_stages.reset(token)
+
+
+def current_stages():
+    """The stage timings collected so far in this context, or None."""
+    return _current_stages.get()
+
+
+def record(stage, seconds):
+    """Adds seconds to a stage of the current evaluation (a stage can run more than once, e.g. retries)."""
+    stages = _current_stages.get()
+    if stages is not None:
+        stages[stage] = stages.get(stage, 0.0) + seconds
+
+
+@contextlib.contextmanager
+def span(stage):
+    """Times the block as a stage of the current evaluation; does nothing outside collect_stages()."""
+    if _current_stages.get() is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(stage, time.perf_counter() - start)
+
+
+class SampledProfiler:
+    """Profiles every profile_every-th evaluation of this process with cProfile or pyinstrument."""
+
+    def __init__(self, directory, profile_every, profiler="cprofile"):
+        self.directory = directory
+        self.profile_every = profile_every
+        self.profiler = profiler
+        self.num_evaluations = 0
+        self._lock = threading.Lock()
+        if profiler == "pyinstrument":
+            try:
+                import pyinstrument  # noqa: F401
+            except ImportError:
+                print("WARNING: pyinstrument is not installed (pip install pyinstrument). Using cProfile.")
+                self.profiler = "cprofile"
+
+    def _sampled(self):
+        with self._lock:
+            self.num_evaluations += 1
+            return self.num_evaluations % self.profile_every == 0
+
+    @contextlib.contextmanager
+    def profile(self, label):
+        if not self._sampled():
+            yield
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        safe_label = re.sub(r'[^\w.-]+', '_', label)
+        name = f"{safe_label}-{os.getpid()}"
+        if self.profiler == "pyinstrument":
+            from pyinstrument import Profiler
+            profiler = Profiler()
+            profiler.start()
+            try:
+                yield
+            finally:
+                profiler.stop()
+                with open(os.path.join(self.directory, f"{name}.html"), 'w', encoding='utf-8') as f:
+                    f.write(profiler.output_html())
+            return
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(self.directory, f"{name}.prof"))
+
+
+def get_sampled_profiler(project):
+    """Returns this process's SampledProfiler of the project (None without [profiling] profile_every)."""
+    settings = project.profiling
+    if not settings['enabled'] or not settings['profile_every']:
+        return None
+    directory = os.path.join(project.output_dir, settings['dir'])
+    key = (os.getpid(), directory)
+    with _profilers_lock:
+        profiler = _profilers.get(key)
+        if profiler is None:
+            profiler = SampledProfiler(directory, settings['profile_every'], settings['profiler'])
+            _profilers[key] = profiler
+    return profiler
+
+
+# --- Reports from the evaluation log ---
+
+def _summary(values):
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None
+    summary = {'count': len(values), 'mean': float(np.mean(values)), 'total': float(np.sum(values)),
+               'max': float(np.max(values))}
+    for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+        summary[f"p{p}"] = float(value)
+    return summary
+
+
+def _ordered_stages(stage_names):
+    return [stage for stage in STAGES if stage in stage_names] + [s for s in stage_names if s not in STAGES]
+
+
+def stage_report(columns):
+    """
+    Percentiles of the stage times in evaluation log columns (see evaluation_log.load_evaluation_log).
+
+    Returns {'stages': {stage: summary}, 'evaluation': summary of the evaluation wall times,
+    'iteration': summary of the iteration wall times} where a summary holds count, mean, total, max
+    and p50/p90/p99 (seconds). Cached results are left out. 'share' of a stage is its part of the
+    summed stage times. An iteration's wall time runs from the start of its first evaluation to the
+    end of its last one.
+    """
+    simulated = columns['status'] != "cached"
+    stages = columns['stages'][simulated]
+    report = {'stages': {}, 'evaluation': _summary(columns['wall_time_s'][simulated]), 'iteration': None}
+    stage_names = columns['stage_names']
+    for stage in _ordered_stages(stage_names):
+        summary = _summary(stages[:, stage_names.index(stage)])
+        if summary is not None:
+            report['stages'][stage] = summary
+    stage_total = sum(summary['total'] for summary in report['stages'].values())
+    for summary in report['stages'].values():
+        summary['share'] = summary['total'] / stage_total if stage_total else 0.0
+
+    # Per iteration: evaluations of the same run and iteration
+    in_iteration = columns['iteration'] >= 0
+    if np.any(in_iteration):
+        keys = np.char.add(np.char.add(columns['run'][in_iteration], "#"),
+                           columns['iteration'][in_iteration].astype(str))
+        ends = columns['time'][in_iteration]
+        starts = ends - columns['wall_time_s'][in_iteration]
+        _, inverse = np.unique(keys, return_inverse=True)
+        first_start = np.full(inverse.max() + 1, np.inf)
+        last_end = np.full(inverse.max() + 1, -np.inf)
+        np.minimum.at(first_start, inverse, starts)
+        np.maximum.at(last_end, inverse, ends)
+        report['iteration'] = _summary(last_end - first_start)
+    return report
+
+
+def stage_histograms(columns, bins=20):
+    """{stage: (counts, bin_edges)} of the stage times (seconds) of the simulated evaluations."""
+    simulated = columns['status'] != "cached"
+    histograms = {}
+    for stage in _ordered_stages(columns['stage_names']):
+        values = columns['stages'][simulated, columns['stage_names'].index(stage)]
+        values = values[~np.isnan(values)]
+        if len(values):
+            histograms[stage] = np.histogram(values, bins=bins)
+    return histograms
+
+
+def _format_row(label, summary, share=None):
+    cells = [f"{label:<14}", f"{summary['count']:>7}"]
+    cells += [f"{summary[key]:>9.3f}" for key in ('mean', 'p50', 'p90', 'p99', 'max')]
+    cells.append(f"{share * 100:>6.1f}%" if share is not None else " " * 7)
+    return " ".join(cells)
+
+
+def print_stage_report(report):
+    header = " ".join([f"{'stage':<14}", f"{'count':>7}"] + [f"{key:>9}" for key in ('mean', 'p50', 'p90', 'p99', 'max')]
+                      + [f"{'share':>7}"])
+    print("\n--- Evaluation pipeline profile (seconds) ---")
+    print(header)
+    for stage, summary in report['stages'].items():
+        print(_format_row(stage, summary, summary['share']))
+    if report['evaluation'] is not None:
+        print(_format_row("evaluation", report['evaluation']))
+    if report['iteration'] is not None:
+        print(_format_row("iteration", report['iteration']))
+
+
+def write_stage_report_csv(report, path):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(["stage", "count", "mean_s", "p50_s", "p90_s", "p99_s", "max_s", "total_s", "share"])
+        rows = list(report['stages'].items()) + [("evaluation", report['evaluation']),
+                                                  ("iteration", report['iteration'])]
+        for stage, summary in rows:
+            if summary is not None:
+                writer.writerow([stage, summary['count']] + [round(summary[key], 6) for key in
+                                                             ('mean', 'p50', 'p90', 'p99', 'max', 'total')]
+                                + [round(summary.get('share', 1.0), 4)])
+
+
+def main(argv=None):
+    from sumo_calib.evaluation_log import load_evaluation_log
+
+    parser = argparse.ArgumentParser(prog="python -m sumo_calib.profiling",
+                                     description="Stage timing percentiles of a calibration's evaluation log.")
+    parser.add_argument("log", help="Evaluation log directory (or one JSONL file)")
+    parser.add_argument("--session", default="latest", help="Calibration session id (default: the latest)")
+    parser.add_argument("--csv", help="Also write the percentiles to this CSV file")
+    args = parser.parse_args(argv)
+
+    columns = load_evaluation_log(args.log, session=args.session)
+    if len(columns['rmse']) == 0:
+        print(f"No evaluations found in {args.log}.")
+        return 1
+    report = stage_report(columns)
+    print(f"Session {columns['session'][-1]}: {len(columns['rmse'])} evaluations")
+    print_stage_report(report)
+    if args.csv:
+        write_stage_report_csv(report, args.csv)
+        print(f"Percentiles written to {args.csv}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,379 @@
+"""
+Calibration project files.
+
+A project file (TOML, YAML or JSON) describes one calibration site: the SUMO
+scenario, the detectors, the observed data, the parameters with their bounds
+and the optimizer settings. load_project() only parses the file; nothing is
+checked on disk until validate() is called, so projects can be created cheaply
+in batch pipelines. Relative paths are resolved against the scenario directory,
+which itself is resolved against the directory of the project file.
+
+Minimal example (TOML):
+
+    [scenario]
+    dir = "D:/SUMO"
+    config = "exaple2.sumocfg"
+    net = "lode2.net.xml"
+    routes = "1.rou.xml"
+    detectors = "edgelanetrafficpara.add.xml"
+    detector_output = "detector_output.xml"
+    vtype = "passenger"
+
+    [detectors]
+    ids = ["e2_E1_main_0", "e2_E1_main_1"]
+
+    [observations]
+    detectors = ["e2_E1_main_0", "e2_E1_main_1"]
+    duration_s = 60
+    speeds_kmh = [80.31, 75.84, 72.21]
+
+    [parameters]
+    accel = { bounds = [1.0, 4.0], initial = 2.6 }
+    tau = { bounds = [0.5, 2.0], initial = 1.0 }
+"""
+import copy
+import json
+import os
+import shutil
+
+DEFAULT_SPSA_SETTINGS = {
+    'a': 0.1,
+    'c': 0.1,
+    'A': 100,
+    'alpha': 0.602,
+    'gamma': 0.101,
+    'iterations_per_restart': 150,
+    'num_restarts': 3,
+    # Run the restarts at the same time from Latin hypercube points (each with its own workers)
+    # instead of one after another, each starting from the previous result
+    'parallel_restarts': False,
+    'num_perturbations': 1,
+    # Evaluate the initial parameters once before the SPSA runs (baseline RMSE)
+    'evaluate_initial': False,
+    # Seed of restart i is base_run_seed + i; None draws new seeds on every run
+    'base_run_seed': None,
+    'final_verification_seed': 12345,
+}
+
+DEFAULT_SIMULATION_SETTINGS = {
+    'warmup': 540,
+    'end_buffer': 180,
+    'time_to_teleport': 300,
+    'step_length': 1,
+    # "subprocess": one sumo process per evaluation; "libsumo"/"traci": SUMO kept loaded in each process
+    'engine': "subprocess",
+}
+
+# [warm_start]: warm-up snapshots reused across evaluations (see warm_start.py)
+DEFAULT_WARM_START_SETTINGS = {
+    'enabled': False,
+    # Number of warm-up snapshots; an evaluation uses snapshot (seed mod num_snapshots)
+    'num_snapshots': 4,
+    'base_seed': 1,
+    'dir': "warm_start_snapshots",
+    # Parameters of the warm-up; None uses the initial parameters of the project
+    'reference_params': None,
+    'fidelity_check': True,
+    'fidelity_samples': 3,
+    'fidelity_tolerance': 0.25,  # m/s, largest accepted |RMSE(warm start) - RMSE(full run)|
+}
+
+# [surrogate]: Gaussian-process pre-screening of the SPSA candidates (see surrogate.py)
+DEFAULT_SURROGATE_SETTINGS = {
+    'enabled': False,
+    'min_points': 20,          # real evaluations before the model is used
+    'max_points': 400,         # most recent evaluations the model is trained on
+    'num_candidates': 16,      # random directions screened per SPSA iteration
+    'confidence': 0.5,         # model step if std(y+ - y-) < confidence * |mean(y+ - y-)|
+    'verify_every': 3,         # every n-th iteration is simulated in any case
+    'propose_every': 5,        # simulate the model's most promising point every n iterations (0 = never)
+    'kappa': 1.0,              # exploration weight of the lower confidence bound
+    'propose_radius': 0.1,     # search radius of propose() in scaled parameter units
+}
+
+
+# [optimizer]: the optimizer of each calibration run (see optimizers.py)
+DEFAULT_OPTIMIZER_SETTINGS = {
+    'method': "spsa",          # "spsa", "cmaes", "nelder_mead" or "bayesian"
+    # SUMO evaluations per run of cmaes/nelder_mead/bayesian; None: the SPSA budget
+    # (2 * num_perturbations * iterations_per_restart)
+    'max_evaluations': None,
+    # m/s; the evaluations and wall-clock time until the best RMSE first reaches it are reported
+    'target_rmse': None,
+    'population_size': None,   # CMA-ES; None: 4 + 3 ln(n), rounded up to a multiple of [parallel] workers
+    'sigma0': 0.3,             # CMA-ES initial step size, as a fraction of the parameter ranges
+    'initial_step': 0.1,       # Nelder-Mead initial simplex size, as a fraction of the parameter ranges
+    'initial_points': 10,      # Bayesian: random points before the model is used
+    'batch_size': None,        # Bayesian: candidates evaluated together; None: [parallel] workers
+    'kappa': 2.0,              # Bayesian: exploration weight of the lower confidence bound
+    'num_candidates': 2000,    # Bayesian: random candidates scored per batch point
+}
+
+
+# [pruning]: early termination of simulations from the streaming partial RMSE (see pruning.py)
+DEFAULT_PRUNING_SETTINGS = {
+    'enabled': False,
+    # Stop a simulation once its RMSE lower bound exceeds best RMSE so far * (1 + margin)
+    'margin': 0.0,
+    'poll_interval_s': 1.0,    # how often the detector output of a running sumo process is read
+}
+
+
+# [checkpoint]: periodic checkpoints of the calibration for resuming it (see checkpoint.py)
+DEFAULT_CHECKPOINT_SETTINGS = {
+    'enabled': False,
+    'file': "calibration_checkpoint.pkl",   # in the output directory
+    'every': 5,                             # SPSA iterations between checkpoints
+}
+
+
+# [evaluation_log]: structured record of every evaluation (see evaluation_log.py)
+DEFAULT_EVALUATION_LOG_SETTINGS = {
+    'enabled': True,
+    'dir': "evaluation_log",    # in the output directory
+}
+
+
+# [profiling]: stage timings of the evaluations and sampled profiles (see profiling.py)
+DEFAULT_PROFILING_SETTINGS = {
+    'enabled': True,
+    'profile_every': 0,         # profile every N-th evaluation of a worker process (0 = never)
+    'profiler': "cprofile",     # "cprofile" or "pyinstrument"
+    'dir': "profiles",          # in the output directory
+}
+
+
+class ProjectError(ValueError):
+    """Raised for invalid or incomplete project files."""
+
+
+def _read_project_file(path):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.json':
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    if ext in ('.yaml', '.yml'):
+        try:
+            import yaml
+        except ImportError:
+            raise ProjectError(f"PyYAML is required to read '{path}' (pip install pyyaml).")
+        with open(path, 'r', encoding='utf-8') as f:
+            return yaml.safe_load(f) or {}
+    if ext == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ProjectError(f"Python 3.11+ or the tomli package is required to read '{path}'.")
+        with open(path, 'rb') as f:
+            return tomllib.load(f)
+    raise ProjectError(f"Unsupported project file type '{ext}' (use .toml, .yaml, .yml or .json).")
+
+
+class CalibrationProject:
+    """Settings of one calibration site, built from a project file dictionary."""
+
+    def __init__(self, data, base_dir=".", path=None):
+        self.data = copy.deepcopy(data)
+        self.path = path
+        self.name = self.data.get('name') or (os.path.splitext(os.path.basename(path))[0] if path else "project")
+
+        scenario = self._required_section('scenario')
+        self.scenario_dir = os.path.normpath(os.path.join(base_dir, os.path.expanduser(scenario.get('dir', '.'))))
+        self.sumo_binary = scenario.get('sumo_binary') or None
+        self.sumo_cfg_file = self.resolve(self._required(scenario, 'config', 'scenario'))
+        self.net_file = self.resolve(self._required(scenario, 'net', 'scenario'))
+        self.route_file = self.resolve(self._required(scenario, 'routes', 'scenario'))
+        self.detector_file = self.resolve(self._required(scenario, 'detectors', 'scenario'))
+        self.detector_output_name = scenario.get('detector_output', "detector_output.xml")
+        self.vtype_id = scenario.get('vtype', "passenger")
+        # Per-run additional file holding only the calibrated vType (loaded before the routes)
+        self.vtype_additional_name = scenario.get('vtype_additional', "calibrated_vtype.add.xml")
+        self.speedfactor_default_bounds = tuple(scenario.get('speedfactor_default_bounds', (0.8, 1.6)))
+
+        simulation = dict(DEFAULT_SIMULATION_SETTINGS, **self.data.get('simulation', {}))
+        self.warmup = simulation['warmup']
+        self.end_buffer = simulation['end_buffer']
+        self.time_to_teleport = simulation['time_to_teleport']
+        self.step_length = simulation['step_length']
+        self.simulation_engine = simulation['engine']
+        if self.simulation_engine not in ("subprocess", "libsumo", "traci"):
+            raise ProjectError(f"Project '{self.name}': [simulation] engine must be \"subprocess\", \"libsumo\" or \"traci\".")
+
+        detectors = self._required_section('detectors')
+        self.detector_ids = list(self._required(detectors, 'ids', 'detectors'))
+        self.speed_attribute = detectors.get('speed_attribute', "meanSpeed")
+        self.detector_freq = detectors.get('freq', 60)
+
+        self.observed_data_points = self._observed_data_points(self.data.get('observations', {}))
+
+        parameters = self._required_section('parameters')
+        self.param_names = list(parameters.keys())
+        self.parameter_bounds = {}
+        self.initial_params = {}
+        for name, spec in parameters.items():
+            if isinstance(spec, dict):
+                bounds = self._required(spec, 'bounds', f'parameters.{name}')
+                initial = spec.get('initial')
+            else:
+                bounds, initial = spec, None
+            lower, upper = float(bounds[0]), float(bounds[1])
+            self.parameter_bounds[name] = (lower, upper)
+            # Missing initial values start at the middle of the bounds
+            self.initial_params[name] = float(initial) if initial is not None else (lower + upper) / 2.0
+
+        self.spsa = dict(DEFAULT_SPSA_SETTINGS, **self.data.get('spsa', {}))
+        self.optimizer = self.section('optimizer', DEFAULT_OPTIMIZER_SETTINGS)
+        if self.optimizer['method'] not in ("spsa", "cmaes", "nelder_mead", "bayesian"):
+            raise ProjectError(f"Project '{self.name}': [optimizer] method must be \"spsa\", \"cmaes\", "
+                               f"\"nelder_mead\" or \"bayesian\".")
+
+        parallel = self.data.get('parallel', {})
+        self.parallel_evaluation = parallel.get('enabled', True)
+        self.num_eval_workers = parallel.get('workers') or 2 * self.spsa['num_perturbations']
+        # "asyncio": SUMO processes are jobs of a SumoJobScheduler; "process": ProcessPoolExecutor workers
+        self.parallel_backend = parallel.get('backend', "asyncio")
+        if self.parallel_backend not in ("asyncio", "process"):
+            raise ProjectError(f"Project '{self.name}': [parallel] backend must be \"asyncio\" or \"process\".")
+        # Wall-clock limit per SUMO run (None = no limit) and retries with a new seed after a failure/timeout
+        self.sumo_timeout = parallel.get('timeout_s')
+        self.sumo_max_retries = parallel.get('max_retries', 1)
+
+        self.warm_start = self.section('warm_start', DEFAULT_WARM_START_SETTINGS)
+        self.surrogate = self.section('surrogate', DEFAULT_SURROGATE_SETTINGS)
+        self.pruning = self.section('pruning', DEFAULT_PRUNING_SETTINGS)
+        self.checkpoint = self.section('checkpoint', DEFAULT_CHECKPOINT_SETTINGS)
+        self.profiling = self.section('profiling', DEFAULT_PROFILING_SETTINGS)
+        if self.profiling['profiler'] not in ("cprofile", "pyinstrument"):
+            raise ProjectError(f"Project '{self.name}': [profiling] profiler must be \"cprofile\" or \"pyinstrument\".")
+
+        cache = self.data.get('cache', {})
+        cache_dir = cache.get('dir', "sim_result_cache")
+        self.cache_dir = self.resolve(cache_dir) if cache_dir and cache.get('enabled', True) else None
+        self.cache_max_entries = cache.get('max_entries', 20000)
+
+        output = self.data.get('output', {})
+        self.output_dir = self.resolve(output.get('dir', "."))
+        self.best_params_file_name = output.get('best_params_file', "best_calibrated_parameters_spsa.txt")
+
+        evaluation_log = self.section('evaluation_log', DEFAULT_EVALUATION_LOG_SETTINGS)
+        self.evaluation_log_dir = (os.path.join(self.output_dir, evaluation_log['dir'])
+                                   if evaluation_log['enabled'] and evaluation_log['dir'] else None)
+
+        # Interval-by-interval validation (observed speed/flow CSV) used by the plotting scripts
+        validation = self.data.get('validation', {})
+        observed_csv = validation.get('observed_csv')
+        self.validation_csv = self.resolve(observed_csv) if observed_csv else None
+        self.validation_interval = validation.get('interval', self.detector_freq)
+        self.validation_num_intervals = validation.get('num_intervals', 20)
+        self.validation_num_runs = validation.get('num_runs', 3)
+        # Replication seeds are derived from the master seed (None: a new master seed is drawn and printed)
+        self.validation_master_seed = validation.get('master_seed')
+        self.validation_detector_ids = list(validation.get('detector_ids', self.detector_ids))
+        self.validation_params = validation.get('parameters') or None
+
+    # --- helpers ---
+
+    def _required_section(self, name):
+        section = self.data.get(name)
+        if not section:
+            raise ProjectError(f"Project '{self.name}': missing section [{name}].")
+        return section
+
+    def _required(self, section, key, section_name):
+        if key not in section:
+            raise ProjectError(f"Project '{self.name}': missing '{key}' in [{section_name}].")
+        return section[key]
+
+    def _observed_data_points(self, observations):
+        """Observation points in the format used by the objective ('location_detector_ids', 'duration_s', ...)."""
+        points = []
+        for point in observations.get('points', []):
+            points.append({'location_detector_ids': list(point.get('detectors', observations.get('detectors', []))),
+                           'duration_s': point.get('duration_s', observations.get('duration_s', 60)),
+                           'observed_speed_kmh': float(point['speed_kmh'])})
+        # Compact form: one speed per consecutive window, all with the same detectors and duration
+        for speed_kmh in observations.get('speeds_kmh', []):
+            points.append({'location_detector_ids': list(observations.get('detectors', self.detector_ids)),
+                           'duration_s': observations.get('duration_s', 60),
+                           'observed_speed_kmh': float(speed_kmh)})
+        for point in points:
+            point['observed_speed_ms'] = point['observed_speed_kmh'] / 3.6
+        return points
+
+    def resolve(self, path):
+        """Resolves a path from the project file against the scenario directory."""
+        return os.path.normpath(os.path.join(self.scenario_dir, os.path.expanduser(path)))
+
+    def section(self, name, defaults=None):
+        """Returns a (copied) extra section of the project file, filled up with defaults."""
+        return dict(defaults or {}, **self.data.get(name, {}))
+
+    # --- derived settings ---
+
+    @property
+    def calibration_start_time(self):
+        # Calibration time window starts after warm-up
+        return self.warmup
+
+    @property
+    def total_obs_duration(self):
+        return sum(point['duration_s'] for point in self.observed_data_points)
+
+    @property
+    def sim_duration(self):
+        # Warm-up + observed windows + end buffer
+        return self.calibration_start_time + self.total_obs_duration + self.end_buffer
+
+    @property
+    def validation_sim_duration(self):
+        return self.warmup + self.validation_num_intervals * self.validation_interval + self.end_buffer
+
+    @property
+    def param_bounds(self):
+        import numpy as np
+        return np.array([self.parameter_bounds[name] for name in self.param_names])
+
+    @property
+    def default_params(self):
+        import numpy as np
+        bounds = self.param_bounds
+        initial = np.array([self.initial_params[name] for name in self.param_names])
+        return np.clip(initial, bounds[:, 0], bounds[:, 1])
+
+    @property
+    def scenario_files(self):
+        """Inputs whose content determines a simulation result (part of the cache key)."""
+        return [self.sumo_cfg_file, self.net_file, self.route_file, self.detector_file]
+
+    @property
+    def sumo_path(self):
+        return self.sumo_binary or shutil.which('sumo')
+
+    def validate(self, require_validation_csv=False):
+        """Checks that SUMO and all scenario files exist; raises FileNotFoundError or ProjectError otherwise."""
+        if self.sumo_path is None:
+            raise FileNotFoundError("SUMO executable not found in PATH. Set scenario.sumo_binary in the project file.")
+        if not os.path.exists(self.sumo_path):
+            raise FileNotFoundError(f"SUMO executable not found at the specified path: {self.sumo_path}")
+        if not os.path.isdir(self.scenario_dir):
+            raise FileNotFoundError(f"Scenario directory not found at: {self.scenario_dir}")
+        for label, path in (("SUMO config file", self.sumo_cfg_file), ("Network file", self.net_file),
+                            ("Main route file", self.route_file), ("Detector template file", self.detector_file)):
+            if not os.path.exists(path):
+                raise FileNotFoundError(f"{label} not found at: {path}")
+        if require_validation_csv and (self.validation_csv is None or not os.path.exists(self.validation_csv)):
+            raise FileNotFoundError(f"Observed data CSV file not found at: {self.validation_csv}")
+        unknown = [det_id for point in self.observed_data_points for det_id in point['location_detector_ids']
+                   if det_id not in self.detector_ids]
+        if unknown:
+            raise ProjectError(f"Observation detectors {sorted(set(unknown))} are not listed in [detectors] ids.")
+
+
+def load_project(path):
+    """Reads a project file (.toml, .yaml/.yml or .json) into a CalibrationProject."""
+    path = os.path.abspath(path)
+    data = _read_project_file(path)
+    return CalibrationProject(data, base_dir=os.path.dirname(path), path=path)
@@ -0,0 +1,77 @@
+"""
+Early termination of unpromising simulations from a streaming partial RMSE.
+
+With [pruning] enabled the optimizer passes a threshold (the best RMSE so far
+times 1 + margin) with each evaluation. While SUMO runs, the detector intervals
+are streamed (the subprocess engine tails the detector output file, the
+libsumo/TraCI engines read the detectors step by step) and the squared errors of
+the observation points whose windows are complete are summed. Every point still
+to come can only add to that sum, so sqrt(sum / number of points) is a lower
+bound of the final RMSE. Once it exceeds the threshold the simulation is
+stopped and the evaluation returns the lower bound, as a PrunedError, instead
+of the RMSE.
+
+A PrunedError is a float, so CMA-ES and Nelder-Mead can still rank it (it is
+worse than the threshold either way), but it is not a measured RMSE: like the
+1e9 failures it is never cached, never becomes a best error, is not used to
+train a surrogate model and SPSA skips the directions it occurs in when
+averaging its gradient (the difference of two lower bounds measures when each
+run crossed the threshold, not the slope). is_measured() tells them apart.
+SUMO buffers its output, so the subprocess engine sees the intervals somewhat
+later than they are simulated.
+"""
+import math
+import os
+
+from sumo_calib.detector_output import DetectorOutputTail
+
+
+class PrunedError(float):
+    """The RMSE lower bound returned by a pruned evaluation."""
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return f"PrunedError({float(self)!r})"
+
+
+def is_measured(error):
+    """True for the RMSE of a complete simulation: neither a failure (1e9) nor a PrunedError."""
+    return error < 1e9 and not isinstance(error, PrunedError)
+
+
+class EvaluationPruned(Exception):
+    """Raised inside an evaluation once the RMSE lower bound exceeds the prune threshold."""
+
+    def __init__(self, lower_bound, time_reached):
+        super().__init__(f"RMSE >= {lower_bound:.4f} m/s after {time_reached:g} s")
+        self.lower_bound = lower_bound
+        self.time_reached = time_reached
+
+
+class StreamingPruner:
+    """Compares the partial RMSE of one running simulation with the prune threshold."""
+
+    def __init__(self, objective, threshold):
+        self.project = objective.project
+        self.windows = objective.observation_windows
+        self.threshold = threshold
+        self._tail = None
+
+    def check(self, speeds, time_reached):
+        """speeds: (detectors, intervals) speeds in m/s so far; raises EvaluationPruned if the bound exceeds the threshold."""
+        lower_bound = math.sqrt(self.windows.partial_squared_error_sum(speeds, time_reached) / len(self.windows))
+        if lower_bound > self.threshold:
+            raise EvaluationPruned(lower_bound, time_reached)
+
+    def poll_output(self, run_dir):
+        """Monitor of a running SUMO process: reads the new lines of its detector output and checks them."""
+        project = self.project
+        if self._tail is None:
+            self._tail = DetectorOutputTail(os.path.join(run_dir, project.detector_output_name),
+                                            project.detector_ids, project.speed_attribute,
+                                            project.calibration_start_time, project.detector_freq,
+                                            len(self.windows.interval_begins))
+        time_reached = self._tail.poll()
+        if time_reached is not None:
+            self.check(self._tail.values, time_reached)
@@ -0,0 +1,184 @@
+"""
+Multi-seed replication of the interval-by-interval validation simulation.
+
+run_replications() derives a reproducible seed list from a master seed, runs
+all seeds at the same time on the SUMO job scheduler and collects the results
+into one preallocated (seeds x intervals x metrics) array. ReplicationResult
+then gives the across-seed mean, Student-t confidence intervals and the
+effective number of replicates (successful seeds with data) per interval.
+
+    replications = run_replications(project, num_seeds=3, master_seed=2024)
+    replications.print_summary()
+    mean_speed_kmh = replications.mean_of('speed_kmh')
+"""
+import math
+import random
+from functools import lru_cache
+
+import numpy as np
+
+from sumo_calib.evaluation import simulate_intervals_concurrently
+
+# Metric order of the last axis of ReplicationResult.values
+METRICS = ('speed_kmh', 'flow_vehpermin')
+
+MAX_SUMO_SEED = 100000
+
+
+def derive_seeds(master_seed, num_seeds):
+    """num_seeds distinct SUMO seeds in [1, MAX_SUMO_SEED], always the same for the same master seed."""
+    rng = np.random.default_rng(master_seed)
+    return [int(seed) for seed in rng.choice(MAX_SUMO_SEED, size=num_seeds, replace=False) + 1]
+
+
+@lru_cache(maxsize=None)
+def student_t_quantile(p, df):
+    """Quantile of Student's t distribution (scipy is not required): closed forms for df 1 and 2, else bisection."""
+    if df == 1:
+        return math.tan(math.pi * (p - 0.5))
+    if df == 2:
+        return (2 * p - 1) / math.sqrt(2 * p * (1 - p))
+    log_norm = math.lgamma((df + 1) / 2) - math.lgamma(df / 2) - 0.5 * math.log(df * math.pi)
+
+    def cdf(x):
+        # Simpson integration of the density over [0, |x|]
+        t = np.linspace(0.0, abs(x), 2001)
+        pdf = np.exp(log_norm - (df + 1) / 2 * np.log1p(t * t / df))
+        h = t[1] - t[0]
+        area = h / 3 * (pdf[0] + pdf[-1] + 4 * pdf[1:-1:2].sum() + 2 * pdf[2:-1:2].sum())
+        return 0.5 + math.copysign(area, x)
+
+    lower, upper = -50.0, 50.0
+    for _ in range(60):
+        middle = (lower + upper) / 2
+        if cdf(middle) < p:
+            lower = middle
+        else:
+            upper = middle
+    return (lower + upper) / 2
+
+
+class ReplicationResult:
+    """
+    Results of one multi-seed replication.
+
+    values: (seeds, intervals, metrics) array, NaN where a seed failed or had no data.
+    seeds: the SUMO seeds in the order of the first axis (for a run the scheduler retried, the seed
+        its values were simulated with).
+    succeeded: (seeds,) bool array, False for seeds whose simulation failed.
+    """
+
+    def __init__(self, seeds, values, succeeded, interval_begins, metrics=METRICS, master_seed=None):
+        self.seeds = list(seeds)
+        self.values = values
+        self.succeeded = succeeded
+        self.interval_begins = interval_begins
+        self.metrics = tuple(metrics)
+        self.master_seed = master_seed
+
+    @property
+    def num_successful(self):
+        return int(np.sum(self.succeeded))
+
+    def _metric_index(self, metric):
+        return self.metrics.index(metric)
+
+    @property
+    def effective_n(self):
+        """(intervals, metrics) number of replicates with a value (successful seeds that had data)."""
+        return np.sum(~np.isnan(self.values), axis=0)
+
+    @property
+    def mean(self):
+        """(intervals, metrics) across-seed mean, NaN where no replicate has a value."""
+        n = self.effective_n
+        totals = np.nansum(self.values, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(n > 0, totals / n, np.nan)
+
+    @property
+    def std(self):
+        """(intervals, metrics) across-seed sample standard deviation (ddof=1), NaN for fewer than 2 replicates."""
+        n = self.effective_n
+        deviations = np.where(np.isnan(self.values), 0.0, self.values - self.mean)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(n > 1, np.sqrt(np.sum(deviations ** 2, axis=0) / (n - 1)), np.nan)
+
+    def confidence_interval(self, level=0.95):
+        """(lower, upper) arrays of shape (intervals, metrics): Student-t interval of the mean per interval."""
+        n = self.effective_n
+        t_values = np.full(n.shape, np.nan)
+        for df in np.unique(n[n > 1]) - 1:
+            t_values[n == df + 1] = student_t_quantile(0.5 + level / 2, int(df))
+        with np.errstate(invalid='ignore', divide='ignore'):
+            half_width = t_values * self.std / np.sqrt(n)
+        return self.mean - half_width, self.mean + half_width
+
+    def mean_of(self, metric):
+        return self.mean[:, self._metric_index(metric)]
+
+    def confidence_interval_of(self, metric, level=0.95):
+        lower, upper = self.confidence_interval(level)
+        index = self._metric_index(metric)
+        return lower[:, index], upper[:, index]
+
+    def print_summary(self, level=0.95):
+        lower, upper = self.confidence_interval(level)
+        mean = self.mean
+        n = self.effective_n
+        print(f"\n--- Replication summary: {self.num_successful}/{len(self.seeds)} seeds succeeded "
+              f"(master seed {self.master_seed}, seeds {self.seeds}) ---")
+        header = "".join(f"  {metric:>30s}" for metric in self.metrics)
+        print(f"  {'Interval':>10s}{header}")
+        for t, begin in enumerate(self.interval_begins):
+            cells = []
+            for m in range(len(self.metrics)):
+                if np.isnan(mean[t, m]):
+                    cells.append(f"  {'no data':>30s}")
+                elif n[t, m] > 1:
+                    cells.append(f"  {f'{mean[t, m]:.2f} [{lower[t, m]:.2f}, {upper[t, m]:.2f}] n={n[t, m]}':>30s}")
+                else:
+                    cells.append(f"  {f'{mean[t, m]:.2f} n={n[t, m]}':>30s}")
+            print(f"  {f'{begin:g}s':>10s}{''.join(cells)}")
+        print(f"  (mean [{level:.0%} confidence interval], n = effective number of replicates)")
+
+
+def run_replications(project, num_seeds=None, master_seed=None, calibrated_params_dict=None, seeds=None,
+                     scheduler=None):
+    """
+    Runs the validation simulation for several seeds in parallel and returns a ReplicationResult.
+
+    num_seeds defaults to project.validation_num_runs. The seeds are derived from master_seed;
+    without one a master seed is drawn and printed, so the replication can be repeated.
+    An explicit seeds list overrides both.
+    """
+    num_intervals = project.validation_num_intervals
+    if seeds is None:
+        if num_seeds is None:
+            num_seeds = project.validation_num_runs
+        if master_seed is None:
+            master_seed = random.randint(1, 2**31 - 1)
+        seeds = derive_seeds(master_seed, num_seeds)
+    print(f"Running {len(seeds)} replications in parallel (master seed {master_seed}, seeds {seeds})...")
+
+    # Preallocated result array; failed seeds keep their NaN rows
+    values = np.full((len(seeds), num_intervals, len(METRICS)), np.nan)
+    succeeded = np.zeros(len(seeds), dtype=bool)
+
+    results, used_seeds = simulate_intervals_concurrently(project, seeds, calibrated_params_dict,
+                                                          scheduler=scheduler, return_used_seeds=True)
+    for run_idx, (seed, (speeds_kmh, flows_vehpermin)) in enumerate(zip(used_seeds, results)):
+        if seed != seeds[run_idx]:
+            print(f"  Simulation {run_idx + 1} (Seed: {seeds[run_idx]}) was retried with seed {seed}.")
+        if speeds_kmh is None or flows_vehpermin is None:
+            print(f"  Simulation {run_idx + 1} (Seed: {seed}) failed. Skipping this run for averaging.")
+            continue
+        if len(speeds_kmh) != num_intervals or len(flows_vehpermin) != num_intervals:
+            print(f"  Warning: Simulation {run_idx + 1} (Seed: {seed}) did not return {num_intervals} intervals. Skipping.")
+            continue
+        values[run_idx, :, 0] = speeds_kmh
+        values[run_idx, :, 1] = flows_vehpermin
+        succeeded[run_idx] = True
+
+    interval_begins = project.warmup + project.validation_interval * np.arange(num_intervals)
+    return ReplicationResult(used_seeds, values, succeeded, interval_begins, master_seed=master_seed)
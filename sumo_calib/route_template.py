@@ -0,0 +1,103 @@
+"""
+Pre-parsed route template with in-memory vType patching.
+
+The route file is parsed once per process. The calibrated vType (together with its
+enclosing vTypeDistribution, if it is nested in one) is cut out and kept as a small
+XML fragment, and the remaining demand is written once as a stripped route file.
+Each evaluation then only serialises the patched fragment into a tiny additional
+file; SUMO loads additional files before the routes, so vehicles still find the vType.
+"""
+import copy
+import os
+import re
+import shutil
+import tempfile
+import threading
+import xml.etree.ElementTree as ET
+from multiprocessing import util as mp_util
+
+# Regex to parse the speedFactor string (normc function)
+SPEEDFACTOR_REGEX = re.compile(r'normc\(([\d.]+),([\d.]+),([\d.]+),([\d.]+)\)')
+
+SPEEDFACTOR_PARAM_NAMES = ('speedFactor_mean', 'speedFactor_std_dev')
+
+# {(pid, route_file, vtype_id): RouteTemplate}
+_templates = {}
+_templates_lock = threading.Lock()
+
+
+class RouteTemplate:
+    """A route file compiled into a stripped demand file plus a patchable vType fragment."""
+
+    def __init__(self, route_file, vtype_id, default_speedfactor_bounds=(0.8, 1.6)):
+        tree = ET.parse(route_file)
+        root = tree.getroot()
+        parent_map = {child: parent for parent in root.iter() for child in parent}
+
+        vtype_elem = root.find(f'.//vType[@id="{vtype_id}"]')
+        if vtype_elem is None:
+            raise ValueError(f"vType '{vtype_id}' not found in route file '{route_file}'.")
+
+        # A vType inside a vTypeDistribution can only be moved together with the distribution
+        fragment = vtype_elem
+        if parent_map.get(vtype_elem) is not None and parent_map[vtype_elem].tag == 'vTypeDistribution':
+            fragment = parent_map[vtype_elem]
+        parent_map[fragment].remove(fragment)
+        fragment.tail = None
+
+        self.vtype_id = vtype_id
+        self.fragment = fragment
+        self._vtype_path = None if fragment is vtype_elem else f'vType[@id="{vtype_id}"]'
+
+        # speedFactor normc bounds are kept from the template, only mean/std_dev are calibrated
+        self.sf_lower_bound, self.sf_upper_bound = default_speedfactor_bounds
+        original_speedfactor = vtype_elem.get('speedFactor', None)
+        if original_speedfactor:
+            match = SPEEDFACTOR_REGEX.match(original_speedfactor)
+            if match:
+                self.sf_lower_bound = float(match.group(3))
+                self.sf_upper_bound = float(match.group(4))
+
+        # The stripped demand keeps the original file name so it can replace the route file 1:1
+        self._demand_dir = tempfile.mkdtemp(prefix=f"sumo_demand_{os.getpid()}_")
+        self.demand_file = os.path.join(self._demand_dir, os.path.basename(route_file))
+        tree.write(self.demand_file)
+        mp_util.Finalize(self, shutil.rmtree, args=(self._demand_dir,), kwargs={'ignore_errors': True},
+                         exitpriority=10)
+
+    def vtype_attributes(self, param_values_dict):
+        """Maps calibrated parameter values to vType attribute strings."""
+        attributes = {}
+        for param_name, param_value in param_values_dict.items():
+            if param_name in SPEEDFACTOR_PARAM_NAMES:
+                # Construct the speedFactor string using calibrated mean/std_dev and original bounds
+                new_mean = param_values_dict.get('speedFactor_mean', 1.0)
+                new_std_dev = param_values_dict.get('speedFactor_std_dev', 0.1)
+                attributes['speedFactor'] = (f"normc({new_mean:.6f},{new_std_dev:.6f},"
+                                             f"{self.sf_lower_bound:.6f},{self.sf_upper_bound:.6f})")
+            else:
+                attributes[param_name] = str(param_value)
+        return attributes
+
+    def render_vtype_additional(self, param_values_dict):
+        """Returns the <additional> document holding only the patched vType (or its distribution)."""
+        fragment = copy.deepcopy(self.fragment)
+        vtype_elem = fragment if self._vtype_path is None else fragment.find(self._vtype_path)
+        for name, value in self.vtype_attributes(param_values_dict).items():
+            vtype_elem.set(name, value)
+        return f"<additional>\n    {ET.tostring(fragment, encoding='unicode')}\n</additional>\n"
+
+    def write_vtype_additional(self, path, param_values_dict):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.render_vtype_additional(param_values_dict))
+
+
+def get_route_template(route_file, vtype_id, default_speedfactor_bounds=(0.8, 1.6)):
+    """Returns this process's compiled template for route_file, parsing it on first use."""
+    key = (os.getpid(), os.path.abspath(route_file), vtype_id)
+    with _templates_lock:
+        template = _templates.get(key)
+        if template is None:
+            template = RouteTemplate(route_file, vtype_id, default_speedfactor_bounds)
+            _templates[key] = template
+    return template
@@ -0,0 +1,206 @@
+"""
+Asynchronous SUMO job scheduler.
+
+SUMO runs are started as asyncio subprocesses. A semaphore bounds how many
+run at once, each process gets a wall-clock timeout (a gridlocked run is
+killed instead of freezing the calibration), jobs can be cancelled, and a
+failed or timed-out job is retried with a new seed.
+
+Inside a coroutine, await scheduler.submit(...) directly. Synchronous code
+such as the SPSA driver uses SchedulerExecutor: it runs the event loop in a
+background thread and has the submit()/shutdown() interface of
+concurrent.futures executors, so evaluate_parameter_sets() works with it
+unchanged.
+"""
+import asyncio
+import os
+import random
+import threading
+import time
+
+from sumo_calib.profiling import record
+
+
+class SumoJobError(RuntimeError):
+    """A SUMO process failed (non-zero exit status or could not be started)."""
+
+    def __init__(self, message, stdout=None, stderr=None, returncode=None):
+        super().__init__(message)
+        self.stdout = stdout
+        self.stderr = stderr
+        self.returncode = returncode
+
+
+class SumoTimeoutError(SumoJobError):
+    """A SUMO process exceeded its wall-clock timeout and was killed."""
+
+
+class SumoJobScheduler:
+    """
+    Runs SUMO jobs on the current event loop with bounded concurrency, timeouts and retries.
+
+    max_concurrency: number of SUMO processes running at the same time (default: CPU count).
+    timeout: wall-clock seconds per SUMO process (None = no limit).
+    max_retries: how often a failed or timed-out job is retried, each time with a new seed.
+    """
+
+    def __init__(self, max_concurrency=None, timeout=None, max_retries=1, seed_rng=None):
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.seed_rng = seed_rng or random.Random()
+        self._semaphore = None
+        self._tasks = set()
+        self.num_timeouts = 0
+        self.num_retries = 0
+
+    @classmethod
+    def from_project(cls, project):
+        """Scheduler with the [parallel] settings of a calibration project."""
+        return cls(max_concurrency=project.num_eval_workers, timeout=project.sumo_timeout,
+                   max_retries=project.sumo_max_retries)
+
+    @property
+    def semaphore(self):
+        # Created lazily so that it belongs to the loop the scheduler is used on
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def run_process(self, argv, cwd=None, timeout=None, monitor=None, poll_interval=1.0):
+        """
+        Runs one SUMO process (slot-limited) and returns its stdout; raises SumoJobError/SumoTimeoutError.
+
+        monitor(cwd), if given, is called every poll_interval seconds while SUMO runs; an exception
+        it raises (e.g. pruning.EvaluationPruned) kills the process and is passed on to the caller.
+        """
+        timeout = self.timeout if timeout is None else timeout
+        wait_start = time.perf_counter()
+        async with self.semaphore:
+            record('slot_wait', time.perf_counter() - wait_start)
+            sumo_start = time.perf_counter()
+            try:
+                process = await asyncio.create_subprocess_exec(*argv, cwd=cwd, stdout=asyncio.subprocess.PIPE,
+                                                               stderr=asyncio.subprocess.PIPE)
+            except OSError as e:
+                raise SumoJobError(f"Failed to start SUMO: {e}")
+            try:
+                if monitor is None:
+                    stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+                else:
+                    stdout, stderr = await self._communicate_monitored(process, timeout, monitor, cwd,
+                                                                       poll_interval)
+            except asyncio.TimeoutError:
+                self.num_timeouts += 1
+                await self._kill(process)
+                raise SumoTimeoutError(f"SUMO exceeded the timeout of {timeout} s and was killed.")
+            except BaseException:
+                # Cancelled, or stopped by the monitor
+                await self._kill(process)
+                raise
+            finally:
+                record('sumo', time.perf_counter() - sumo_start)
+        stdout = stdout.decode(errors='replace')
+        stderr = stderr.decode(errors='replace')
+        if process.returncode != 0:
+            raise SumoJobError(f"SUMO exited with status {process.returncode}.", stdout, stderr,
+                               returncode=process.returncode)
+        return stdout
+
+    @staticmethod
+    async def _communicate_monitored(process, timeout, monitor, cwd, poll_interval):
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        communicate = asyncio.ensure_future(process.communicate())
+        try:
+            while True:
+                done, _ = await asyncio.wait({communicate}, timeout=poll_interval)
+                if done:
+                    return communicate.result()
+                if deadline is not None and loop.time() > deadline:
+                    raise asyncio.TimeoutError()
+                monitor(cwd)
+        finally:
+            if not communicate.done():
+                communicate.cancel()
+
+    @staticmethod
+    async def _kill(process):
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass
+            await process.wait()
+
+    async def run_with_retries(self, job, sim_seed, label="job"):
+        """
+        Awaits job(sim_seed); on SumoJobError the job is retried with a newly drawn seed.
+        Returns (result, seed_used). The last error is raised when all attempts failed.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                return await job(sim_seed), sim_seed
+            except SumoJobError as e:
+                if attempt == self.max_retries:
+                    raise
+                self.num_retries += 1
+                new_seed = self.seed_rng.randint(1, 100000)
+                print(f"WARNING [{label}]: {e} Retrying with seed {new_seed} (was {sim_seed}).")
+                sim_seed = new_seed
+
+    def submit(self, coroutine):
+        """Schedules a coroutine as a task on the running loop and returns the task (an awaitable future)."""
+        task = asyncio.ensure_future(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def cancel_all(self):
+        """Cancels all pending jobs; their SUMO processes are killed."""
+        for task in list(self._tasks):
+            task.cancel()
+
+
+class SchedulerExecutor:
+    """
+    concurrent.futures-style front end of a SumoJobScheduler for synchronous callers.
+
+    submit(objective, params, run_id_suffix=..., sim_seed=...) calls
+    objective.evaluate_async(params, run_id_suffix=..., sim_seed=..., scheduler=...)
+    on a background event loop and returns a concurrent.futures.Future.
+    """
+
+    def __init__(self, scheduler=None, **scheduler_kwargs):
+        self.scheduler = scheduler or SumoJobScheduler(**scheduler_kwargs)
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="sumo-job-scheduler", daemon=True)
+        self._thread.start()
+
+    def submit_coroutine(self, coroutine):
+        """Runs a coroutine on the scheduler loop; returns a concurrent.futures.Future."""
+        async def tracked():
+            return await self.scheduler.submit(coroutine)
+        return asyncio.run_coroutine_threadsafe(tracked(), self._loop)
+
+    def submit(self, objective, *args, **kwargs):
+        evaluate_async = getattr(objective, 'evaluate_async', None)
+        if evaluate_async is None:
+            # Plain functions cannot be scheduled as SUMO jobs; run them in the loop's default thread pool
+            return self.submit_coroutine(self._run_blocking(objective, args, kwargs))
+        return self.submit_coroutine(evaluate_async(*args, scheduler=self.scheduler, **kwargs))
+
+    async def _run_blocking(self, fn, args, kwargs):
+        return await self._loop.run_in_executor(None, lambda: fn(*args, **kwargs))
+
+    def cancel_all(self):
+        """Cancels all pending jobs; their SUMO processes are killed."""
+        self._loop.call_soon_threadsafe(self.scheduler.cancel_all)
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        if cancel_futures:
+            self.cancel_all()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        if wait:
+            self._thread.join()
+            self._loop.close()
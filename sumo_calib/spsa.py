@@ -0,0 +1,229 @@
+"""
+Simultaneous Perturbation Stochastic Approximation (SPSA) for SUMO calibration.
+
+Each iteration draws num_perturbations Rademacher directions and evaluates
+theta +/- c_k * delta for all of them, either serially or concurrently in an
+executor. The simulation seeds are drawn here in the driver, so a fixed
+run_seed gives the same result with and without an executor.
+"""
+import random
+import time
+
+import numpy as np
+
+from sumo_calib.pruning import is_measured
+
+
+def evaluate_parameter_sets(objective_func, param_sets, run_ids, sim_seeds, executor=None, prune_above=None):
+    """
+    Evaluates several parameter vectors and returns their errors in the same order.
+    With an executor (ProcessPoolExecutor or scheduler.SchedulerExecutor) all simulations are submitted at once
+    and run concurrently; without one they run one after another.
+    prune_above is passed to the objective (see pruning.py); simulations that are stopped return a PrunedError.
+    """
+    kwargs = {} if prune_above is None else {'prune_above': prune_above}
+    if executor is None:
+        return [objective_func(params, run_id_suffix=run_id, sim_seed=seed, **kwargs)
+                for params, run_id, seed in zip(param_sets, run_ids, sim_seeds)]
+
+    futures = [executor.submit(objective_func, params, run_id_suffix=run_id, sim_seed=seed, **kwargs)
+               for params, run_id, seed in zip(param_sets, run_ids, sim_seeds)]
+    results = []
+    for future, run_id in zip(futures, run_ids):
+        try:
+            results.append(future.result())
+        except Exception as e:
+            print(f"ERROR [{run_id}]: Parallel evaluation failed: {e}")
+            results.append(1e9)
+    return results
+
+
+# --- SPSA Algorithm Implementation ---
+def run_spsa_calibration(objective_func, initial_params, bounds, max_iterations,
+                         a, c, A, alpha, gamma, run_seed=None, run_name="Run", executor=None,
+                         num_perturbations=1, param_names=None, surrogate=None, tracker=None,
+                         run_state=None, on_iteration=None):
+    """
+    Executes SPSA calibration for a single run.
+
+    Args:
+        objective_func: The function to minimize. Takes parameter numpy array, returns scalar error (RMSE).
+        initial_params (np.array): Initial guess for parameters.
+        bounds (np.array): Bounds for parameters [(min1, max1), ...].
+        max_iterations (int): Maximum number of SPSA iterations.
+        a, c, A, alpha, gamma: SPSA hyperparameters.
+        run_seed (int, optional): Random seed for reproducibility.
+        run_name (str): Name for this calibration run (e.g., "Run 1", "Restart 1").
+        executor (optional): Process pool or SchedulerExecutor used to run y_plus and y_minus at the same time.
+            None evaluates them serially.
+        num_perturbations (int): Number of independent Rademacher directions drawn per iteration.
+            All 2*num_perturbations simulations are evaluated together and the gradient
+            estimates are averaged.
+        param_names (list, optional): Parameter names, only used to print the initial parameters.
+        surrogate (SurrogateScreen, optional): Model trained on all simulations so far (it can be shared
+            by several runs). Once it is trained it picks the perturbation directions, replaces the
+            simulations of iterations it is confident about and proposes extra candidates.
+        tracker (optimizers.EvaluationTracker, optional): If given, all simulations are evaluated through it
+            (in executor), so they are counted in its convergence history like those of the other optimizers.
+        run_state (dict, optional): State passed to on_iteration by an interrupted run; the run continues
+            from it exactly (including the random generators).
+        on_iteration (callable, optional): Called with the run state after every iteration (for checkpoints).
+
+    Returns:
+        tuple: (final_params_of_this_run, best_params_in_this_run, best_error_in_this_run, error_history_this_run,
+                iteration_times_this_run)
+        error_history_this_run records the best error found *so far* within THIS run at each iteration.
+        iteration_times_this_run records the wall-clock seconds spent on each iteration.
+    """
+    # Generators of this run only (the same streams as seeding the global ones), so restarts
+    # running at the same time in threads do not interfere
+    direction_rng = np.random.RandomState(run_seed)
+    seed_rng = random.Random(run_seed)
+
+    theta = np.copy(initial_params)
+    n_params = len(theta)
+    error_history_this_run = []
+    iteration_times_this_run = []
+    best_error = float('inf') # Initialize best error to infinity
+    best_params = np.copy(theta)
+
+    start_iteration = 0
+    if run_state is not None:
+        start_iteration = run_state['iteration']
+        theta = np.copy(run_state['theta'])
+        best_error = run_state['best_error']
+        best_params = np.copy(run_state['best_params'])
+        error_history_this_run = list(run_state['error_history'])
+        iteration_times_this_run = list(run_state['iteration_times'])
+        direction_rng.set_state(run_state['direction_rng'])
+        seed_rng.setstate(run_state['seed_rng'])
+
+    def iteration_done(k):
+        if on_iteration is not None:
+            on_iteration({'iteration': k + 1, 'theta': np.copy(theta), 'best_error': best_error,
+                          'best_params': np.copy(best_params), 'error_history': list(error_history_this_run),
+                          'iteration_times': list(iteration_times_this_run),
+                          'direction_rng': direction_rng.get_state(), 'seed_rng': seed_rng.getstate()})
+
+    if start_iteration > 0:
+        print(f"\n--- Resuming SPSA Run: {run_name} at iteration {start_iteration + 1}/{max_iterations} "
+              f"(best error so far {best_error:.4f} m/s) ---")
+    else:
+        print(f"\n--- Starting SPSA Run: {run_name} ---")
+        if param_names is not None:
+            print(f"Initial Params: {dict(zip(param_names, initial_params))}")
+        else:
+            print(f"Initial Params: {initial_params}")
+
+    for k in range(start_iteration, max_iterations):
+        iteration_start_time = time.time()
+        a_k = a / (k + 1 + A)**alpha
+        c_k = c / (k + 1)**gamma
+
+        # One row per perturbation direction (a single row reproduces classic SPSA)
+        deltas = (direction_rng.randint(0, 2, size=(num_perturbations, n_params)) * 2 - 1.0)
+        predicted_errors = None
+        if surrogate is not None and surrogate.ready:
+            deltas, predicted_errors = surrogate.screen(theta, c_k, num_perturbations, k)
+
+        param_sets = []
+        run_ids = []
+        sim_seeds = []
+        for j, delta_k in enumerate(deltas):
+            theta_plus = np.clip(theta + c_k * delta_k, bounds[:, 0], bounds[:, 1])
+            theta_minus = np.clip(theta - c_k * delta_k, bounds[:, 0], bounds[:, 1])
+            param_sets.extend([theta_plus, theta_minus])
+
+            suffix = "" if j == 0 else str(j + 1)
+            run_ids.extend([f"{run_name}_iter{k+1}_p{suffix}", f"{run_name}_iter{k+1}_m{suffix}"])
+
+            # Seeds are drawn here (not inside the worker) so serial and parallel runs match
+            sim_seeds.extend([seed_rng.randint(1, 100000), seed_rng.randint(1, 100000)])
+
+        # The surrogate's most promising point is simulated together with the perturbations
+        proposal = None
+        if surrogate is not None and surrogate.wants_proposal(k):
+            proposal = surrogate.propose(best_params if best_error < float('inf') else theta)
+
+        if predicted_errors is None:
+            eval_sets, eval_ids, eval_seeds = list(param_sets), list(run_ids), list(sim_seeds)
+        else:
+            eval_sets, eval_ids, eval_seeds = [], [], []
+        if proposal is not None:
+            eval_sets.append(proposal)
+            eval_ids.append(f"{run_name}_iter{k+1}_s")
+            eval_seeds.append(seed_rng.randint(1, 100000))
+        if not eval_sets:
+            simulated_errors = []
+        elif tracker is not None:
+            simulated_errors = tracker.evaluate(eval_sets, eval_ids, eval_seeds, executor=executor)
+        else:
+            simulated_errors = evaluate_parameter_sets(objective_func, eval_sets, eval_ids, eval_seeds,
+                                                       executor=executor)
+        if surrogate is not None:
+            surrogate.add(eval_sets, simulated_errors)
+
+        jump_to_proposal = False
+        if proposal is not None:
+            proposal_error = simulated_errors.pop()
+            if is_measured(proposal_error) and proposal_error < best_error:
+                # SPSA continues from the proposed point
+                best_error = proposal_error
+                best_params = np.copy(proposal)
+                jump_to_proposal = True
+        errors = simulated_errors if predicted_errors is None else list(predicted_errors)
+
+        # Model predictions never count as best errors; only measured simulations do, including the
+        # measured side of a direction whose other side failed or was pruned
+        if predicted_errors is None:
+            measured = [i for i, error in enumerate(errors) if is_measured(error)]
+            current_iteration_best_eval_error = float('inf')
+            if measured:
+                best_eval_idx = min(measured, key=lambda i: errors[i])
+                current_iteration_best_eval_error = errors[best_eval_idx]
+                if current_iteration_best_eval_error < best_error:
+                    best_error = current_iteration_best_eval_error
+                    best_params = np.copy(param_sets[best_eval_idx])
+        else:
+            current_iteration_best_eval_error = min(errors)
+
+        # Average the gradient estimates of all directions whose two evaluations were measured
+        # (failed and pruned evaluations give no slope)
+        grad_estimates = []
+        for j, delta_k in enumerate(deltas):
+            y_plus, y_minus = errors[2 * j], errors[2 * j + 1]
+            if not (is_measured(y_plus) and is_measured(y_minus)):
+                continue
+            denominator = 2.0 * c_k * delta_k
+            denominator[np.abs(denominator) < 1e-9] = np.copysign(1e-9, denominator[np.abs(denominator) < 1e-9])
+            grad_estimates.append((y_plus - y_minus) / denominator)
+
+        if not grad_estimates:
+            print(f"  {run_name} Iteration {k+1}/{max_iterations}: Evaluation failed or pruned. Skipping update.")
+            if jump_to_proposal:
+                theta = np.copy(proposal)
+            error_history_this_run.append(best_error) # Append previous best error
+            iteration_times_this_run.append(time.time() - iteration_start_time)
+            iteration_done(k)
+            continue
+
+        grad_approx = np.mean(grad_estimates, axis=0)
+
+        theta = theta - a_k * grad_approx
+        theta = np.clip(theta, bounds[:, 0], bounds[:, 1])
+
+        if jump_to_proposal:
+            theta = np.copy(proposal)
+
+        error_history_this_run.append(best_error)
+        iteration_times_this_run.append(time.time() - iteration_start_time)
+        iteration_done(k)
+
+        if (k + 1) % 10 == 0 or k == max_iterations - 1 or k == 0:
+             print(f"  {run_name} Iteration {k+1}/{max_iterations}: Best Eval Error={current_iteration_best_eval_error:.4f} m/s, Best Error Found So Far in {run_name}={best_error:.4f} m/s, Iteration Time={iteration_times_this_run[-1]:.1f} s")
+
+
+    print(f"--- SPSA Run {run_name} Finished (mean iteration time {np.mean(iteration_times_this_run):.1f} s) ---")
+    if surrogate is not None:
+        print(f"Surrogate: {surrogate.num_simulated} SUMO simulations so far, {surrogate.num_predicted} replaced by model predictions.")
+    return theta, best_params, best_error, error_history_this_run, iteration_times_this_run
@@ -0,0 +1,145 @@
+"""
+Surrogate model of the calibration RMSE for pre-screening SPSA candidates.
+
+GaussianProcessSurrogate is a NumPy Gaussian process (RBF kernel on parameters
+scaled to [0, 1], observation noise for the seed-to-seed variation of SUMO)
+trained on every successful SUMO evaluation. Its kernel length scale and noise
+level are chosen by maximising the log marginal likelihood over a small grid.
+
+SurrogateScreen uses it inside the SPSA iteration (see spsa.py):
+  - screen(): from many random perturbation directions, pick the ones to send
+    to SUMO (those whose y_plus - y_minus the model is least sure about). If
+    the model is confident about the gradient signal of its best directions,
+    the iteration is taken on the model's predictions without any simulation
+    (every verify_every-th iteration is always simulated).
+  - propose(): every propose_every iterations, the minimiser of the lower
+    confidence bound (mean - kappa * std) near the current point is simulated
+    as an extra candidate; SPSA continues from it if it beats the best so far.
+"""
+import numpy as np
+
+from sumo_calib.project import DEFAULT_SURROGATE_SETTINGS
+from sumo_calib.pruning import is_measured
+
+
+class GaussianProcessSurrogate:
+    """Gaussian-process regression of the RMSE over the (scaled) parameter vector."""
+
+    def __init__(self, bounds, max_points=400, length_scales=(0.15, 0.3, 0.6, 1.2), noise_levels=(1e-3, 1e-2, 1e-1)):
+        self.lower = np.asarray(bounds, dtype=float)[:, 0]
+        self.span = np.asarray(bounds, dtype=float)[:, 1] - self.lower
+        self.span[self.span == 0] = 1.0
+        self.max_points = max_points
+        self.length_scales = length_scales
+        self.noise_levels = noise_levels
+        self.X = np.empty((0, len(self.lower)))
+        self.y = np.empty(0)
+        self._fitted_size = None
+
+    def __len__(self):
+        return len(self.y)
+
+    def scale(self, params):
+        return (np.atleast_2d(params) - self.lower) / self.span
+
+    def add(self, params, error):
+        self.X = np.vstack([self.X, self.scale(params)])[-self.max_points:]
+        self.y = np.append(self.y, float(error))[-self.max_points:]
+
+    @staticmethod
+    def _kernel(A, B, length_scale):
+        squared_distances = np.sum(A ** 2, 1)[:, None] + np.sum(B ** 2, 1)[None, :] - 2 * A @ B.T
+        return np.exp(-0.5 * np.maximum(squared_distances, 0) / length_scale ** 2)
+
+    def fit(self):
+        """(Re)fits the hyperparameters and the posterior if evaluations were added since the last fit."""
+        if self._fitted_size == (len(self.y), float(self.y.sum())):
+            return
+        self.y_mean = self.y.mean()
+        self.y_std = self.y.std() or 1.0
+        y = (self.y - self.y_mean) / self.y_std
+        best = None
+        for length_scale in self.length_scales:
+            K = self._kernel(self.X, self.X, length_scale)
+            for noise in self.noise_levels:
+                try:
+                    L = np.linalg.cholesky(K + (noise + 1e-8) * np.eye(len(y)))
+                except np.linalg.LinAlgError:
+                    continue
+                alpha = np.linalg.solve(L.T, np.linalg.solve(L, y))
+                log_likelihood = -0.5 * y @ alpha - np.sum(np.log(np.diag(L)))
+                if best is None or log_likelihood > best[0]:
+                    best = (log_likelihood, length_scale, L, alpha)
+        _, self.length_scale, self._L, self._alpha = best
+        self._fitted_size = (len(self.y), float(self.y.sum()))
+
+    def predict(self, params):
+        """(mean, std) of the RMSE at the given parameter vectors (rows)."""
+        self.fit()
+        X = self.scale(params)
+        K_star = self._kernel(X, self.X, self.length_scale)
+        mean = K_star @ self._alpha
+        v = np.linalg.solve(self._L, K_star.T)
+        variance = np.maximum(1.0 - np.sum(v ** 2, axis=0), 1e-12)
+        return self.y_mean + self.y_std * mean, self.y_std * np.sqrt(variance)
+
+
+class SurrogateScreen:
+    """Decides per SPSA iteration which perturbations are simulated and which are taken from the model."""
+
+    def __init__(self, bounds, settings=None, rng_seed=None):
+        self.settings = dict(DEFAULT_SURROGATE_SETTINGS, **(settings or {}))
+        self.bounds = np.asarray(bounds, dtype=float)
+        self.model = GaussianProcessSurrogate(self.bounds, max_points=self.settings['max_points'])
+        self.rng = np.random.default_rng(rng_seed)
+        self.num_simulated = 0
+        self.num_predicted = 0
+
+    @property
+    def ready(self):
+        return len(self.model) >= self.settings['min_points']
+
+    def add(self, param_sets, errors):
+        """Adds the measured evaluations (no failures or pruned lower bounds) to the training data."""
+        for params, error in zip(param_sets, errors):
+            self.num_simulated += 1
+            if is_measured(error):
+                self.model.add(params, error)
+
+    def screen(self, theta, c_k, num_selected, iteration):
+        """
+        Returns (deltas, predicted_errors). predicted_errors is None if the deltas must be simulated,
+        otherwise the model's [y_plus, y_minus, ...] for them.
+        """
+        n_params = len(theta)
+        candidates = self.rng.integers(0, 2, size=(self.settings['num_candidates'], n_params)) * 2 - 1.0
+        plus = np.clip(theta + c_k * candidates, self.bounds[:, 0], self.bounds[:, 1])
+        minus = np.clip(theta - c_k * candidates, self.bounds[:, 0], self.bounds[:, 1])
+        mean, std = self.model.predict(np.vstack([plus, minus]))
+        n = len(candidates)
+        difference = mean[:n] - mean[n:]
+        difference_std = np.sqrt(std[:n] ** 2 + std[n:] ** 2)
+
+        # Directions with the clearest predicted gradient signal
+        confident = np.argsort(difference_std / (np.abs(difference) + 1e-12))[:num_selected]
+        force_simulation = self.settings['verify_every'] and (iteration + 1) % self.settings['verify_every'] == 0
+        if not force_simulation and np.all(difference_std[confident] < self.settings['confidence'] * np.abs(difference[confident])):
+            self.num_predicted += 2 * num_selected
+            predicted = np.column_stack([mean[:n][confident], mean[n:][confident]]).ravel()
+            return candidates[confident], predicted.tolist()
+
+        # Otherwise simulate the directions the model knows least about
+        informative = np.argsort(-difference_std)[:num_selected]
+        return candidates[informative], None
+
+    def wants_proposal(self, iteration):
+        every = self.settings['propose_every']
+        return bool(every) and self.ready and (iteration + 1) % every == 0
+
+    def propose(self, center, num_samples=512):
+        """The lowest lower-confidence-bound point among random samples around center."""
+        radius = self.settings['propose_radius'] * (self.bounds[:, 1] - self.bounds[:, 0])
+        samples = center + self.rng.uniform(-1, 1, size=(num_samples, len(center))) * radius
+        samples = np.clip(samples, self.bounds[:, 0], self.bounds[:, 1])
+        mean, std = self.model.predict(samples)
+        return samples[int(np.argmin(mean - self.settings['kappa'] * std))]
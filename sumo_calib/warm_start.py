@@ -0,0 +1,182 @@
+"""
+Warm-start snapshots: the warm-up is simulated once and saved with --save-state.
+
+With [warm_start] enabled, the warm-up of a small pool of seeds is simulated once
+with reference parameters (default: the initial parameters) and saved as a SUMO
+state at the end of the warm-up. An evaluation then loads the snapshot of the
+pool seed picked by its own seed (--load-state, --begin <warm-up>), patches the
+calibrated vType inside the state (or sets it through the API for the in-process
+engines) and only simulates the calibration window. The seed of the evaluation
+still drives everything after the warm-up.
+
+This is an approximation: the vehicles already in the network at the end of the
+warm-up were simulated with the reference parameters. check_fidelity() compares
+warm-started and full runs, and run_calibration() falls back to full runs when
+the difference exceeds the tolerance.
+
+Snapshots are stored in a directory shared by all worker processes, under a key
+of everything they depend on, so they are built once and reused by later runs.
+"""
+import copy
+import os
+import re
+import threading
+import xml.etree.ElementTree as ET
+
+import numpy as np
+
+from sumo_calib.cache import make_cache_key
+
+# {(pid, snapshot dir, key): WarmStartSnapshots}
+_snapshot_pools = {}
+_snapshot_pools_lock = threading.Lock()
+
+
+class StateTemplate:
+    """A saved SUMO state (XML) with the calibrated vType cut out, so it can be written with patched attributes."""
+
+    def __init__(self, state_file, vtype_id, time):
+        self.state_file = state_file
+        self.time = time
+        with open(state_file, encoding='utf-8') as f:
+            text = f.read()
+        match = re.search(rf'<vType\s[^>]*\bid="{re.escape(vtype_id)}"[^>]*?(?:/>|>.*?</vType>)', text, re.DOTALL)
+        if match is None:
+            raise ValueError(f"vType '{vtype_id}' not found in saved state '{state_file}'.")
+        self.head = text[:match.start()]
+        self.tail = text[match.end():]
+        self.vtype_elem = ET.fromstring(match.group(0))
+
+    def write(self, path, vtype_attributes):
+        """Writes the state with the given vType attributes (name -> string)."""
+        vtype_elem = copy.deepcopy(self.vtype_elem)
+        for name, value in vtype_attributes.items():
+            vtype_elem.set(name, value)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.head)
+            f.write(ET.tostring(vtype_elem, encoding='unicode'))
+            f.write(self.tail)
+
+
+class WarmStartSnapshots:
+    """The pool of warm-up snapshots of a project (built on first use)."""
+
+    def __init__(self, project):
+        self.project = project
+        settings = project.warm_start
+        self.snapshot_dir = project.resolve(settings['dir'])
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        self.seeds = [settings['base_seed'] + i for i in range(settings['num_snapshots'])]
+        self.reference_params = settings['reference_params'] or dict(zip(project.param_names,
+                                                                         project.default_params.tolist()))
+        self.time = project.warmup
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    @property
+    def signature(self):
+        """What a warm-started result depends on besides the evaluated parameters (part of the cache key)."""
+        return {'seeds': self.seeds, 'reference': self.reference_params, 'time': self.time}
+
+    def snapshot_seed(self, sim_seed):
+        # A pool seed uses its own snapshot, so a warm-started run of the reference parameters equals a full run
+        if sim_seed in self.seeds:
+            return sim_seed
+        return self.seeds[sim_seed % len(self.seeds)]
+
+    def snapshot_path(self, snapshot_seed):
+        project = self.project
+        key = make_cache_key(self.reference_params, snapshot_seed, project.scenario_files,
+                             (self.time, project.step_length, project.time_to_teleport),
+                             context={'snapshot': project.vtype_id})
+        return os.path.join(self.snapshot_dir, f"state_{key[:32]}.xml")
+
+    def build(self, snapshot_seed, path):
+        """Simulates the warm-up with the reference parameters and saves the state at its end."""
+        from sumo_calib.evaluation import run_simulation
+
+        # Written under a temporary name first, so other workers never read a half-written state
+        temp_path = f"{path[:-len('.xml')]}.{os.getpid()}.{threading.get_ident()}.tmp.xml"
+        print(f"  Building warm-start snapshot for seed {snapshot_seed} (warm-up {self.time} s)...")
+        succeeded = run_simulation(self.project, self.reference_params, snapshot_seed,
+                                   self.time + self.project.step_length, read_output=None,
+                                   run_label=f"warm-up snapshot seed {snapshot_seed}",
+                                   extra_options=["--save-state.times", str(self.time),
+                                                  "--save-state.files", temp_path])
+        if not succeeded or not os.path.exists(temp_path):
+            print(f"ERROR: Warm-start snapshot for seed {snapshot_seed} was not written.")
+            return False
+        os.replace(temp_path, path)
+        return True
+
+    def state_for(self, sim_seed):
+        """StateTemplate of the snapshot used for sim_seed (built if missing), or None on failure."""
+        snapshot_seed = self.snapshot_seed(sim_seed)
+        with self._lock:
+            template = self._templates.get(snapshot_seed)
+            if template is not None:
+                return template
+            path = self.snapshot_path(snapshot_seed)
+            if not os.path.exists(path) and not self.build(snapshot_seed, path):
+                return None
+            try:
+                template = StateTemplate(path, self.project.vtype_id, self.time)
+            except Exception as e:
+                print(f"ERROR: Failed to read warm-start snapshot {path}: {e}")
+                return None
+            self._templates[snapshot_seed] = template
+            return template
+
+
+def get_warm_start_snapshots(project):
+    """Returns this process's snapshot pool of the project."""
+    settings = project.warm_start
+    key = (os.getpid(), project.resolve(settings['dir']), project.path, settings['num_snapshots'],
+           settings['base_seed'], repr(settings['reference_params']))
+    with _snapshot_pools_lock:
+        snapshots = _snapshot_pools.get(key)
+        if snapshots is None:
+            snapshots = WarmStartSnapshots(project)
+            _snapshot_pools[key] = snapshots
+    return snapshots
+
+
+def check_fidelity(objective, num_samples=3, tolerance=0.25, rng_seed=0):
+    """
+    Evaluates the reference parameters and num_samples - 1 random parameter sets inside the bounds
+    with a full run and warm-started, using the snapshot seeds so that the warm-up of the reference
+    parameters is identical. Returns (passed, max_abs_difference).
+    """
+    project = objective.project
+    snapshots = get_warm_start_snapshots(project)
+    bounds = project.param_bounds
+    rng = np.random.default_rng(rng_seed)
+    param_sets = [dict(snapshots.reference_params)]
+    for _ in range(num_samples - 1):
+        param_sets.append(dict(zip(project.param_names, rng.uniform(bounds[:, 0], bounds[:, 1]).tolist())))
+
+    print("--- Warm-start fidelity check (warm-started vs. full run) ---")
+    differences = []
+    warm_start = objective.warm_start
+    try:
+        for i, params in enumerate(param_sets):
+            seed = snapshots.seeds[i % len(snapshots.seeds)]
+            objective.warm_start = False
+            full_rmse = objective.evaluate(params, run_id_suffix=f"fidelity_{i + 1}_full", sim_seed=seed)
+            objective.warm_start = True
+            warm_rmse = objective.evaluate(params, run_id_suffix=f"fidelity_{i + 1}_warm", sim_seed=seed)
+            if full_rmse >= 1e9 or warm_rmse >= 1e9:
+                print(f"  Sample {i + 1}: evaluation failed (full {full_rmse:.4f}, warm start {warm_rmse:.4f}).")
+                differences.append(float('inf'))
+                continue
+            differences.append(abs(warm_rmse - full_rmse))
+            print(f"  Sample {i + 1} (seed {seed}): full {full_rmse:.4f} m/s, warm start {warm_rmse:.4f} m/s, "
+                  f"difference {differences[-1]:.4f} m/s")
+    finally:
+        objective.warm_start = warm_start
+
+    max_difference = max(differences) if differences else float('inf')
+    passed = max_difference <= tolerance
+    print(f"Max |difference| {max_difference:.4f} m/s (tolerance {tolerance} m/s): "
+          f"{'warm start accepted' if passed else 'warm start REJECTED'}")
+    return passed, max_difference
@@ -0,0 +1,115 @@
+"""
+Long-lived scenario workspace for repeated SUMO runs.
+
+The immutable scenario inputs (.net.xml, detector .add.xml, ...) are staged once
+per worker process into a workspace directory, using a hardlink, a symlink or -
+only if both fail - a single copy. Each simulation then runs in a "slot": a
+sub-directory that already links to the staged inputs. A run writes only its own
+route file and outputs into the slot, and releasing the slot deletes exactly
+those per-run files, so the next run reuses the slot without staging anything.
+"""
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from multiprocessing import util as mp_util
+
+# {(pid, staged files, base_dir): ScenarioWorkspace} - one workspace per process
+_workspaces = {}
+_workspaces_lock = threading.Lock()
+
+
+def link_or_copy(src, dst):
+    """Makes dst refer to src, preferring a hardlink, then a symlink, then a plain copy. Returns the method used."""
+    try:
+        os.link(src, dst)
+        return 'hardlink'
+    except (OSError, AttributeError, NotImplementedError):
+        pass
+    try:
+        os.symlink(os.path.abspath(src), dst)
+        return 'symlink'
+    except (OSError, AttributeError, NotImplementedError):
+        pass
+    shutil.copy(src, dst)
+    return 'copy'
+
+
+class ScenarioWorkspace:
+    """
+    A directory with the staged scenario inputs and a pool of reusable run slots.
+    Slots can be used from several threads at once (one run per slot).
+    """
+
+    def __init__(self, input_files, base_dir=None, prefix="sumo_ws_"):
+        self.root = tempfile.mkdtemp(prefix=f"{prefix}{os.getpid()}_", dir=base_dir)
+        self.staged_dir = os.path.join(self.root, "staged")
+        os.makedirs(self.staged_dir)
+
+        # basename -> staged path
+        self.staged_files = {}
+        for path in input_files:
+            name = os.path.basename(path)
+            staged_path = os.path.join(self.staged_dir, name)
+            method = link_or_copy(path, staged_path)
+            self.staged_files[name] = staged_path
+            if method == 'copy':
+                print(f"  Workspace: staged {name} by copy (links not possible across these directories).")
+
+        self._free_slots = []
+        self._slot_count = 0
+        self._lock = threading.Lock()
+        # Removed at interpreter exit, also inside ProcessPoolExecutor workers
+        mp_util.Finalize(self, shutil.rmtree, args=(self.root,), kwargs={'ignore_errors': True}, exitpriority=10)
+
+    def _new_slot(self):
+        with self._lock:
+            self._slot_count += 1
+            slot_dir = os.path.join(self.root, f"slot{self._slot_count}")
+        os.makedirs(slot_dir)
+        for name, staged_path in self.staged_files.items():
+            link_or_copy(staged_path, os.path.join(slot_dir, name))
+        return slot_dir
+
+    def acquire_slot(self):
+        """Returns a run directory containing links to all staged inputs."""
+        with self._lock:
+            if self._free_slots:
+                return self._free_slots.pop()
+        return self._new_slot()
+
+    def release_slot(self, slot_dir):
+        """Deletes the per-run files (route file, outputs, ...) of a slot and makes it available again."""
+        for entry in os.scandir(slot_dir):
+            if entry.name in self.staged_files:
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                else:
+                    os.remove(entry.path)
+            except OSError as e:
+                print(f"  Warning: Failed to remove per-run file {entry.path}: {e}")
+        with self._lock:
+            self._free_slots.append(slot_dir)
+
+    @contextmanager
+    def run_slot(self):
+        """Context manager around acquire_slot/release_slot."""
+        slot_dir = self.acquire_slot()
+        try:
+            yield slot_dir
+        finally:
+            self.release_slot(slot_dir)
+
+
+def get_scenario_workspace(input_files, base_dir=None):
+    """Returns this process's workspace for the given input files, staging them on first use."""
+    key = (os.getpid(), tuple(os.path.abspath(p) for p in input_files), base_dir)
+    with _workspaces_lock:
+        workspace = _workspaces.get(key)
+        if workspace is None:
+            workspace = ScenarioWorkspace(input_files, base_dir=base_dir)
+            _workspaces[key] = workspace
+    return workspace
@@ -0,0 +1,46 @@
+"""
+Variable speed limit (VSL) control with Q-learning on SUMO.
+
+    from sumo_vsl import VSLEnv, VectorVSLEnv, vsl_scenario
+    with VSLEnv(vsl_scenario(sumo_cfg="D:/SUMO/exaple2.sumocfg"), master_seed=42) as env:
+        observation, info = env.reset()
+        observation, reward, terminated, truncated, info = env.step(speed_limit_kmh)
+
+    with VectorVSLEnv(8, vsl_scenario(sumo_cfg="D:/SUMO/exaple2.sumocfg")) as envs:
+        observations = envs.reset()
+        observations, rewards, done = envs.step(speed_limits_kmh)
+
+The Q-learning scripts (Q学习2025.9.26.py etc.) train their agents through this
+package and map observations to Q-table states with its StateDiscretizer. Like
+sumo_calib, importing it is cheap: traci is only imported when an environment
+is created.
+"""
+import importlib
+
+# public name -> submodule that defines it
+_LAZY_EXPORTS = {
+    'DEFAULT_VSL_SCENARIO': 'observation',
+    'vsl_scenario': 'observation',
+    'StateDiscretizer': 'discretizer',
+    'VSLEnv': 'env',
+    'VectorVSLEnv': 'vector_env',
+    'vsl_zone': 'multizone',
+    'VSLZones': 'multizone',
+    'MultiZoneVSLEnv': 'multizone',
+    'MultiZoneVSLController': 'multizone',
+}
+
+__all__ = list(_LAZY_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _LAZY_EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'sumo_vsl' has no attribute '{name}'")
+    value = getattr(importlib.import_module(f"sumo_vsl.{module_name}"), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
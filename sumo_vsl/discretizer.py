@@ -0,0 +1,76 @@
+"""
+Discretization of continuous VSL observations into tabular Q-learning states.
+
+    discretizer = StateDiscretizer.from_intervals(upstream_states, density_states, speed_states)
+    state = discretizer.index(upstream_flow, density, speed_limit)
+    states = discretizer.indices(observations)        # (M, 3) array -> (M,) state indices
+
+Each state variable is split into bins given by their upper bounds; a value
+falls into the first bin whose upper bound is >= the value (bisect_left on the
+upper bounds), values above the last bound into the last bin. The state is the
+row-major flattened index of the bins, so a Q-table has num_states rows.
+
+The upper bounds are kept as NumPy arrays built once, and indices() bins a
+whole (M, variables) array with one np.searchsorted per variable and computes
+the flattened index arithmetically: a batch of replayed transitions, or
+millions of recorded states to evaluate a policy on, costs a few array
+operations instead of a Python loop.
+"""
+import numpy as np
+
+
+class StateDiscretizer:
+    """Bins of each state variable (as upper bounds) and the flattened state index."""
+
+    def __init__(self, *upper_bounds):
+        if not upper_bounds:
+            raise ValueError("StateDiscretizer needs at least one state variable.")
+        self.upper_bounds = []
+        for bounds in upper_bounds:
+            bounds = np.asarray(bounds, dtype=float)
+            if bounds.ndim != 1 or len(bounds) == 0:
+                raise ValueError("The bin upper bounds of a state variable must be a non-empty 1-D sequence.")
+            if np.any(np.diff(bounds) <= 0):
+                raise ValueError(f"The bin upper bounds must be strictly increasing: {bounds.tolist()}")
+            self.upper_bounds.append(bounds)
+        self.shape = tuple(len(bounds) for bounds in self.upper_bounds)
+        self.num_variables = len(self.shape)
+        self.num_states = int(np.prod(self.shape))
+
+    @classmethod
+    def from_intervals(cls, *intervals):
+        """From one list of (lower, upper) intervals per state variable, as the Q-learning scripts define them."""
+        return cls(*([upper for _, upper in variable_intervals] for variable_intervals in intervals))
+
+    def _columns(self, observations):
+        observations = np.asarray(observations, dtype=float)
+        if observations.shape[-1:] != (self.num_variables,):
+            raise ValueError(f"Expected observations with {self.num_variables} values each, "
+                             f"got an array of shape {observations.shape}.")
+        return observations
+
+    def bin_indices(self, observations):
+        """Bin of every state variable: (..., variables) observations -> (..., variables) int array."""
+        observations = self._columns(observations)
+        bins = np.empty(observations.shape, dtype=np.int64)
+        for k, bounds in enumerate(self.upper_bounds):
+            np.minimum(np.searchsorted(bounds, observations[..., k], side='left'), len(bounds) - 1,
+                       out=bins[..., k])
+        return bins
+
+    def indices(self, observations):
+        """Flattened state index: (..., variables) observations -> (...) int array."""
+        observations = self._columns(observations)
+        state = np.zeros(observations.shape[:-1], dtype=np.int64)
+        for k, bounds in enumerate(self.upper_bounds):
+            state *= len(bounds)
+            state += np.minimum(np.searchsorted(bounds, observations[..., k], side='left'), len(bounds) - 1)
+        return state
+
+    def index(self, *values):
+        """Flattened state index of one observation, given as one value per state variable."""
+        return int(self.indices(values))
+
+    def unravel(self, states):
+        """Bins of every state variable of flattened state indices: (...) -> (..., variables)."""
+        return np.stack(np.unravel_index(np.asarray(states), self.shape), axis=-1)
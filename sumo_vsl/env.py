@@ -0,0 +1,102 @@
+"""
+Gym-style environment of one VSL simulation.
+
+    env = VSLEnv(vsl_scenario(sumo_cfg="D:/SUMO/exaple2.sumocfg"), master_seed=42)
+    observation, info = env.reset()                  # or env.reset(seed=1234)
+    observation, reward, terminated, truncated, info = env.step(60)   # speed limit in km/h
+    env.close()
+
+SUMO is started on the first reset() and every later reset() reloads the
+scenario with traci.load() in the same SUMO process, so an episode does not pay
+for starting sumo and reading the network again. The episode's --seed is the
+seed given to reset(), else the next seed drawn from master_seed; without
+either SUMO's default seed is used, so every episode sees the same demand.
+
+observe_fn(sim, scenario) and reward_fn(sim, scenario) default to the state and
+reward of sumo_vsl/observation.py; an agent with its own state definition
+passes its own, and subscribe_fn(sim, scenario) to subscribe to the variables
+they read (called after every start/load, since load() drops all
+subscriptions). terminated is set when no more vehicles are expected,
+truncated at the scenario's end_time.
+
+A decision step costs two TraCI round trips however many detectors there are:
+setMaxSpeed and simulationStep, whose reply carries all subscribed values.
+With engine="libsumo" SUMO runs inside this process and there are no round
+trips at all (one simulation per process).
+"""
+import numpy as np
+
+from sumo_calib.in_process import import_sumo_api
+from sumo_vsl.observation import DEFAULT_VSL_SCENARIO, expected_vehicles, observe, subscribe, sumo_command, throughput
+
+
+class VSLEnv:
+    """One SUMO simulation of a VSL scenario, kept running and reset with load() per episode."""
+
+    def __init__(self, scenario=None, master_seed=None, observe_fn=observe, reward_fn=throughput,
+                 subscribe_fn=subscribe, engine="traci"):
+        self.scenario = dict(DEFAULT_VSL_SCENARIO, **(scenario or {}))
+        self.observe_fn = observe_fn
+        self.reward_fn = reward_fn
+        self.subscribe_fn = subscribe_fn
+        self.sim = import_sumo_api(engine)
+        self.started = False
+        self.episode_seed = None
+        # Simulation time, kept here: simulationStep(t) always runs to t
+        self.time = 0.0
+        self._seed_rng = np.random.default_rng(master_seed) if master_seed is not None else None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _observation(self):
+        return np.asarray(self.observe_fn(self.sim, self.scenario), dtype=float)
+
+    def _info(self):
+        return {'time': self.time, 'seed': self.episode_seed}
+
+    def reset(self, seed=None):
+        """Starts a new episode (with seed as SUMO --seed, if given); returns (observation, info)."""
+        if seed is None and self._seed_rng is not None:
+            seed = int(self._seed_rng.integers(0, 2**31 - 1))
+        self.episode_seed = seed
+        command = sumo_command(self.scenario)
+        if seed is not None:
+            command += ["--seed", str(seed)]
+        if self.started:
+            self.sim.load(command[1:])
+        else:
+            self.sim.start(command)
+            self.started = True
+        if self.subscribe_fn is not None:
+            self.subscribe_fn(self.sim, self.scenario)
+        self.time = self.sim.simulation.getTime()
+        return self._observation(), self._info()
+
+    def _set_speed_limit(self, speed_limit):
+        self.sim.edge.setMaxSpeed(self.scenario['warning_zone_edge'], float(speed_limit) / 3.6)  # km/h -> m/s
+
+    def step(self, speed_limit):
+        """
+        Sets the zone's speed limit (km/h) and simulates one decision interval.
+        Returns (observation, reward, terminated, truncated, info).
+        """
+        sim = self.sim
+        end_time = self.scenario['end_time']
+        self._set_speed_limit(speed_limit)
+        self.time = min(self.time + self.scenario['decision_interval'], end_time)
+        sim.simulationStep(self.time)
+        truncated = self.time >= end_time
+        terminated = not truncated and expected_vehicles(sim) <= 0
+        return self._observation(), self.reward_fn(sim, self.scenario), terminated, truncated, self._info()
+
+    def close(self):
+        if self.started:
+            try:
+                self.sim.close()
+            except Exception:
+                pass
+            self.started = False
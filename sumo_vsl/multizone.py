@@ -0,0 +1,212 @@
+"""
+Variable speed limits on many zones of a corridor at once, one Q-learning agent per zone.
+
+    zones = [vsl_zone("wz_1", upstream_detectors=["up_1_0"], downstream_detectors=["down_1_0"]),
+             vsl_zone("wz_2", upstream_detectors=["up_2_0"], downstream_detectors=["down_2_0"], lanes=2), ...]
+    with MultiZoneVSLEnv(zones, vsl_scenario(sumo_cfg="corridor.sumocfg"), engine="libsumo") as env:
+        controller = MultiZoneVSLController(env.zones)
+        controller.train(env, episodes=500, base_seed=1000)
+
+Each zone has its own edge, detectors, state bins and Q-table, with the state
+and reward of Q学习2025.9.26.py (upstream flow, zone density and current speed
+limit; vehicles past the zone's downstream detectors). Nothing is done zone by
+zone in Python: VSLZones keeps the zones as arrays (detector -> zone index
+maps, one StateDiscretizer per distinct set of bins), so the zones' flows,
+densities and rewards are one np.bincount over the subscribed detector values,
+their states one StateDiscretizer.indices() call per set of bins (usually one
+for the whole corridor), and the agents' action choice and Q-update one
+fancy-indexing operation on the stacked (zones, states, actions) Q-tables.
+Only the speed limits that changed are sent to SUMO.
+"""
+import numpy as np
+
+from sumo_vsl.discretizer import StateDiscretizer
+from sumo_vsl.env import VSLEnv
+from sumo_vsl.observation import sumo_constants
+
+# 与 Q学习2025.9.26.py 的状态空间相同：各状态区间的上界
+DEFAULT_UPSTREAM_BINS = [300 * (i + 1) for i in range(7)]                    # 0-2100 veh/h，步长300
+DEFAULT_DENSITY_BINS = ([2, 4, 6, 8, 10, 12] + [12 + (i + 1) * 0.5 for i in range(12)]
+                        + list(range(19, 25)) + [26, 28, 30, 40, 50, 60, 70, 78])  # veh/km
+DEFAULT_SPEED_BINS = [50, 60, 70, 80, 90]                                   # 当前限速 40-80 km/h，步长10
+
+DEFAULT_ZONE = {
+    'edge': None,                    # 限速控制区路段
+    'length_km': 0.8,
+    'lanes': 3,
+    'upstream_detectors': [],        # 上游检测器（统计周期内车辆数 -> 上游流量）
+    'downstream_detectors': [],      # 下游检测器（统计周期内通过车辆数 -> 奖励）
+    'upstream_bins': DEFAULT_UPSTREAM_BINS,
+    'density_bins': DEFAULT_DENSITY_BINS,
+    'speed_bins': DEFAULT_SPEED_BINS,
+    'initial_speed': 60,             # km/h
+}
+
+
+def vsl_zone(edge, **settings):
+    """One VSL zone: DEFAULT_ZONE with the given settings replaced."""
+    unknown = set(settings) - set(DEFAULT_ZONE)
+    if unknown:
+        raise ValueError(f"Unknown VSL zone settings: {', '.join(sorted(unknown))}")
+    return dict(DEFAULT_ZONE, edge=edge, **settings)
+
+
+class VSLZones:
+    """The zones of a corridor as arrays."""
+
+    def __init__(self, zones):
+        self.zones = [dict(DEFAULT_ZONE, **zone) for zone in zones]
+        self.num_zones = len(self.zones)
+        self.edges = [zone['edge'] for zone in self.zones]
+        self.lane_km = np.array([zone['length_km'] * zone['lanes'] for zone in self.zones], dtype=float)
+        self.initial_speeds = np.array([zone['initial_speed'] for zone in self.zones], dtype=float)
+        # All detectors in one list each, with the index of their zone
+        self.upstream_detectors = [d for zone in self.zones for d in zone['upstream_detectors']]
+        self.upstream_zone = np.array([i for i, zone in enumerate(self.zones) for _ in zone['upstream_detectors']],
+                                      dtype=int)
+        self.downstream_detectors = [d for zone in self.zones for d in zone['downstream_detectors']]
+        self.downstream_zone = np.array([i for i, zone in enumerate(self.zones)
+                                         for _ in zone['downstream_detectors']], dtype=int)
+
+        # State = (upstream bin, density bin, speed bin) flattened; zones with the same bins share a discretizer
+        groups = {}
+        for i, zone in enumerate(self.zones):
+            bins = tuple(tuple(float(b) for b in zone[key]) for key in ('upstream_bins', 'density_bins', 'speed_bins'))
+            groups.setdefault(bins, []).append(i)
+        self.discretizers = [(StateDiscretizer(*bins), np.array(zone_indices, dtype=int))
+                             for bins, zone_indices in groups.items()]
+        self.num_states = np.zeros(self.num_zones, dtype=int)
+        for discretizer, zone_indices in self.discretizers:
+            self.num_states[zone_indices] = discretizer.num_states
+
+    def state_indices(self, observations, speeds):
+        """Flattened state index of each zone from (zones, 2) observations and the current speed limits."""
+        states = np.column_stack([observations, np.asarray(speeds, dtype=float)])
+        if len(self.discretizers) == 1:
+            return self.discretizers[0][0].indices(states)
+        indices = np.empty(self.num_zones, dtype=np.int64)
+        for discretizer, zone_indices in self.discretizers:
+            indices[zone_indices] = discretizer.indices(states[zone_indices])
+        return indices
+
+
+class MultiZoneVSLEnv(VSLEnv):
+    """
+    VSLEnv over all zones of a corridor: step(speeds) takes one speed limit per zone (km/h) and returns
+    (zones, 2) observations (upstream flow veh/h, density veh/km) and (zones,) rewards.
+    """
+
+    def __init__(self, zones, scenario=None, master_seed=None, engine="traci"):
+        self.zones = zones if isinstance(zones, VSLZones) else VSLZones(zones)
+        super().__init__(scenario, master_seed, observe_fn=self._observe, reward_fn=self._reward,
+                         subscribe_fn=self._subscribe, engine=engine)
+        self.speed_limits = np.full(self.zones.num_zones, np.nan)
+
+    def _subscribe(self, sim, scenario):
+        tc = sumo_constants(sim)
+        zones = self.zones
+        for detector_id in zones.upstream_detectors + zones.downstream_detectors:
+            try:
+                sim.inductionloop.subscribe(detector_id, [tc.VAR_LAST_INTERVAL_NUMBER])
+            except sim.TraCIException as e:
+                print(f"WARNING: Cannot subscribe to detector {detector_id} (counted as 0): {e}")
+        for edge_id in zones.edges:
+            sim.edge.subscribe(edge_id, [tc.LAST_STEP_VEHICLE_NUMBER])
+        sim.simulation.subscribe([tc.VAR_MIN_EXPECTED_VEHICLES])
+        # load() restores the speed limits of the network
+        self.speed_limits[:] = np.nan
+
+    def _values(self, results, object_ids, variable):
+        return np.fromiter((results.get(object_id, {}).get(variable, 0) for object_id in object_ids),
+                           dtype=float, count=len(object_ids))
+
+    def _zone_counts(self, detector_ids, detector_zone):
+        counts = self._values(self.sim.inductionloop.getAllSubscriptionResults(), detector_ids,
+                              sumo_constants(self.sim).VAR_LAST_INTERVAL_NUMBER)
+        return np.bincount(detector_zone, weights=np.maximum(counts, 0), minlength=self.zones.num_zones)
+
+    def _observe(self, sim, scenario):
+        zones = self.zones
+        flows = self._zone_counts(zones.upstream_detectors, zones.upstream_zone) * 3600 / scenario['detector_freq']
+        vehicles = self._values(sim.edge.getAllSubscriptionResults(), zones.edges,
+                                sumo_constants(sim).LAST_STEP_VEHICLE_NUMBER)
+        densities = np.divide(vehicles, zones.lane_km, out=np.zeros_like(vehicles), where=zones.lane_km > 0)
+        return np.column_stack([flows, densities])
+
+    def _reward(self, sim, scenario):
+        return self._zone_counts(self.zones.downstream_detectors, self.zones.downstream_zone)
+
+    def _set_speed_limit(self, speed_limits):
+        speed_limits = np.asarray(speed_limits, dtype=float)
+        changed = np.flatnonzero(speed_limits != self.speed_limits)
+        set_max_speed = self.sim.edge.setMaxSpeed
+        edges = self.zones.edges
+        for i, speed in zip(changed.tolist(), (speed_limits[changed] / 3.6).tolist()):  # km/h -> m/s
+            set_max_speed(edges[i], speed)
+        self.speed_limits[changed] = speed_limits[changed]
+
+
+class MultiZoneVSLController:
+    """One tabular Q-learning agent per zone, stored as a (zones, states, actions) Q array."""
+
+    def __init__(self, zones, speed_changes=(-10, -5, 0, 5, 10), min_speed=40, max_speed=80, alpha=0.2, gamma=0.9,
+                 epsilon=0.5, epsilon_decay=0.995, min_epsilon=0.01, seed=None):
+        self.zones = zones if isinstance(zones, VSLZones) else VSLZones(zones)
+        self.speed_changes = np.asarray(speed_changes, dtype=float)
+        self.min_speed = min_speed
+        self.max_speed = max_speed
+        self.alpha = alpha
+        self.gamma = gamma
+        self.epsilon = epsilon
+        self.epsilon_decay = epsilon_decay
+        self.min_epsilon = min_epsilon
+        self.rng = np.random.default_rng(seed)
+        self.Q = np.zeros((self.zones.num_zones, int(self.zones.num_states.max()), len(self.speed_changes)))
+        self._zone_index = np.arange(self.zones.num_zones)
+        self.episode_rewards = []  # (zones,) total reward per episode
+
+    def choose_actions(self, state_indices, speeds):
+        """ε-greedy action of every zone; returns (action indices, new speed limits)."""
+        num_zones = self.zones.num_zones
+        greedy = np.argmax(self.Q[self._zone_index, state_indices], axis=1)
+        explore = self.rng.random(num_zones) < self.epsilon
+        actions = np.where(explore, self.rng.integers(len(self.speed_changes), size=num_zones), greedy)
+        return actions, np.clip(speeds + self.speed_changes[actions], self.min_speed, self.max_speed)
+
+    def update(self, state_indices, actions, rewards, next_state_indices):
+        """One Q-learning update per zone, all zones at once."""
+        z = self._zone_index
+        td_targets = rewards + self.gamma * np.max(self.Q[z, next_state_indices], axis=1)
+        self.Q[z, state_indices, actions] += self.alpha * (td_targets - self.Q[z, state_indices, actions])
+
+    def run_episode(self, env, seed=None, learn=True):
+        """Runs one episode in a MultiZoneVSLEnv; returns the (zones,) total rewards."""
+        observations, _ = env.reset(seed=seed)
+        speeds = self.zones.initial_speeds.copy()
+        states = self.zones.state_indices(observations, speeds)
+        total_rewards = np.zeros(self.zones.num_zones)
+        while True:
+            if learn:
+                actions, speeds = self.choose_actions(states, speeds)
+            else:
+                actions = np.argmax(self.Q[self._zone_index, states], axis=1)
+                speeds = np.clip(speeds + self.speed_changes[actions], self.min_speed, self.max_speed)
+            observations, rewards, terminated, truncated, _ = env.step(speeds)
+            next_states = self.zones.state_indices(observations, speeds)
+            if learn:
+                self.update(states, actions, rewards, next_states)
+            total_rewards += rewards
+            states = next_states
+            if terminated or truncated:
+                return total_rewards
+
+    def train(self, env, episodes, base_seed=None):
+        """Trains all zones' agents; with base_seed episode i uses SUMO seed base_seed + i."""
+        for episode in range(episodes):
+            seed = None if base_seed is None else base_seed + episode
+            total_rewards = self.run_episode(env, seed=seed)
+            self.episode_rewards.append(total_rewards)
+            print(f"回合 {episode + 1}/{episodes} 结束，{self.zones.num_zones}个限速区总奖励: {total_rewards.sum():.0f} "
+                  f"(每区平均 {total_rewards.mean():.1f}, 最低 {total_rewards.min():.0f}), ε={self.epsilon:.3f}")
+            self.epsilon = max(self.min_epsilon, self.epsilon * self.epsilon_decay)
+        return np.array(self.episode_rewards)
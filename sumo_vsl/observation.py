@@ -0,0 +1,151 @@
+"""
+Scenario settings of a VSL agent and the state/reward it reads from a running simulation.
+
+The state is the upstream demand (veh/h, from the upstream detectors' last
+aggregation interval) and the density in the speed-limit zone (veh/km); the
+reward is the number of vehicles the downstream detectors counted in their last
+interval. sim is the traci module (or a TraCI connection) of the simulation.
+
+subscribe() subscribes to all of these variables once per episode; SUMO then
+sends their values for every detector and edge with the reply to each
+simulationStep, so reading the state and reward of a decision step needs no
+further TraCI round trip. Without a subscription (or for an object that could not
+be subscribed) the readers fall back to one getter call per detector and edge.
+"""
+import importlib
+import shutil
+
+# 与 Q学习2025.9.26.py 中原来的常量相同
+DEFAULT_VSL_SCENARIO = {
+    'sumo_binary': None,                     # 不设置则用 sumolib.checkBinary('sumo')（或在 PATH 中查找 sumo）
+    'sumo_cfg': "D:/SUMO/exaple2.sumocfg",
+    'additional_files': [r"D:\SUMO\edgelanetrafficpara.add.xml"],
+    'upstream_edge': "upstream_edge",
+    'warning_zone_edge': "warning_zone.785",  # 限速控制区
+    'warning_zone_length_km': 0.8,
+    'warning_zone_lanes': 3,
+    'upstream_detectors': ["upstream_detector_0", "upstream_detector_1", "upstream_detector_2"],
+    'downstream_detectors': ["downstream_edge_0", "downstream_edge_1", "downstream_edge_2"],
+    'detector_freq': 300,                    # 检测器输出频率 (s)
+    'decision_interval': 300,                # 每个决策步骤仿真的秒数
+    'end_time': 3600,                        # 每回合仿真时长 (s)
+    'fallback_flow': 800,                    # 所有上游数据都不可用时的流量 (veh/h)
+}
+
+
+def vsl_scenario(**settings):
+    """DEFAULT_VSL_SCENARIO with the given settings replaced."""
+    unknown = set(settings) - set(DEFAULT_VSL_SCENARIO)
+    if unknown:
+        raise ValueError(f"Unknown VSL scenario settings: {', '.join(sorted(unknown))}")
+    return dict(DEFAULT_VSL_SCENARIO, **settings)
+
+
+def sumo_command(scenario):
+    """The sumo command line of a scenario (without the per-episode options)."""
+    binary = scenario['sumo_binary']
+    if not binary:
+        try:
+            from sumolib import checkBinary
+            binary = checkBinary('sumo')
+        except ImportError:
+            binary = shutil.which('sumo') or 'sumo'
+    command = [binary, "-c", scenario['sumo_cfg']]
+    if scenario['additional_files']:
+        command += ["--additional-files", ",".join(scenario['additional_files'])]
+    return command
+
+
+def sumo_constants(sim):
+    """The TraCI constants module (libsumo uses the constants of the traci package)."""
+    constants = getattr(sim, 'constants', None)
+    return constants if constants is not None else importlib.import_module("traci.constants")
+
+
+def subscribe(sim, scenario):
+    """Subscribes to the detector, edge and simulation variables of the state and reward (after every start/load)."""
+    tc = sumo_constants(sim)
+    for detector_id in scenario['upstream_detectors'] + scenario['downstream_detectors']:
+        try:
+            sim.inductionloop.subscribe(detector_id, [tc.VAR_LAST_INTERVAL_NUMBER])
+        except sim.TraCIException as e:
+            print(f"WARNING: Cannot subscribe to detector {detector_id}: {e}")
+    for edge_id in (scenario['warning_zone_edge'], scenario['upstream_edge']):
+        try:
+            sim.edge.subscribe(edge_id, [tc.LAST_STEP_VEHICLE_NUMBER])
+        except sim.TraCIException as e:
+            print(f"WARNING: Cannot subscribe to edge {edge_id}: {e}")
+    sim.simulation.subscribe([tc.VAR_MIN_EXPECTED_VEHICLES])
+
+
+def _subscribed(results, object_id, variable):
+    """A subscribed value from getAllSubscriptionResults(), or None if it is not subscribed."""
+    values = results.get(object_id)
+    return None if values is None else values.get(variable)
+
+
+def expected_vehicles(sim):
+    """Vehicles still in or expected to enter the network."""
+    value = sim.simulation.getSubscriptionResults().get(sumo_constants(sim).VAR_MIN_EXPECTED_VEHICLES)
+    return sim.simulation.getMinExpectedNumber() if value is None else value
+
+
+def _interval_vehicles(sim, loops, detector_id):
+    value = _subscribed(loops, detector_id, sumo_constants(sim).VAR_LAST_INTERVAL_NUMBER)
+    return sim.inductionloop.getLastIntervalVehicleNumber(detector_id) if value is None else value
+
+
+def _edge_vehicles(sim, edges, edge_id):
+    value = _subscribed(edges, edge_id, sumo_constants(sim).LAST_STEP_VEHICLE_NUMBER)
+    return sim.edge.getLastStepVehicleNumber(edge_id) if value is None else value
+
+
+def upstream_flow(sim, scenario):
+    """Upstream demand in veh/h from the vehicles the upstream detectors counted in their last interval."""
+    loops = sim.inductionloop.getAllSubscriptionResults()
+    total_vehicles = 0
+    num_detectors = 0
+    for detector_id in scenario['upstream_detectors']:
+        try:
+            total_vehicles += _interval_vehicles(sim, loops, detector_id)
+            num_detectors += 1
+        except sim.TraCIException as e:
+            # Rough estimate from the vehicles of the last step
+            try:
+                total_vehicles += sim.inductionloop.getLastStepVehicleNumber(detector_id) * scenario['detector_freq']
+                num_detectors += 1
+            except sim.TraCIException:
+                print(f"WARNING: Upstream detector {detector_id} cannot be read: {e}")
+    if num_detectors > 0:
+        return total_vehicles * 3600 / scenario['detector_freq']
+
+    # No detector: estimate from the vehicles on the upstream edge
+    try:
+        return _edge_vehicles(sim, sim.edge.getAllSubscriptionResults(), scenario['upstream_edge']) * 720
+    except sim.TraCIException as e:
+        print(f"WARNING: Upstream flow cannot be estimated ({e}); using {scenario['fallback_flow']} veh/h.")
+        return scenario['fallback_flow']
+
+
+def zone_density(sim, scenario):
+    """Vehicles per km and lane in the speed-limit zone."""
+    length_km = scenario['warning_zone_length_km'] * scenario['warning_zone_lanes']
+    vehicles = _edge_vehicles(sim, sim.edge.getAllSubscriptionResults(), scenario['warning_zone_edge'])
+    return vehicles / length_km if length_km > 0 else 0.0
+
+
+def observe(sim, scenario):
+    """(upstream flow in veh/h, zone density in veh/km)."""
+    return upstream_flow(sim, scenario), zone_density(sim, scenario)
+
+
+def throughput(sim, scenario):
+    """Reward: vehicles counted by the downstream detectors in their last interval."""
+    loops = sim.inductionloop.getAllSubscriptionResults()
+    total = 0
+    for detector_id in scenario['downstream_detectors']:
+        try:
+            total += max(_interval_vehicles(sim, loops, detector_id), 0)
+        except sim.TraCIException as e:
+            print(f"WARNING: Downstream detector {detector_id} cannot be read: {e}")
+    return total
@@ -0,0 +1,132 @@
+"""
+K SUMO simulations of a VSL scenario, stepped together in worker processes.
+
+Each worker process holds one VSLEnv (see env.py): its own TraCI connection to
+a SUMO instance that is started once and reloaded for every episode. All
+environments take a decision step at the same time:
+
+    observations = envs.reset(seeds=[1000, 1001, ...])  # (K, 2) upstream flow, zone density
+    observations, rewards, done = envs.step(speeds)     # speeds: (K,) km/h
+
+so the agent chooses the K actions and updates its Q-table in one batch per
+decision step, while the K simulations run concurrently on K cores.
+"""
+import multiprocessing
+import traceback
+
+import numpy as np
+
+from sumo_vsl.observation import DEFAULT_VSL_SCENARIO
+
+
+def _env_worker(conn, scenario):
+    """Serves reset/step/close commands for one VSLEnv."""
+    from sumo_vsl.env import VSLEnv
+
+    env = None
+    try:
+        env = VSLEnv(scenario)
+        while True:
+            command, argument = conn.recv()
+            if command == "close":
+                break
+            try:
+                if command == "reset":
+                    observation, _ = env.reset(seed=argument)
+                    conn.send(("ok", observation))
+                elif command == "step":
+                    observation, reward, terminated, truncated, _ = env.step(argument)
+                    conn.send(("ok", (observation, reward, terminated or truncated)))
+                else:
+                    conn.send(("error", f"Unknown command {command!r}"))
+            except Exception:
+                conn.send(("error", traceback.format_exc()))
+    except (EOFError, KeyboardInterrupt):
+        pass
+    except Exception:
+        conn.send(("error", traceback.format_exc()))
+    finally:
+        if env is not None:
+            env.close()
+        conn.close()
+
+
+class VectorVSLEnv:
+    """num_envs VSL simulations in worker processes; use as a context manager or call close()."""
+
+    def __init__(self, num_envs, scenario=None):
+        self.scenario = dict(DEFAULT_VSL_SCENARIO, **(scenario or {}))
+        self.num_envs = num_envs
+        self.num_active = num_envs
+        context = multiprocessing.get_context()
+        self._pipes = []
+        self._processes = []
+        for _ in range(num_envs):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_env_worker, args=(child_conn, self.scenario), daemon=True)
+            process.start()
+            child_conn.close()
+            self._pipes.append(parent_conn)
+            self._processes.append(process)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def _call(self, commands):
+        for conn, command in zip(self._pipes, commands):
+            conn.send(command)
+        results = []
+        errors = []
+        for i, conn in enumerate(self._pipes[:len(commands)]):
+            try:
+                status, value = conn.recv()
+            except EOFError:
+                status, value = "error", "the worker process exited"
+            if status == "error":
+                errors.append(f"Environment {i}: {value}")
+            results.append(value)
+        if errors:
+            raise RuntimeError("SUMO environment failed:\n" + "\n".join(errors))
+        return results
+
+    def reset(self, num_active=None, seeds=None):
+        """
+        Starts a new episode in the first num_active environments (default: all, or one per seed)
+        with the given SUMO seeds (None: SUMO's default seed) and returns their (num_active, 2)
+        observations; step() then only steps these.
+        """
+        if num_active is None:
+            num_active = self.num_envs if seeds is None else len(seeds)
+        self.num_active = num_active
+        seeds = [None] * num_active if seeds is None else [int(seed) for seed in seeds]
+        observations = self._call([("reset", seed) for seed in seeds])
+        return np.array(observations, dtype=float).reshape(self.num_active, 2)
+
+    def step(self, speed_limits):
+        """Sets the speed limits (km/h) of the active environments and simulates one decision interval each."""
+        speed_limits = np.asarray(speed_limits, dtype=float)
+        if len(speed_limits) != self.num_active:
+            raise ValueError(f"Expected {self.num_active} speed limits, got {len(speed_limits)}.")
+        results = self._call([("step", float(speed)) for speed in speed_limits])
+        observations = np.array([result[0] for result in results], dtype=float).reshape(self.num_active, 2)
+        rewards = np.array([result[1] for result in results], dtype=float)
+        done = np.array([result[2] for result in results], dtype=bool)
+        return observations, rewards, done
+
+    def close(self):
+        for conn in self._pipes:
+            try:
+                conn.send(("close", None))
+            except (OSError, BrokenPipeError):
+                pass
+        for process in self._processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        for conn in self._pipes:
+            conn.close()
+        self._pipes = []
+        self._processes = []
@@ -0,0 +1,40 @@
+import os
+import sys
+
+from sumo_vsl import MultiZoneVSLController, MultiZoneVSLEnv, vsl_scenario, vsl_zone
+
+# --- 用户需要修改的配置 ---
+# 走廊上多个施工区/瓶颈同时限速：每个限速区有自己的路段、上下游检测器、状态划分和Q表（见 sumo_vsl/multizone.py）
+SUMO_CFG = "D:/SUMO/exaple2.sumocfg"                            # <--- 修改此行
+ADDITIONAL_FILES = [r"D:\SUMO\edgelanetrafficpara.add.xml"]     # <--- 修改此行：包含所有检测器的文件
+ZONES = [                                                       # <--- 修改此列表：每个限速区一项
+    vsl_zone("warning_zone.785", length_km=0.8, lanes=3,
+             upstream_detectors=["upstream_detector_0", "upstream_detector_1", "upstream_detector_2"],
+             downstream_detectors=["downstream_edge_0", "downstream_edge_1", "downstream_edge_2"]),
+    # vsl_zone("warning_zone_2", length_km=0.5, lanes=2,
+    #          upstream_detectors=["up2_0", "up2_1"], downstream_detectors=["down2_0", "down2_1"]),
+]
+EPISODES = 3000
+BASE_SEED = 1000        # 第 i 回合使用SUMO种子 BASE_SEED + i；None 则每回合都用SUMO默认种子
+# "libsumo"：SUMO在本进程内运行，几百个限速区时没有TraCI往返开销（需要 pip install libsumo）；"traci"：通过TraCI连接
+ENGINE = "traci"
+
+
+def main():
+    if 'SUMO_HOME' not in os.environ:
+        os.environ['SUMO_HOME'] = r'D:\SUMO'
+        print(f"设置 SUMO_HOME: {os.environ['SUMO_HOME']}")
+
+    scenario = vsl_scenario(sumo_cfg=SUMO_CFG, additional_files=ADDITIONAL_FILES, detector_freq=300,
+                            decision_interval=300, end_time=3600)
+    with MultiZoneVSLEnv(ZONES, scenario, engine=ENGINE) as env:
+        controller = MultiZoneVSLController(env.zones)
+        episode_rewards = controller.train(env, EPISODES, base_seed=BASE_SEED)
+    print(f"\n训练结束：最后10回合平均总奖励 {episode_rewards[-10:].sum(axis=1).mean():.1f}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except ImportError as e:
+        sys.exit(f"Error: {e}")